@@ -0,0 +1,257 @@
+"""Static assets : fingerprinted copies, with compressed and image variants.
+
+Build step, run once before the app starts (eg. when the Docker image is built) :
+
+    python -m app.assets
+
+copies each file of `static/` to `static/build/`, with the hash of its content
+in its name, and writes next to it :
+- Brotli and gzip copies of the text files (css, js, svg),
+- AVIF and WebP variants of the images (png, jpg),
+each only if it is smaller than the file, and the manifest of the copies and
+their variants, `static/build/manifest.json`.
+
+The templates link the assets with `asset_url`. `AssetFiles` serves the
+fingerprinted copies as immutable, and picks their variant from the
+Accept-Encoding or Accept header of the request. Without a build, `asset_url`
+links the original files.
+
+Brotli requires `brotli`, the image variants `Pillow` (AVIF requires a build
+of Pillow with AVIF support) : `poetry install -E assets`.
+"""
+import argparse
+import gzip
+import io
+import json
+import logging
+import mimetypes
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, Optional, Set, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from .form_cache import file_hash
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = Path("static")
+# subdirectory of the built assets, in the static directory
+BUILD_DIRNAME = "build"
+MANIFEST = "manifest.json"
+
+# files compressed with each encoding, and images converted to each format
+COMPRESSIBLE = {".css", ".js", ".svg", ".json", ".txt"}
+IMAGES = {".png", ".jpg", ".jpeg"}
+# image formats, by order of preference, and their Pillow format
+IMAGE_FORMATS = {"image/avif": "AVIF", "image/webp": "WEBP"}
+# content encodings, by order of preference
+ENCODINGS = ("br", "gzip")
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+# manifest : for each original file (path relative to the static directory),
+# its fingerprinted copy, media type, and variants by encoding or image format
+Manifest = Dict[str, Dict]
+
+
+def compress(data: bytes, encoding: str) -> Optional[bytes]:
+    """Compress data, None if the encoding is not available."""
+    if encoding == "gzip":
+        # no timestamp, so the build is reproducible
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli.compress(data, quality=11)
+
+
+def convert_image(path: Path, pil_format: str) -> Optional[bytes]:
+    """Convert an image, None if the format is not available."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    Image.init()
+    if pil_format not in Image.SAVE:
+        return None
+    with Image.open(path) as image:
+        out = io.BytesIO()
+        image.save(out, format=pil_format, quality=90)
+        return out.getvalue()
+
+
+def build(static_dir: Path = STATIC_DIR) -> Manifest:
+    """Build the assets of a static directory, in its build subdirectory.
+
+    Returns
+    -------
+    manifest
+        Manifest of the built assets, also written in the build directory.
+    """
+    build_dir = static_dir / BUILD_DIRNAME
+    if build_dir.exists():
+        shutil.rmtree(build_dir)
+    manifest: Manifest = {}
+    for path in sorted(static_dir.rglob("*")):
+        if not path.is_file() or build_dir in path.parents:
+            continue
+        rel_path = path.relative_to(static_dir)
+        suffix = path.suffix.lower()
+        hashed = rel_path.with_name(f"{path.stem}.{file_hash(path)[:12]}{path.suffix}")
+        out_path = build_dir / hashed
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(path, out_path)
+        size = path.stat().st_size
+        entry: Dict = {
+            "path": f"{BUILD_DIRNAME}/{hashed.as_posix()}",
+            "media_type": mimetypes.guess_type(path.name)[0] or "text/plain",
+            "encodings": {},
+            "formats": {},
+        }
+        if suffix in COMPRESSIBLE:
+            data = path.read_bytes()
+            for encoding in ENCODINGS:
+                compressed = compress(data, encoding)
+                if compressed is not None and len(compressed) < size:
+                    variant = out_path.with_name(f"{out_path.name}.{encoding}")
+                    variant.write_bytes(compressed)
+                    entry["encodings"][encoding] = f"{entry['path']}.{encoding}"
+        elif suffix in IMAGES:
+            for media_type, pil_format in IMAGE_FORMATS.items():
+                converted = convert_image(path, pil_format)
+                if converted is not None and len(converted) < size:
+                    extension = pil_format.lower()
+                    variant = out_path.with_name(f"{out_path.name}.{extension}")
+                    variant.write_bytes(converted)
+                    entry["formats"][media_type] = f"{entry['path']}.{extension}"
+        manifest[rel_path.as_posix()] = entry
+    with open(build_dir / MANIFEST, "w") as f_manifest:
+        json.dump(manifest, f_manifest, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_dir: Path = STATIC_DIR) -> Manifest:
+    """Manifest of the built assets, empty if they are not built."""
+    try:
+        with open(static_dir / BUILD_DIRNAME / MANIFEST) as f_manifest:
+            return json.load(f_manifest)
+    except FileNotFoundError:
+        return {}
+
+
+def asset_url(manifest: Manifest, path: str) -> str:
+    """URL of an asset : its fingerprinted copy if it is built, else the file."""
+    entry = manifest.get(path)
+    return f"/static/{entry['path'] if entry is not None else path}"
+
+
+def accepted(header: str) -> Set[str]:
+    """Values accepted by an Accept or Accept-Encoding header, but those with q=0."""
+    values = set()
+    for item in header.split(","):
+        value, _, params = item.partition(";")
+        q = params.strip()
+        if q.startswith("q=") and q[2:].strip() in ("0", "0.0", "0.00", "0.000"):
+            continue
+        values.add(value.strip().lower())
+    return values
+
+
+class AssetFiles(StaticFiles):
+    """Static files, with the built assets served as immutable and negotiated.
+
+    Parameters
+    ----------
+    manifest
+        Manifest of the built assets.
+    """
+
+    def __init__(self, *, manifest: Manifest, **kwargs):
+        super().__init__(**kwargs)
+        # entries of the built assets, by path of their fingerprinted copy
+        self.assets = {entry["path"]: entry for entry in manifest.values()}
+
+    def pick_variant(
+        self, entry: Dict, headers: Headers
+    ) -> Tuple[str, Optional[str], Optional[str]]:
+        """Variant of an asset for a request.
+
+        Returns
+        -------
+        path, encoding, media_type
+            Path of the variant, its content encoding and media type if they
+            differ from the asset.
+        """
+        if entry["encodings"]:
+            encodings = accepted(headers.get("accept-encoding", ""))
+            for encoding in ENCODINGS:
+                if encoding in entry["encodings"] and encoding in encodings:
+                    return entry["encodings"][encoding], encoding, None
+        if entry["formats"]:
+            media_types = accepted(headers.get("accept", ""))
+            for media_type in IMAGE_FORMATS:
+                if media_type in entry["formats"] and media_type in media_types:
+                    return entry["formats"][media_type], None, media_type
+        return entry["path"], None, None
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        entry = self.assets.get(path.replace(os.sep, "/"))
+        if entry is None or scope["method"] not in ("GET", "HEAD"):
+            return await super().get_response(path, scope)
+        request_headers = Headers(scope=scope)
+        variant, encoding, media_type = self.pick_variant(entry, request_headers)
+        full_path, stat_result = await self.lookup_path(variant)
+        if stat_result is None:
+            return await super().get_response(path, scope)
+        response = FileResponse(
+            full_path,
+            stat_result=stat_result,
+            method=scope["method"],
+            media_type=media_type or entry["media_type"],
+        )
+        response.headers["cache-control"] = IMMUTABLE
+        if entry["encodings"] or entry["formats"]:
+            response.headers["vary"] = (
+                "Accept-Encoding" if entry["encodings"] else "Accept"
+            )
+        if encoding is not None:
+            response.headers["content-encoding"] = encoding
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    parser = argparse.ArgumentParser(
+        description="Build the static assets : fingerprinted, compressed, converted."
+    )
+    parser.add_argument(
+        "--static-dir", type=Path, default=STATIC_DIR, help="static directory"
+    )
+    args = parser.parse_args()
+    manifest = build(args.static_dir)
+    for rel_path, entry in manifest.items():
+        sizes = {
+            variant: (args.static_dir / variant_path).stat().st_size
+            for variant, variant_path in {
+                **entry["encodings"],
+                **entry["formats"],
+            }.items()
+        }
+        logger.info(
+            "%s -> %s %s",
+            rel_path,
+            entry["path"],
+            " ".join(f"{variant}={size}" for variant, size in sizes.items()),
+        )
+
+
+if __name__ == "__main__":
+    main()
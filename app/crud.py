@@ -1,66 +1,561 @@
-"""Interact with the database : Create, Read, Update, and Delete.
+"""Statements of the database : Create, Read, Update, and Delete.
 
 Independent from FastAPI or Pydantic.
 
+The statements are built here, with SQLAlchemy Core, and run by the app on top
+of the `databases` package, see `crud_async`, and by the command line scripts
+(`import_answers`, `rescore`) on a connection of the engine. Only the seeding
+of the profiles and questions, that the scripts need before they write answers,
+is run here, in a session.
+
 see https://fastapi.tiangolo.com/tutorial/sql-databases/#crud-utils
 """
 
+import sqlite3
+from collections import Counter, defaultdict
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from sqlalchemy import Table, and_, bindparam, func, select
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import Session
+from sqlalchemy.sql import ClauseElement, Select
+from sqlalchemy.sql.dml import Delete, Insert, Update
 
-from . import models, schemas
+from . import models
 
 
-# CRUD for users
-def get_user(db: Session, user_id: int):
-    return db.query(models.User).filter(models.User.id == user_id).first()
+# users
+# columns of the users set by `upsert_user_sql`, in the order of its parameters
+USER_COLUMNS = [
+    "email",
+    "name",
+    "selected_profile",
+    "questionnaire",
+    "questionnaire_version",
+]
 
 
-def get_user_by_email(db: Session, email: str):
-    return db.query(models.User).filter(models.User.email == email).first()
+def returning_supported(dialect_name: str) -> bool:
+    """Whether the database returns rows from INSERT ... RETURNING.
 
+    SQLite supports RETURNING since 3.35 (the library that Python is linked to).
+    """
+    return dialect_name != "sqlite" or sqlite3.sqlite_version_info >= (3, 35)
 
-def get_users(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.User).offset(skip).limit(limit).all()
 
+@lru_cache(maxsize=None)
+def upsert_user_sql(
+    dialect_name: str, update: bool = True, returning: bool = True
+) -> str:
+    """SQL that creates a user, or updates the user with the same email.
 
-def create_user(db: Session, user: schemas.UserCreate):
-    db_user = models.User(email=user.email, name=user.name)
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    return db_user
+    A single statement (INSERT ... ON CONFLICT, SQLite and PostgreSQL), so
+    concurrent submissions with the same email do not violate the unique
+    constraint on the email.
+    Its parameters are `USER_COLUMNS`. If the dialect supports it, see
+    `returning_supported`, it returns the id of the user, or no row if the user
+    already exists and `update` is False.
 
+    Parameters
+    ----------
+    dialect_name
+        Name of the dialect of the database.
+    update
+        If True, an existing user gets the new values, but the email ; otherwise
+        it is left untouched.
+    returning
+        If False, the statement returns nothing, eg. to run it with executemany.
+    """
+    if update:
+        on_conflict = "DO UPDATE SET " + ", ".join(
+            f"{col} = excluded.{col}" for col in USER_COLUMNS if col != "email"
+        )
+    else:
+        on_conflict = "DO NOTHING"
+    sql = (
+        f"INSERT INTO users ({', '.join(USER_COLUMNS)}) "
+        f"VALUES ({', '.join(f':{col}' for col in USER_COLUMNS)}) "
+        f"ON CONFLICT (email) {on_conflict}"
+    )
+    if returning and returning_supported(dialect_name):
+        sql += " RETURNING id"
+    return sql
+
+
+# columns of the results set by `UPSERT_RESULT_SQL`, in the order of its parameters
+RESULT_COLUMNS = [
+    "user_id",
+    "questionnaire",
+    "questionnaire_version",
+    "selected_profile",
+]
+
+# SQL that stores the result of the submission of a user to a questionnaire,
+# replacing their previous result to it ; its parameters are `RESULT_COLUMNS`
+UPSERT_RESULT_SQL = (
+    f"INSERT INTO results ({', '.join(RESULT_COLUMNS)}) "
+    f"VALUES ({', '.join(f':{col}' for col in RESULT_COLUMNS)}) "
+    "ON CONFLICT (user_id, questionnaire) DO UPDATE SET "
+    + ", ".join(
+        f"{col} = excluded.{col}"
+        for col in RESULT_COLUMNS
+        if col not in ("user_id", "questionnaire")
+    )
+)
+
+
+def user_ids_query(emails: Iterable[str]) -> Select:
+    """Query of the email and id of the users with these emails."""
+    users = models.User.__table__
+    return select([users.c.email, users.c.id]).where(users.c.email.in_(list(emails)))
+
+
+# answers
+# columns of the answers of a submission, in the order of the parameters of the
+# INSERT statement of the answers, when it is compiled for executemany
+ANSWER_COLUMNS = (
+    "profile_id",
+    "question_id",
+    "choice_id",
+    "weight",
+    "author_id",
+    "questionnaire",
+)
+
+
+def previous_answers(
+    author_ids: Sequence[int], questionnaire: Optional[str]
+) -> Tuple[Select, Delete]:
+    """Statements on the answers of respondents to a questionnaire.
+
+    When respondents submit the questionnaire again, their previous answers are
+    read, to update the aggregates (see `stats_updates`), then deleted.
+
+    Returns
+    -------
+    query, delete
+        Query of the author, profile, weight and choice of the answers, and
+        statement that deletes them.
+    """
+    answers = models.Answer.__table__
+    where = answers.c.author_id.in_(list(author_ids)) & (
+        answers.c.questionnaire == questionnaire
+    )
+    query = select(
+        [
+            answers.c.author_id,
+            answers.c.profile_id,
+            answers.c.weight,
+            answers.c.choice_id,
+        ]
+    ).where(where)
+    return query, answers.delete().where(where)
 
-def set_user_profile(db: Session, user_id: int, profile: str):
-    """Set the selected profile for a user"""
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
-    db_user.selected_profile = profile
-    db.commit()
-    db.refresh(db_user)
-    return db_user
 
+# profiles
+def profiles_to_insert(
+    questionnaire: Optional[str],
+    profiles: Sequence[Dict[str, str]],
+    existing_ids: Iterable[str],
+) -> List[Dict[str, Optional[str]]]:
+    """Rows of the profiles of a questionnaire whose id is not in `existing_ids`."""
+    existing_ids = set(existing_ids)
+    return [
+        dict(profile, questionnaire=questionnaire)
+        for profile in profiles
+        if profile["id"] not in existing_ids
+    ]
 
-# CRUD for answers
-def get_answers(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Answer).offset(skip).limit(limit).all()
 
+def seed_profiles(
+    db: Session, questionnaire: Optional[str], profiles: List[Dict[str, str]]
+) -> int:
+    """Create the profiles that are not yet in the database, in a single transaction.
 
-def create_user_answer(db: Session, answer: schemas.AnswerCreate, user_id: int):
-    db_answer = models.Answer(**answer.dict(), author_id=user_id)
-    db.add(db_answer)
+    Existing profiles, eg. shared with another questionnaire, are left untouched,
+    so this function is idempotent.
+
+    Parameters
+    ----------
+    db
+        Database session.
+    questionnaire
+        Slug of the questionnaire.
+    profiles
+        Profiles as dicts of column values for `models.Profile`, including `id`.
+
+    Returns
+    -------
+    nb_created
+        Number of profiles created.
+    """
+    table = models.Profile.__table__
+    new_profiles = profiles_to_insert(
+        questionnaire, profiles, (p_id for (p_id,) in db.execute(select([table.c.id])))
+    )
+    if new_profiles:
+        db.execute(table.insert(), new_profiles)
     db.commit()
-    db.refresh(db_answer)
-    return db_answer
+    return len(new_profiles)
+
+
+# CRUD for questions and their choices
+def insert_ignore(table: Table, dialect_name: str) -> Insert:
+    """INSERT statement that skips the rows that violate a unique constraint.
+
+    Concurrent processes can then seed the same rows.
+    """
+    if dialect_name == "postgresql":
+        return postgresql.insert(table).on_conflict_do_nothing()
+    if dialect_name == "sqlite":
+        return table.insert().prefix_with("OR IGNORE")
+    return table.insert()
+
+
+def questions_to_insert(
+    questionnaire: Optional[str],
+    questions: Sequence[Tuple[str, str, Sequence[Tuple[int, str]]]],
+    q_key2id: Dict[Tuple[str, str], int],
+) -> List[Dict]:
+    """Rows of the questions that are not in `q_key2id` (by profile id and label)."""
+    return [
+        {"questionnaire": questionnaire, "profile_id": p_id, "label": label}
+        for p_id, label in dict.fromkeys((p_id, label) for p_id, label, _ in questions)
+        if (p_id, label) not in q_key2id
+    ]
+
+
+def choices_to_insert(
+    questions: Sequence[Tuple[str, str, Sequence[Tuple[int, str]]]],
+    question_ids: List[int],
+    c_key2id: Dict[Tuple[int, int, str], int],
+) -> List[Dict]:
+    """Rows of the choices that are not in `c_key2id` (by question id, weight, text)."""
+    return [
+        {"question_id": q_id, "weight": w, "description": description}
+        for q_id, w, description in dict.fromkeys(
+            (q_id, w, description)
+            for q_id, (_, _, choices) in zip(question_ids, questions)
+            for w, description in choices
+        )
+        if (q_id, w, description) not in c_key2id
+    ]
+
+
+def choice_ids_by_weight(
+    questions: Sequence[Tuple[str, str, Sequence[Tuple[int, str]]]],
+    question_ids: List[int],
+    c_key2id: Dict[Tuple[int, int, str], int],
+) -> List[Dict[int, int]]:
+    """Ids of the choices of each question, by weight."""
+    return [
+        {w: c_key2id[(q_id, w, description)] for w, description in choices}
+        for q_id, (_, _, choices) in zip(question_ids, questions)
+    ]
+
+
+def question_ids_query(questionnaire: Optional[str]) -> Select:
+    """Query of the id, profile id and label of the questions of a questionnaire."""
+    questions = models.Question.__table__
+    return select([questions.c.id, questions.c.profile_id, questions.c.label]).where(
+        questions.c.questionnaire == questionnaire
+    )
+
+
+def question_keys(rows: Iterable[Mapping]) -> Dict[Tuple[str, str], int]:
+    """Ids of the questions, by profile id and label, from `question_ids_query`."""
+    return {(row["profile_id"], row["label"]): row["id"] for row in rows}
 
 
-# CRUD for profiles
-def get_profiles(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Profile).offset(skip).limit(limit).all()
+def choice_ids_query(question_ids: Iterable[int]) -> Select:
+    """Query of the id, question id, weight and text of the choices of questions."""
+    choices = models.Choice.__table__
+    return select(
+        [choices.c.id, choices.c.question_id, choices.c.weight, choices.c.description]
+    ).where(choices.c.question_id.in_(set(question_ids)))
 
 
-def create_profile(db: Session, profile: schemas.ProfileCreate):
-    db_profile = models.Profile(**profile.dict())
-    db.add(db_profile)
+def choice_keys(rows: Iterable[Mapping]) -> Dict[Tuple[int, int, str], int]:
+    """Ids of the choices, by question id, weight and text, from `choice_ids_query`."""
+    return {
+        (row["question_id"], row["weight"], row["description"]): row["id"]
+        for row in rows
+    }
+
+
+def seed_questions(
+    db: Session,
+    questionnaire: Optional[str],
+    questions: Sequence[Tuple[str, str, Sequence[Tuple[int, str]]]],
+) -> Tuple[List[int], List[Dict[int, int]]]:
+    """Create the questions and choices that are not yet in the database.
+
+    Existing questions and choices are left untouched, so this function is
+    idempotent.
+
+    Parameters
+    ----------
+    db
+        Database session.
+    questionnaire
+        Slug of the questionnaire.
+    questions
+        Questions as (profile id, label, weighted answers), see
+        `ScoringModel.question_rows`.
+
+    Returns
+    -------
+    question_ids, choice_ids
+        Id of each question, and ids of its choices by weight.
+    """
+    dialect_name = db.get_bind().dialect.name
+    q_key2id = question_keys(db.execute(question_ids_query(questionnaire)))
+    new_questions = questions_to_insert(questionnaire, questions, q_key2id)
+    if new_questions:
+        db.execute(
+            insert_ignore(models.Question.__table__, dialect_name), new_questions
+        )
+        q_key2id = question_keys(db.execute(question_ids_query(questionnaire)))
+    question_ids = [q_key2id[(p_id, label)] for p_id, label, _ in questions]
+    c_key2id = choice_keys(db.execute(choice_ids_query(question_ids)))
+    new_choices = choices_to_insert(questions, question_ids, c_key2id)
+    if new_choices:
+        db.execute(insert_ignore(models.Choice.__table__, dialect_name), new_choices)
+        c_key2id = choice_keys(db.execute(choice_ids_query(question_ids)))
     db.commit()
-    db.refresh(db_profile)
-    return db_profile
\ No newline at end of file
+    return question_ids, choice_ids_by_weight(questions, question_ids, c_key2id)
+
+
+# aggregates of the submissions
+def profile_scores(answers: Iterable[Mapping[str, Any]]) -> Dict[str, int]:
+    """Score of each profile : sum of the weights of the answers to its questions."""
+    scores: Dict[str, int] = defaultdict(int)
+    for answer in answers:
+        scores[answer["profile_id"]] += answer["weight"]
+    return scores
+
+
+def stats_deltas(
+    questionnaire: str,
+    answers: Sequence[Mapping[str, Any]],
+    previous_answers: Sequence[Mapping[str, Any]] = (),
+) -> List[Tuple[Table, List[str], Dict[Tuple, int]]]:
+    """Changes of the aggregates when a respondent replaces their answers.
+
+    Parameters
+    ----------
+    questionnaire
+        Slug of the questionnaire.
+    answers
+        New answers, with keys `profile_id`, `weight` and `choice_id`.
+    previous_answers
+        Answers replaced by the new ones, if any.
+
+    Returns
+    -------
+    deltas
+        For each aggregate table : the names of its key columns, and the change
+        of the number of respondents for each key.
+    """
+    main_profiles: Dict[Tuple, int] = Counter()
+    scores: Dict[Tuple, int] = Counter()
+    chosen: Dict[Tuple, int] = Counter()
+    for sign, submission in ((1, answers), (-1, previous_answers)):
+        if not submission:
+            continue
+        p_scores = profile_scores(submission)
+        max_score = max(p_scores.values())
+        for p_id, score in p_scores.items():
+            scores[(questionnaire, p_id, score)] += sign
+            # ties count for each main profile, as in `selected_profile`
+            if score == max_score:
+                main_profiles[(questionnaire, p_id)] += sign
+        for answer in submission:
+            if answer["choice_id"] is not None:
+                chosen[(answer["choice_id"],)] += sign
+    return [
+        (models.StatsProfile.__table__, ["questionnaire", "profile_id"], main_profiles),
+        (models.StatsScore.__table__, ["questionnaire", "profile_id", "score"], scores),
+        (models.StatsChoice.__table__, ["choice_id"], chosen),
+    ]
+
+
+@lru_cache(maxsize=None)
+def counter_statements(table: Table, dialect_name: str) -> Tuple[Insert, Update]:
+    """Statements that add a delta to the number `nb` of a row of an aggregate table.
+
+    The INSERT statement creates the missing rows with 0, its parameters are the
+    key columns and `nb`. The UPDATE statement adds the delta, its parameters
+    are the key columns prefixed with `key_`, and `delta`.
+    Both are built once, and run with executemany.
+    """
+    update = (
+        table.update()
+        .where(
+            and_(
+                *(
+                    column == bindparam(f"key_{column.name}")
+                    for column in table.primary_key.columns
+                )
+            )
+        )
+        .values(nb=table.c.nb + bindparam("delta"))
+    )
+    return insert_ignore(table, dialect_name), update
+
+
+def counter_params(
+    key_names: List[str], deltas: Dict[Tuple, int]
+) -> Tuple[List[Dict], List[Dict]]:
+    """Parameters of the statements of `counter_statements`, for the non-zero deltas."""
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    insert_params = [dict(zip(key_names, key), nb=0) for key in deltas]
+    update_params = [
+        dict(zip((f"key_{name}" for name in key_names), key), delta=delta)
+        for key, delta in deltas.items()
+    ]
+    return insert_params, update_params
+
+
+def stats_updates(
+    questionnaire: Optional[str],
+    answers: Sequence[Mapping[str, Any]],
+    previous_answers: Sequence[Mapping[str, Any]],
+    dialect_name: str,
+) -> List[Tuple[ClauseElement, List[Dict]]]:
+    """Statements that update the aggregates when a respondent replaces their answers.
+
+    They are run in the transaction of the submission, with executemany. Answers
+    without a questionnaire are not aggregated.
+
+    Returns
+    -------
+    updates
+        Statements, and the parameters of each of their executions.
+    """
+    return batch_stats_updates(
+        questionnaire, [(answers, previous_answers)], dialect_name
+    )
+
+
+def batch_stats_updates(
+    questionnaire: Optional[str],
+    submissions: Iterable[
+        Tuple[Sequence[Mapping[str, Any]], Sequence[Mapping[str, Any]]]
+    ],
+    dialect_name: str,
+) -> List[Tuple[ClauseElement, List[Dict]]]:
+    """Statements that update the aggregates when respondents replace their answers.
+
+    The changes of all the submissions, as (answers, previous answers), are
+    summed, so each row of the aggregates is updated once. See `stats_updates`.
+    """
+    if questionnaire is None:
+        return []
+    total: Optional[List[Tuple[Table, List[str], Dict[Tuple, int]]]] = None
+    for answers, previous_answers in submissions:
+        deltas = stats_deltas(questionnaire, answers, previous_answers)
+        if total is None:
+            total = deltas
+            continue
+        for (_, _, total_deltas), (_, _, submission_deltas) in zip(total, deltas):
+            for key, delta in submission_deltas.items():
+                total_deltas[key] = total_deltas.get(key, 0) + delta
+    updates: List[Tuple[ClauseElement, List[Dict]]] = []
+    for table, key_names, deltas in total or []:
+        insert_params, update_params = counter_params(key_names, deltas)
+        if insert_params:
+            insert, update = counter_statements(table, dialect_name)
+            updates += [(insert, insert_params), (update, update_params)]
+    return updates
+
+
+def stats_queries(questionnaire: str) -> Tuple[Select, Select, Select]:
+    """Queries of the aggregates of a questionnaire.
+
+    Returns
+    -------
+    main_profiles, scores, weights
+        Number of respondents by main profile, by profile and score, and by
+        question and weight of the chosen answer.
+    """
+    stats_profiles = models.StatsProfile.__table__
+    stats_scores = models.StatsScore.__table__
+    stats_choices = models.StatsChoice.__table__
+    questions = models.Question.__table__
+    choices = models.Choice.__table__
+    main_profiles = select([stats_profiles.c.profile_id, stats_profiles.c.nb]).where(
+        stats_profiles.c.questionnaire == questionnaire
+    )
+    scores = (
+        select([stats_scores.c.profile_id, stats_scores.c.score, stats_scores.c.nb])
+        .where(
+            (stats_scores.c.questionnaire == questionnaire) & (stats_scores.c.nb != 0)
+        )
+        .order_by(stats_scores.c.profile_id, stats_scores.c.score)
+    )
+    weights = (
+        select(
+            [
+                questions.c.id,
+                questions.c.profile_id,
+                questions.c.label,
+                choices.c.weight,
+                func.sum(stats_choices.c.nb).label("nb"),
+            ]
+        )
+        .select_from(
+            questions.join(choices, choices.c.question_id == questions.c.id).join(
+                stats_choices, stats_choices.c.choice_id == choices.c.id
+            )
+        )
+        .where(questions.c.questionnaire == questionnaire)
+        .group_by(
+            questions.c.id, questions.c.profile_id, questions.c.label, choices.c.weight
+        )
+        .order_by(questions.c.id, choices.c.weight)
+    )
+    return main_profiles, scores, weights
+
+
+def build_stats(
+    questionnaire: str,
+    main_profile_rows: Iterable[Mapping],
+    score_rows: Iterable[Mapping],
+    weight_rows: Iterable[Mapping],
+) -> Dict[str, Any]:
+    """Statistics of a questionnaire, from the rows of the queries of `stats_queries`."""
+    profiles: Dict[str, Dict[str, Any]] = {}
+
+    def get_profile(p_id: str) -> Dict[str, Any]:
+        if p_id not in profiles:
+            profiles[p_id] = {"profile_id": p_id, "main": 0, "scores": {}}
+        return profiles[p_id]
+
+    for row in main_profile_rows:
+        get_profile(row["profile_id"])["main"] = row["nb"]
+    for row in score_rows:
+        get_profile(row["profile_id"])["scores"][row["score"]] = row["nb"]
+    questions: Dict[int, Dict[str, Any]] = {}
+    for row in weight_rows:
+        if row["id"] not in questions:
+            questions[row["id"]] = {
+                "question_id": row["id"],
+                "profile_id": row["profile_id"],
+                "question": row["label"],
+                "weights": {},
+            }
+        questions[row["id"]]["weights"][row["weight"]] = row["nb"]
+    # each respondent has a score for each profile
+    respondents = max(
+        (sum(profile["scores"].values()) for profile in profiles.values()), default=0
+    )
+    return {
+        "questionnaire": questionnaire,
+        "respondents": respondents,
+        "profiles": sorted(
+            profiles.values(), key=lambda profile: profile["profile_id"]
+        ),
+        "questions": list(questions.values()),
+    }
@@ -0,0 +1,521 @@
+"""Interact with the database asynchronously : Create, Read, Update, and Delete.
+
+The data layer of the app : the statements of `crud`, run on top of the
+`databases` package, so the routes of the app do not block the event loop while
+they wait for the database.
+Rows are returned as dicts.
+
+see https://fastapi.tiangolo.com/advanced/async-sql-databases/
+"""
+
+import asyncio
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+from weakref import WeakKeyDictionary
+
+from databases import Database
+from sqlalchemy import select
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.sql import ClauseElement
+
+from . import metrics, models, schemas
+from .crud import (
+    ANSWER_COLUMNS,
+    UPSERT_RESULT_SQL,
+    USER_COLUMNS,
+    build_stats,
+    choice_ids_by_weight,
+    choice_ids_query,
+    choice_keys,
+    choices_to_insert,
+    insert_ignore,
+    previous_answers,
+    profiles_to_insert,
+    question_ids_query,
+    question_keys,
+    questions_to_insert,
+    returning_supported,
+    stats_queries,
+    stats_updates,
+    upsert_user_sql,
+    user_ids_query,
+)
+
+users = models.User.__table__
+answers = models.Answer.__table__
+profiles = models.Profile.__table__
+questions = models.Question.__table__
+choices = models.Choice.__table__
+
+# answers, with the texts of their question and choice
+answers_with_text = select(
+    [
+        answers.c.id,
+        answers.c.profile_id,
+        questions.c.label.label("question"),
+        choices.c.description,
+        answers.c.weight,
+        answers.c.author_id,
+        answers.c.questionnaire,
+        answers.c.question_id,
+        answers.c.choice_id,
+    ]
+).select_from(
+    answers.outerjoin(questions, answers.c.question_id == questions.c.id).outerjoin(
+        choices, answers.c.choice_id == choices.c.id
+    )
+)
+
+# locks for write transactions on SQLite, by event loop
+_write_locks: "WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = (
+    WeakKeyDictionary()
+)
+
+
+@asynccontextmanager
+async def write_transaction(database: Database) -> AsyncIterator[None]:
+    """Transaction for writing to the database.
+
+    SQLite has a single writer : the write transactions of this process wait for
+    each other on a lock, rather than poll the lock of the database file.
+    The transaction takes the lock of the database file up front (BEGIN
+    IMMEDIATE), waiting for the other processes up to the busy timeout : a
+    deferred transaction that reads first fails at once with "database is
+    locked" when it upgrades to a write after another process committed.
+    """
+    if database.url.dialect != "sqlite":
+        async with database.transaction():
+            yield
+        return
+    loop = asyncio.get_event_loop()
+    lock = _write_locks.get(loop)
+    if lock is None:
+        lock = _write_locks[loop] = asyncio.Lock()
+    async with lock:
+        # `databases` only starts deferred transactions (BEGIN)
+        async with database.connection() as connection:
+            await connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+                await connection.execute("COMMIT")
+            except BaseException:
+                await connection.execute("ROLLBACK")
+                raise
+
+
+async def _add_answers(database: Database, db_users: List[Dict]) -> List[Dict]:
+    """Add the answers of each user, loaded in one query."""
+    if not db_users:
+        return db_users
+    user_answers: Dict[int, List[Dict]] = defaultdict(list)
+    rows = await database.fetch_all(
+        answers_with_text.where(
+            answers.c.author_id.in_([db_user["id"] for db_user in db_users])
+        ).order_by(answers.c.id)
+    )
+    for row in rows:
+        user_answers[row["author_id"]].append(dict(row))
+    for db_user in db_users:
+        db_user["answers"] = user_answers[db_user["id"]]
+    return db_users
+
+
+# CRUD for users
+async def get_user(database: Database, user_id: int) -> Optional[Dict]:
+    row = await database.fetch_one(users.select().where(users.c.id == user_id))
+    if row is None:
+        return None
+    return (await _add_answers(database, [dict(row)]))[0]
+
+
+async def get_user_by_email(database: Database, email: str) -> Optional[Dict]:
+    row = await database.fetch_one(users.select().where(users.c.email == email))
+    if row is None:
+        return None
+    return (await _add_answers(database, [dict(row)]))[0]
+
+
+async def get_users(
+    database: Database,
+    after: Optional[int] = None,
+    limit: int = 100,
+    with_answers: bool = True,
+) -> List[Dict]:
+    """Get a page of users, ordered by id.
+
+    Parameters
+    ----------
+    database
+        Database.
+    after
+        Id of the last user of the previous page (keyset pagination).
+    limit
+        Maximal number of users.
+    with_answers
+        If True, load the answers of the users in one query.
+    """
+    query = users.select()
+    if after is not None:
+        query = query.where(users.c.id > after)
+    rows = await database.fetch_all(query.order_by(users.c.id).limit(limit))
+    db_users = [dict(row) for row in rows]
+    if with_answers:
+        db_users = await _add_answers(database, db_users)
+    return db_users
+
+
+async def upsert_user(
+    database: Database, values: Dict[str, Any], update: bool = True
+) -> Optional[int]:
+    """Create a user, or update the user with the same email, in one statement.
+
+    See `crud.upsert_user_sql`. Not committed.
+
+    Returns
+    -------
+    user_id
+        Id of the user, None if the user already exists and `update` is False.
+    """
+    dialect_name = database.url.dialect
+    params = {col: values.get(col) for col in USER_COLUMNS}
+    sql = upsert_user_sql(dialect_name, update)
+    if returning_supported(dialect_name):
+        return await database.fetch_val(sql, params)
+    # older SQLite, on the same connection
+    async with database.connection():
+        await database.execute(sql, params)
+        if not update and await database.fetch_val("SELECT changes()") == 0:
+            return None
+        return await database.fetch_val(user_ids_query([params["email"]]), column="id")
+
+
+async def create_user(database: Database, user: schemas.UserCreate) -> Optional[Dict]:
+    """Create a user, None if a user with this email already exists."""
+    async with write_transaction(database):
+        user_id = await upsert_user(
+            database, {"email": user.email, "name": user.name}, update=False
+        )
+    return None if user_id is None else await get_user(database, user_id)
+
+
+async def set_user_profile(database: Database, user_id: int, profile: str) -> Dict:
+    """Set the selected profile for a user"""
+    await database.execute(
+        users.update().where(users.c.id == user_id).values(selected_profile=profile)
+    )
+    return await get_user(database, user_id)
+
+
+# CRUD for answers
+async def get_answers(
+    database: Database, after: Optional[int] = None, limit: int = 100
+) -> List[Dict]:
+    """Get a page of answers, ordered by id.
+
+    Parameters
+    ----------
+    database
+        Database.
+    after
+        Id of the last answer of the previous page (keyset pagination).
+    limit
+        Maximal number of answers.
+    """
+    query = answers_with_text
+    if after is not None:
+        query = query.where(answers.c.id > after)
+    rows = await database.fetch_all(query.order_by(answers.c.id).limit(limit))
+    return [dict(row) for row in rows]
+
+
+async def create_user_answer(
+    database: Database, answer: schemas.AnswerCreate, user_id: int
+) -> Dict:
+    # get or create the question and the choice
+    (question_id,), (choice_ids,) = await seed_questions(
+        database,
+        answer.questionnaire,
+        [(answer.profile_id, answer.question, [(answer.weight, answer.description)])],
+    )
+    values = dict(
+        profile_id=answer.profile_id,
+        question_id=question_id,
+        choice_id=choice_ids[answer.weight],
+        weight=answer.weight,
+        questionnaire=answer.questionnaire,
+        author_id=user_id,
+    )
+    answer_id = await database.execute(answers.insert().values(**values))
+    return dict(
+        values, id=answer_id, question=answer.question, description=answer.description
+    )
+
+
+# INSERT statement of the answers, compiled once for SQLite
+_INSERT_ANSWERS = answers.insert()
+
+
+async def _insert_answers(database: Database, answers_values: List[Dict]) -> None:
+    """Insert answers, in the current transaction."""
+    if not answers_values:
+        return
+    if database.url.dialect == "sqlite":
+        # executemany on a single prepared statement, as `databases` compiles
+        # a query for each row
+        await _execute_many(database, _INSERT_ANSWERS, answers_values, ANSWER_COLUMNS)
+    else:
+        # a single INSERT statement with multiple VALUES
+        await database.execute(answers.insert().values(answers_values))
+
+
+@lru_cache(maxsize=None)
+def _compile_sqlite(
+    statement: ClauseElement, column_keys: Optional[Tuple[str, ...]] = None
+) -> Tuple[str, List[str]]:
+    """SQL of a statement for SQLite, and the names of its positional parameters.
+
+    The columns of an INSERT statement without values are `column_keys`.
+    """
+    compiled = statement.compile(dialect=sqlite.dialect(), column_keys=column_keys)
+    return str(compiled), compiled.positiontup
+
+
+async def _execute_many(
+    database: Database,
+    statement: ClauseElement,
+    params: List[Dict],
+    column_keys: Optional[Tuple[str, ...]] = None,
+) -> None:
+    """Execute a statement with each set of parameters, in the current transaction."""
+    if database.url.dialect == "sqlite":
+        # executemany on a single prepared statement, compiled once
+        sql, names = _compile_sqlite(statement, column_keys)
+        async with database.connection() as connection:
+            with metrics.timed_query(sql):
+                await connection.raw_connection.executemany(
+                    sql, [[values[name] for name in names] for values in params]
+                )
+    else:
+        await database.execute_many(statement, params)
+
+
+# submissions
+async def _save_submission(
+    database: Database,
+    email: str,
+    name: str,
+    answers_values: List[Dict[str, Any]],
+    selected_profile: str,
+    questionnaire: Optional[str] = None,
+    questionnaire_version: Optional[str] = None,
+) -> int:
+    """Store a complete submission of the form, in the current write transaction."""
+    with metrics.span("save_submission.user"):
+        # write before reading : the transaction takes the write lock with its
+        # first statement, so concurrent submissions wait for each other
+        # instead of failing to upgrade a read lock (SQLite)
+        user_id = await upsert_user(
+            database,
+            {
+                "email": email,
+                "name": name,
+                "selected_profile": selected_profile,
+                "questionnaire": questionnaire,
+                "questionnaire_version": questionnaire_version,
+            },
+        )
+        if questionnaire is not None:
+            await database.execute(
+                UPSERT_RESULT_SQL,
+                {
+                    "user_id": user_id,
+                    "questionnaire": questionnaire,
+                    "questionnaire_version": questionnaire_version,
+                    "selected_profile": selected_profile,
+                },
+            )
+    with metrics.span("save_submission.answers"):
+        # delete previous answers to the questionnaire, if any
+        query, delete = previous_answers([user_id], questionnaire)
+        replaced = await database.fetch_all(query)
+        await database.execute(delete)
+        await _insert_answers(
+            database,
+            [
+                dict(answer, author_id=user_id, questionnaire=questionnaire)
+                for answer in answers_values
+            ],
+        )
+    with metrics.span("save_submission.stats"):
+        for statement, params in stats_updates(
+            questionnaire, answers_values, replaced, database.url.dialect
+        ):
+            await _execute_many(database, statement, params)
+    return user_id
+
+
+async def save_submission(
+    database: Database,
+    email: str,
+    name: str,
+    answers_values: List[Dict[str, Any]],
+    selected_profile: str,
+    questionnaire: Optional[str] = None,
+    questionnaire_version: Optional[str] = None,
+) -> int:
+    """Store a complete submission of the form in a single transaction.
+
+    The user is created, or updated if a user with this email already exists
+    (in one statement, see `crud.upsert_user_sql`), their previous answers to
+    the questionnaire are replaced by the new ones (bulk insert) and their
+    selected profile is set, as their result to the questionnaire (see
+    `crud.UPSERT_RESULT_SQL`) and as the result of their latest submission.
+    The aggregates of the questionnaire are updated, see `crud.stats_updates`.
+    Everything is committed at once.
+
+    Parameters
+    ----------
+    database
+        Database.
+    email
+        Email of the user, used to identify returning users.
+    name
+        Name of the user.
+    answers_values
+        Answers as dicts of column values for `models.Answer`, without
+        `author_id` and `questionnaire` : see `ScoringModel.prep_answers`.
+    selected_profile
+        Name(s) of the main profile(s) of the user.
+    questionnaire
+        Slug of the questionnaire.
+    questionnaire_version
+        Version of the questionnaire the answers were scored against.
+
+    Returns
+    -------
+    user_id
+        Id of the user.
+    """
+    async with write_transaction(database):
+        return await _save_submission(
+            database,
+            email,
+            name,
+            answers_values,
+            selected_profile,
+            questionnaire=questionnaire,
+            questionnaire_version=questionnaire_version,
+        )
+
+
+async def save_submissions(
+    database: Database, submissions: List[Dict[str, Any]]
+) -> List[int]:
+    """Store several submissions of the form, in order, in a single transaction.
+
+    Parameters
+    ----------
+    database
+        Database.
+    submissions
+        Keyword arguments of `save_submission` for each submission, but the database.
+
+    Returns
+    -------
+    user_ids
+        Id of the user of each submission.
+    """
+    async with write_transaction(database):
+        return [
+            await _save_submission(database, **submission) for submission in submissions
+        ]
+
+
+# aggregates of the submissions
+async def get_stats(database: Database, questionnaire: str) -> Dict[str, Any]:
+    """Statistics of a questionnaire, read from the aggregates.
+
+    The cost depends on the number of profiles and questions, not on the number
+    of respondents.
+    """
+    return build_stats(
+        questionnaire,
+        *[await database.fetch_all(query) for query in stats_queries(questionnaire)],
+    )
+
+
+# CRUD for profiles
+async def get_profiles(
+    database: Database, skip: int = 0, limit: int = 100
+) -> List[Dict]:
+    rows = await database.fetch_all(
+        profiles.select().order_by(profiles.c.id).offset(skip).limit(limit)
+    )
+    return [dict(row) for row in rows]
+
+
+async def create_profile(database: Database, profile: schemas.ProfileCreate) -> Dict:
+    values = profile.dict()
+    await database.execute(profiles.insert().values(**values))
+    return values
+
+
+async def seed_profiles(
+    database: Database,
+    questionnaire: Optional[str],
+    profiles_values: List[Dict[str, str]],
+) -> int:
+    """Create the profiles that are not yet in the database, in a single transaction.
+
+    See `crud.seed_profiles`.
+    """
+    async with write_transaction(database):
+        rows = await database.fetch_all(select([profiles.c.id]))
+        new_profiles = profiles_to_insert(
+            questionnaire, profiles_values, (row["id"] for row in rows)
+        )
+        if new_profiles:
+            await database.execute(profiles.insert().values(new_profiles))
+    return len(new_profiles)
+
+
+# CRUD for questions and their choices
+async def seed_questions(
+    database: Database,
+    questionnaire: Optional[str],
+    questions_values: Sequence[Tuple[str, str, Sequence[Tuple[int, str]]]],
+) -> Tuple[List[int], List[Dict[int, int]]]:
+    """Create the questions and choices that are not yet in the database.
+
+    See `crud.seed_questions`.
+    """
+
+    async def get_question_ids() -> Dict[Tuple[str, str], int]:
+        return question_keys(
+            await database.fetch_all(question_ids_query(questionnaire))
+        )
+
+    async def get_choice_ids(
+        question_ids: List[int],
+    ) -> Dict[Tuple[int, int, str], int]:
+        return choice_keys(await database.fetch_all(choice_ids_query(question_ids)))
+
+    async with write_transaction(database):
+        q_key2id = await get_question_ids()
+        new_questions = questions_to_insert(questionnaire, questions_values, q_key2id)
+        if new_questions:
+            await database.execute(
+                insert_ignore(questions, database.url.dialect).values(new_questions)
+            )
+            q_key2id = await get_question_ids()
+        question_ids = [q_key2id[(p_id, label)] for p_id, label, _ in questions_values]
+        c_key2id = await get_choice_ids(question_ids)
+        new_choices = choices_to_insert(questions_values, question_ids, c_key2id)
+        if new_choices:
+            await database.execute(
+                insert_ignore(choices, database.url.dialect).values(new_choices)
+            )
+            c_key2id = await get_choice_ids(question_ids)
+    return question_ids, choice_ids_by_weight(questions_values, question_ids, c_key2id)
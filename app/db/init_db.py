@@ -0,0 +1,21 @@
+"""Initial data in the database.
+
+Run once before starting the app, after the migrations : see `prestart.sh`.
+"""
+import json
+from pathlib import Path
+
+from sqlalchemy.orm import Session
+
+from .. import crud
+from ..config import DEFAULT_QUESTIONNAIRE, JSON_PROFILES
+
+
+def init_db(db: Session) -> None:
+    """Create the profiles that are missing from the database.
+
+    This function is idempotent.
+    """
+    with open(Path(JSON_PROFILES)) as f_profiles:
+        profiles = json.load(f_profiles)
+    crud.seed_profiles(db, DEFAULT_QUESTIONNAIRE, profiles)
@@ -3,16 +3,144 @@
 References :
 https://fastapi.tiangolo.com/tutorial/sql-databases/
 https://alexvanzyl.com/posts/2020-05-24-fastapi-simple-application-structure-from-scratch-part-2/#edit-sessionpy-file
+https://docs.sqlalchemy.org/en/13/dialects/sqlite.html#foreign-key-support
 """
 
-import os
+import sqlite3
+from contextlib import contextmanager
+from typing import Any, Iterator, List, Optional
 
-from sqlalchemy import create_engine
+from databases import Database
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Connection
+from sqlalchemy.engine.url import make_url
 from sqlalchemy.orm import sessionmaker
 
-SQLALCHEMY_DATABASE_URL = f"sqlite:///./dataposition.db"
+from .. import metrics
+from ..config import Settings, settings
+
+SQLALCHEMY_DATABASE_URL = settings.database_url
+
+
+def sqlite_pragmas(settings: Settings, journal_mode: bool = True) -> List[str]:
+    """Pragmas to run on each new SQLite connection.
+
+    Parameters
+    ----------
+    settings
+        Settings of the app.
+    journal_mode
+        If False, leave out the journal mode, eg. when it is stored in the
+        database file (WAL).
+    """
+    pragmas = [
+        f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}",
+        f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT}",
+        f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}",
+    ]
+    if journal_mode:
+        pragmas.insert(0, f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+    return pragmas
+
+
+class SQLiteConnection(sqlite3.Connection):
+    """SQLite connection with the pragmas from the settings.
+
+    `databases` opens its SQLite connections itself, this class is passed
+    as their factory. It opens a new connection for each use : the WAL
+    journal mode, stored in the database file, is only set by the first
+    connection of the process ; the other pragmas only configure the
+    connection, without I/O.
+    """
+
+    # the WAL journal mode is set in the database file
+    wal_set = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for pragma in sqlite_pragmas(
+            settings, journal_mode=not SQLiteConnection.wal_set
+        ):
+            self.execute(pragma)
+        if settings.SQLITE_JOURNAL_MODE.upper() == "WAL":
+            SQLiteConnection.wal_set = True
+
+
+class InstrumentedDatabase(Database):
+    """Database that records the duration of its queries, see `metrics.timed_query`.
+
+    The duration includes the wait for a connection.
+    """
+
+    async def fetch_all(self, query, values: Optional[dict] = None):
+        with metrics.timed_query(query):
+            return await super().fetch_all(query, values)
+
+    async def fetch_one(self, query, values: Optional[dict] = None):
+        with metrics.timed_query(query):
+            return await super().fetch_one(query, values)
+
+    async def fetch_val(self, query, values: Optional[dict] = None, column: Any = 0):
+        with metrics.timed_query(query):
+            return await super().fetch_val(query, values, column=column)
+
+    async def execute(self, query, values: Optional[dict] = None):
+        with metrics.timed_query(query):
+            return await super().execute(query, values)
+
+    async def execute_many(self, query, values: list):
+        with metrics.timed_query(query):
+            return await super().execute_many(query, values)
+
+
+if make_url(SQLALCHEMY_DATABASE_URL).get_backend_name() == "sqlite":
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    )
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in sqlite_pragmas(settings):
+            cursor.execute(pragma)
+        cursor.close()
+
+    # asynchronous access, for the app
+    database = InstrumentedDatabase(SQLALCHEMY_DATABASE_URL, factory=SQLiteConnection)
+else:
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+    # asynchronous access, for the app
+    database = InstrumentedDatabase(
+        SQLALCHEMY_DATABASE_URL,
+        min_size=1,
+        max_size=settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW,
+    )
+
+metrics.instrument_engine(engine)
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@contextmanager
+def write_transaction() -> Iterator[Connection]:
+    """Connection of the engine, in a transaction for writing to the database.
+
+    On SQLite, the transaction takes the lock of the database file up front
+    (BEGIN IMMEDIATE), waiting for the other writers up to the busy timeout,
+    so the rows it reads cannot be changed by another process before it
+    writes. See `crud_async.write_transaction`.
+    Committed at the end of the block, rolled back on error.
+    """
+    with engine.connect() as conn:
+        with conn.begin():
+            if conn.dialect.name == "sqlite":
+                # pysqlite would only begin the transaction before the first
+                # write statement, after the reads
+                conn.execute("BEGIN IMMEDIATE")
+            yield conn
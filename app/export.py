@@ -0,0 +1,192 @@
+"""Export the answers and users, for analysis.
+
+Tables are read by pages using keyset pagination on their primary key, so the
+cost of each page does not depend on its position, and memory use does not
+depend on the size of the table.
+Pages are written as CSV (streamed by the app) or as Parquet row groups
+(requires the optional dependency `pyarrow`, eg. `poetry install -E parquet`).
+
+Usage (from the root of the repository) :
+
+    python -m app.export answers answers.csv
+    python -m app.export users users.parquet --page-size 50000
+"""
+import argparse
+import csv
+import io
+import logging
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+from sqlalchemy import Integer, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql import Select
+
+from . import models
+from .db.session import engine
+
+logger = logging.getLogger(__name__)
+
+
+def _answers_query() -> Select:
+    """Answers joined to their author, their result, profile, question and choice."""
+    answers = models.Answer.__table__
+    users = models.User.__table__
+    results = models.Result.__table__
+    profiles = models.Profile.__table__
+    questions = models.Question.__table__
+    choices = models.Choice.__table__
+    return select(
+        [
+            answers.c.id.label("answer_id"),
+            users.c.id.label("user_id"),
+            users.c.name.label("user_name"),
+            users.c.email.label("user_email"),
+            answers.c.questionnaire,
+            results.c.selected_profile,
+            results.c.questionnaire_version,
+            answers.c.profile_id,
+            profiles.c.name.label("profile_name"),
+            questions.c.label.label("question"),
+            choices.c.description,
+            answers.c.weight,
+        ]
+    ).select_from(
+        answers.join(users, answers.c.author_id == users.c.id)
+        .outerjoin(
+            results,
+            (results.c.user_id == answers.c.author_id)
+            & (results.c.questionnaire == answers.c.questionnaire),
+        )
+        .outerjoin(profiles, answers.c.profile_id == profiles.c.id)
+        .outerjoin(questions, answers.c.question_id == questions.c.id)
+        .outerjoin(choices, answers.c.choice_id == choices.c.id)
+    )
+
+
+def _users_query() -> Select:
+    """Users, with the result of their latest submission, without their answers."""
+    users = models.User.__table__
+    return select(
+        [
+            users.c.id.label("user_id"),
+            users.c.name,
+            users.c.email,
+            users.c.selected_profile,
+            users.c.questionnaire,
+            users.c.questionnaire_version,
+        ]
+    )
+
+
+# exportable tables : base query, and the primary key column for keyset pagination
+EXPORTS: Dict[str, Tuple[Callable[[], Select], Callable]] = {
+    "answers": (_answers_query, lambda: models.Answer.__table__.c.id),
+    "users": (_users_query, lambda: models.User.__table__.c.id),
+}
+
+
+def iter_pages(
+    engine: Engine, table: str, page_size: int = 10000
+) -> Iterator[Tuple[List[str], List[Sequence]]]:
+    """Read a table by pages, in the order of its primary key.
+
+    Each page is read in its own short transaction, so a slow consumer does not
+    hold a lock on the database.
+
+    Yields
+    ------
+    columns, rows
+        Names of the columns and rows of each page.
+    """
+    make_query, get_key = EXPORTS[table]
+    key = get_key()
+    query = make_query().order_by(key).limit(page_size)
+    last_key = None
+    while True:
+        page_query = query if last_key is None else query.where(key > last_key)
+        with engine.connect() as conn:
+            result = conn.execute(page_query)
+            columns = list(result.keys())
+            rows = result.fetchall()
+        if not rows:
+            return
+        yield columns, rows
+        # the primary key is the first column
+        last_key = rows[-1][0]
+
+
+def iter_csv(engine: Engine, table: str, page_size: int = 10000) -> Iterator[str]:
+    """Export a table as CSV, one chunk of text per page (the first one has the header)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    header_written = False
+    for columns, rows in iter_pages(engine, table, page_size=page_size):
+        if not header_written:
+            writer.writerow(columns)
+            header_written = True
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if not header_written:
+        # empty table : columns from the query
+        make_query, _ = EXPORTS[table]
+        writer.writerow([c.name for c in make_query().columns])
+        yield buffer.getvalue()
+
+
+def write_csv(engine: Engine, table: str, fn_out: Path, page_size: int = 10000):
+    """Export a table to a CSV file."""
+    with open(fn_out, "w", newline="") as f_out:
+        for chunk in iter_csv(engine, table, page_size=page_size):
+            f_out.write(chunk)
+
+
+def write_parquet(engine: Engine, table: str, fn_out: Path, page_size: int = 10000):
+    """Export a table to a Parquet file, with one row group per page."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError(
+            "Parquet export requires pyarrow : poetry install -E parquet"
+        ) from None
+    # explicit schema, as columns can be null on a whole page
+    make_query, _ = EXPORTS[table]
+    schema = pa.schema(
+        [
+            (col.name, pa.int64() if isinstance(col.type, Integer) else pa.string())
+            for col in make_query().columns
+        ]
+    )
+    writer = pq.ParquetWriter(str(fn_out), schema)
+    try:
+        for columns, rows in iter_pages(engine, table, page_size=page_size):
+            page = pa.Table.from_pydict(
+                {col: [row[i] for row in rows] for i, col in enumerate(columns)},
+                schema=schema,
+            )
+            writer.write_table(page)
+    finally:
+        writer.close()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Export the answers or the users.")
+    parser.add_argument("table", choices=list(EXPORTS), help="table to export")
+    parser.add_argument("output", type=Path, help="output file, .csv or .parquet")
+    parser.add_argument(
+        "--page-size", type=int, default=10000, help="number of rows per page"
+    )
+    args = parser.parse_args()
+    if args.output.suffix == ".parquet":
+        write_parquet(engine, args.table, args.output, page_size=args.page_size)
+    else:
+        write_csv(engine, args.table, args.output, page_size=args.page_size)
+    logger.info("Exported %s to %s", args.table, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Cache of the rendered questionnaire form.
+
+The HTML form only depends on the content of the PQWA file, so it is rendered
+once, as a head, one fragment for each question and a tail. The rendered form
+is cached under the slug and version of the questionnaire.
+Serving the form then boils down to ordering and concatenating the fragments.
+
+The questions are shuffled in one of a few orders, each drawn from a seed : the
+page of each order is assembled and encoded once, and kept in a LRU cache
+bounded in bytes. Serving a shuffled form then costs a cache lookup.
+"""
+import hashlib
+from collections import OrderedDict
+from pathlib import Path
+from random import Random, shuffle
+import sys
+from typing import Callable, Collection, Dict, NamedTuple, Optional, Tuple
+
+from .metrics import cache_lookup
+
+# placeholder for the questions in the rendered page, used to split it
+QUESTIONS_PLACEHOLDER = "<!-- questions -->"
+
+
+class RenderedForm(NamedTuple):
+    """HTML page of the form, with a separate fragment for each question."""
+
+    head: str
+    questions: Tuple[str, ...]
+    tail: str
+
+    def render(self, order: str = "keep", seed: Optional[int] = None) -> str:
+        """Assemble the HTML page.
+
+        Parameters
+        ----------
+        order
+            Order of the questions: "keep" their order of appearance in the file or "shuffle" them.
+        seed
+            Seed of the shuffled order, the same seed gives the same order ;
+            a random order if None.
+        """
+        if order not in ("keep", "shuffle"):
+            raise ValueError("Possible values : 'keep', 'shuffle'")
+        questions = list(self.questions)
+        if order == "shuffle":
+            if seed is None:
+                shuffle(questions)
+            else:
+                Random(seed).shuffle(questions)
+        return "".join([self.head, *questions, self.tail])
+
+
+# rendered forms, by slug and version of the questionnaire
+_rendered_forms: Dict[str, RenderedForm] = {}
+
+
+def file_hash(path: Path) -> str:
+    """Compute the hash of the content of a file."""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def get_rendered_form(key: str, render: Callable[[], RenderedForm]) -> RenderedForm:
+    """Get the rendered form for a key, render it if it is not in the cache.
+
+    Parameters
+    ----------
+    key
+        Slug and version of the questionnaire.
+    render
+        Function that renders the form, called on cache misses.
+    """
+    try:
+        rendered_form = _rendered_forms[key]
+    except KeyError:
+        cache_lookup("form", hit=False)
+        rendered_form = _rendered_forms[key] = render()
+        return rendered_form
+    cache_lookup("form", hit=True)
+    return rendered_form
+
+
+def discard_rendered_forms(keys: Collection[str]) -> None:
+    """Remove the rendered forms for these keys from the cache."""
+    for key in keys:
+        _rendered_forms.pop(key, None)
+
+
+class PageCache:
+    """LRU cache of encoded pages of the form, by key and seed of the order.
+
+    Parameters
+    ----------
+    max_bytes
+        Maximal size of the cached pages ; the least recently used pages are
+        evicted beyond it.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._pages: "OrderedDict[Tuple[str, int], bytes]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+    def get(self, key: str, seed: int, render: Callable[[], bytes]) -> bytes:
+        """Get the page for a key and seed, render it if it is not in the cache.
+
+        Parameters
+        ----------
+        key
+            Slug and version of the questionnaire.
+        seed
+            Seed of the order of the questions.
+        render
+            Function that renders the encoded page, called on cache misses.
+        """
+        page = self._pages.get((key, seed))
+        cache_lookup("page", hit=page is not None)
+        if page is None:
+            page = render()
+            self.put(key, seed, page)
+        else:
+            self._pages.move_to_end((key, seed))
+        return page
+
+    def put(self, key: str, seed: int, page: bytes) -> None:
+        """Add a page to the cache, evict the least recently used pages beyond the size."""
+        previous = self._pages.pop((key, seed), None)
+        if previous is not None:
+            self.nbytes -= sys.getsizeof(previous)
+        self._pages[(key, seed)] = page
+        self.nbytes += sys.getsizeof(page)
+        while self.nbytes > self.max_bytes and self._pages:
+            _, evicted = self._pages.popitem(last=False)
+            self.nbytes -= sys.getsizeof(evicted)
+
+    def discard(self, keys: Collection[str]) -> None:
+        """Remove the pages for these keys from the cache."""
+        for key, seed in [k for k in self._pages if k[0] in keys]:
+            self.nbytes -= sys.getsizeof(self._pages.pop((key, seed)))
@@ -0,0 +1,433 @@
+"""Import the answers of past respondents, from an Airtable CSV export.
+
+The export of the answers has a row per respondent, with their name and email,
+and a column per question, named by the label of the question, with the text
+of the chosen answer, as in the PQWA file (see `pqwa_csv`). Other columns
+(eg. the creation time of the record) are ignored.
+
+The file is streamed in chunks of rows : the answers of each chunk are mapped
+to weights with the current version of the questionnaire (`qid2q`, `qid2w2a`),
+scored in a vectorized way, and the users, their answers and the aggregates
+are bulk written in a single transaction per chunk.
+Memory use is bounded by the size of a chunk.
+
+Respondents are identified by their email, as in the form : importing the
+answers of a respondent again replaces them, the last row of an email wins.
+After each chunk, the number of imported rows is written to a checkpoint file ;
+an interrupted import resumes after the last saved chunk. Rows that cannot be
+mapped (no email, a missing or unknown answer) are skipped and logged.
+
+Usage (from the root of the repository) :
+
+    python -m app.import_answers answers.csv --chunk-size 500
+    python -m app.import_answers answers.csv --questionnaire my-questionnaire
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.sql import ClauseElement
+
+from . import crud, models
+from .config import DEFAULT_QUESTIONNAIRE
+from .db.session import SessionLocal, engine
+from .questionnaire import Questionnaire
+from .rescore import get_questionnaire
+
+logger = logging.getLogger(__name__)
+
+# default names of the columns of the name and email of the respondents
+NAME_COLUMN = "Nom"
+EMAIL_COLUMN = "Email"
+# number of skipped rows that are logged
+MAX_LOGGED_ROWS = 10
+
+# a respondent : email, name, weight of the answer to each question
+Respondent = Tuple[str, str, np.ndarray]
+
+
+def clean(value: str) -> str:
+    """Value of a cell, without the quotes of the "long text" fields of Airtable."""
+    return value.strip().strip('"').strip()
+
+
+class RowParser:
+    """Map the rows of an export to respondents, for a version of a questionnaire.
+
+    Parameters
+    ----------
+    header
+        Header of the export.
+    questionnaire
+        Questionnaire that the respondents answered.
+    name_column, email_column
+        Names of the columns of the name and email of the respondents.
+
+    Raises
+    ------
+    ValueError
+        If a column is missing, or if two questions have the same label.
+    """
+
+    def __init__(
+        self,
+        header: List[str],
+        questionnaire: Questionnaire,
+        name_column: str = NAME_COLUMN,
+        email_column: str = EMAIL_COLUMN,
+    ):
+        columns = {clean(col): idx for idx, col in enumerate(header)}
+        q2qid = {
+            clean(q_label): q_form_id
+            for q_form_id, q_label in questionnaire.qid2q.items()
+        }
+        if len(q2qid) != len(questionnaire.qid2q):
+            raise ValueError("Several questions have the same label")
+        missing = [
+            col for col in [name_column, email_column, *q2qid] if col not in columns
+        ]
+        if missing:
+            others = f" and {len(missing) - 3} others" if len(missing) > 3 else ""
+            raise ValueError(f"Missing columns: {', '.join(missing[:3])}{others}")
+        self.idx_name = columns[name_column]
+        self.idx_email = columns[email_column]
+        scoring_model = questionnaire.scoring_model
+        # column and weight of each answer, for each question of the model
+        self.idx_questions = [
+            columns[clean(questionnaire.qid2q[q_form_id])]
+            for q_form_id in scoring_model.question_ids
+        ]
+        self.a2w = [
+            {clean(a): w for w, a in questionnaire.qid2w2a[q_form_id].items()}
+            for q_form_id in scoring_model.question_ids
+        ]
+        self.nb_columns = len(header)
+
+    def parse(self, row: List[str]) -> Respondent:
+        """Respondent of a row.
+
+        Raises
+        ------
+        ValueError
+            If the row has no email, or an answer is missing or unknown.
+        """
+        if len(row) < self.nb_columns:
+            raise ValueError("Incomplete row")
+        email = row[self.idx_email].strip()
+        if not email:
+            raise ValueError("No email")
+        weights = np.empty(len(self.idx_questions), dtype=np.int64)
+        for q_idx, (idx, a2w) in enumerate(zip(self.idx_questions, self.a2w)):
+            answer = clean(row[idx])
+            try:
+                weights[q_idx] = a2w[answer]
+            except KeyError:
+                raise ValueError(f"Invalid answer in column {idx + 1}: {answer!r}")
+        return email, row[self.idx_name].strip(), weights
+
+
+def iter_chunks(
+    reader: Iterator[List[str]], parser: RowParser, chunk_size: int, stats: Dict
+) -> Iterator[List[Respondent]]:
+    """Stream the respondents of the rows, in chunks of `chunk_size` rows.
+
+    The rows read, including those of the yielded chunk, and the skipped rows
+    are counted in `stats`.
+    """
+    respondents: List[Respondent] = []
+    nb_rows = 0
+    for row in reader:
+        stats["rows"] += 1
+        nb_rows += 1
+        try:
+            respondents.append(parser.parse(row))
+        except ValueError as e:
+            stats["skipped_rows"] += 1
+            if stats["skipped_rows"] <= MAX_LOGGED_ROWS:
+                # line of the row, after the header
+                logger.warning("Row %d skipped: %s", stats["rows"] + 1, e)
+        if nb_rows == chunk_size:
+            yield respondents
+            respondents, nb_rows = [], 0
+    if nb_rows:
+        yield respondents
+
+
+def executemany(
+    conn: Connection, statement: ClauseElement, keys: List[str], rows: List[Tuple]
+):
+    """Execute a statement for each of the rows, with the executemany of the driver.
+
+    The statement is compiled once, and the values of the rows, in the order of
+    `keys`, are passed to the driver without the processing of each row by
+    SQLAlchemy : they must not need any conversion (eg. integers and strings).
+    """
+    compiled = statement.compile(dialect=conn.dialect, column_keys=keys)
+    if not compiled.positional:
+        params: List = [dict(zip(keys, row)) for row in rows]
+    elif list(compiled.positiontup) != keys:
+        idx = [keys.index(key) for key in compiled.positiontup]
+        params = [tuple(row[i] for i in idx) for row in rows]
+    else:
+        params = rows
+    cursor = conn.connection.cursor()
+    try:
+        cursor.executemany(compiled.string, params)
+    finally:
+        cursor.close()
+
+
+def save_chunk(
+    conn: Connection, questionnaire: Questionnaire, respondents: List[Respondent]
+) -> int:
+    """Save the users and answers of a chunk of respondents, in the transaction.
+
+    Returns
+    -------
+    nb_users
+        Number of users created or updated.
+    """
+    answers = models.Answer.__table__
+    dialect_name = conn.dialect.name
+    scoring_model = questionnaire.scoring_model
+    # the last row of an email wins
+    by_email = {email: (name, weights) for email, name, weights in respondents}
+    weights = np.stack([weights for _, weights in by_email.values()])
+    main_mask = scoring_model.main_profiles(scoring_model.score_batch(weights))
+    p_names = np.array(
+        [questionnaire.p_id2name[p_id] for p_id in scoring_model.profile_ids]
+    )
+    selected_profiles = ["|".join(p_names[mask]) for mask in main_mask]
+    executemany(
+        conn,
+        text(crud.upsert_user_sql(dialect_name, returning=False)),
+        crud.USER_COLUMNS,
+        [
+            (email, name, selected_profile, questionnaire.slug, questionnaire.version)
+            for (email, (name, _)), selected_profile in zip(
+                by_email.items(), selected_profiles
+            )
+        ],
+    )
+    email2id = dict(conn.execute(crud.user_ids_query(by_email)).fetchall())
+    user_ids = [email2id[email] for email in by_email]
+    executemany(
+        conn,
+        text(crud.UPSERT_RESULT_SQL),
+        crud.RESULT_COLUMNS,
+        [
+            (user_id, questionnaire.slug, questionnaire.version, selected_profile)
+            for user_id, selected_profile in zip(user_ids, selected_profiles)
+        ],
+    )
+    # replace the previous answers of the users to the questionnaire, if any
+    query, delete = crud.previous_answers(user_ids, questionnaire.slug)
+    previous_answers: Dict[int, List[Dict]] = {}
+    for row in conn.execute(query):
+        previous_answers.setdefault(row["author_id"], []).append(dict(row))
+    if previous_answers:
+        conn.execute(delete)
+    user_answers = [scoring_model.prep_answers(w) for w in weights]
+    executemany(
+        conn,
+        answers.insert(),
+        list(crud.ANSWER_COLUMNS),
+        [
+            (
+                answer["profile_id"],
+                answer["question_id"],
+                answer["choice_id"],
+                answer["weight"],
+                user_id,
+                questionnaire.slug,
+            )
+            for user_id, u_answers in zip(user_ids, user_answers)
+            for answer in u_answers
+        ],
+    )
+    for statement, params in crud.batch_stats_updates(
+        questionnaire.slug,
+        [
+            (u_answers, previous_answers.get(user_id, []))
+            for user_id, u_answers in zip(user_ids, user_answers)
+        ],
+        dialect_name,
+    ):
+        conn.execute(statement, params)
+    return len(user_ids)
+
+
+def read_checkpoint(fn_checkpoint: Path, identity: Dict) -> int:
+    """Number of rows imported by a previous run, 0 if there is none.
+
+    Raises
+    ------
+    ValueError
+        If the checkpoint is for another file or version of the questionnaire.
+    """
+    try:
+        with open(fn_checkpoint) as f_checkpoint:
+            checkpoint = json.load(f_checkpoint)
+    except FileNotFoundError:
+        return 0
+    if {key: checkpoint.get(key) for key in identity} != identity:
+        raise ValueError(
+            f"The checkpoint {fn_checkpoint} is for another file or version of "
+            "the questionnaire, import with --restart"
+        )
+    return checkpoint["rows"]
+
+
+def write_checkpoint(fn_checkpoint: Path, identity: Dict, nb_rows: int):
+    """Save the number of imported rows, atomically."""
+    fn_tmp = fn_checkpoint.with_name(fn_checkpoint.name + ".tmp")
+    with open(fn_tmp, "w") as f_checkpoint:
+        json.dump(dict(identity, rows=nb_rows), f_checkpoint)
+    os.replace(fn_tmp, fn_checkpoint)
+
+
+def import_answers(
+    fn_csv: Path,
+    questionnaire_slug: str = DEFAULT_QUESTIONNAIRE,
+    chunk_size: int = 500,
+    fn_checkpoint: Optional[Path] = None,
+    restart: bool = False,
+    name_column: str = NAME_COLUMN,
+    email_column: str = EMAIL_COLUMN,
+) -> Dict[str, int]:
+    """Import the answers of an Airtable export, a transaction per chunk of rows.
+
+    Parameters
+    ----------
+    fn_csv
+        Path to the CSV export.
+    questionnaire_slug
+        Slug of the questionnaire ; the answers are mapped to its current version.
+    chunk_size
+        Number of rows imported at once.
+    fn_checkpoint
+        Path of the checkpoint file, by default next to the export.
+    restart
+        If True, import the whole file again, even if a checkpoint exists.
+    name_column, email_column
+        Names of the columns of the name and email of the respondents.
+
+    Returns
+    -------
+    stats
+        Number of rows read, users imported, rows skipped as invalid, and rows
+        already imported by a previous run.
+    """
+    questionnaire = get_questionnaire(questionnaire_slug)
+    scoring_model = questionnaire.scoring_model
+    if fn_checkpoint is None:
+        fn_checkpoint = fn_csv.with_name(fn_csv.name + ".checkpoint")
+    identity = {
+        "file": str(fn_csv.resolve()),
+        "size": fn_csv.stat().st_size,
+        "questionnaire": questionnaire.slug,
+        "version": questionnaire.version,
+    }
+    resume_rows = 0 if restart else read_checkpoint(fn_checkpoint, identity)
+    # profiles and questions of the answers, in the database
+    db = SessionLocal()
+    try:
+        crud.seed_profiles(db, questionnaire.slug, questionnaire.profiles)
+        scoring_model.bind_db_ids(
+            *crud.seed_questions(db, questionnaire.slug, scoring_model.question_rows())
+        )
+    finally:
+        db.close()
+    stats = {"rows": 0, "users": 0, "skipped_rows": 0, "resumed_rows": resume_rows}
+    start = time.perf_counter()
+    # the CSV export from airtable starts with a byte order mark
+    with open(fn_csv, newline="", encoding="utf-8-sig") as f_csv:
+        reader = csv.reader(f_csv)
+        parser = RowParser(next(reader), questionnaire, name_column, email_column)
+        # rows already imported : read, not parsed
+        for _ in range(resume_rows):
+            next(reader, None)
+        stats["rows"] = resume_rows
+        for respondents in iter_chunks(reader, parser, chunk_size, stats):
+            if respondents:
+                with engine.begin() as conn:
+                    stats["users"] += save_chunk(conn, questionnaire, respondents)
+            # a chunk saved without its checkpoint is imported again, which
+            # replaces its answers by the same ones
+            write_checkpoint(fn_checkpoint, identity, stats["rows"])
+            logger.info(
+                "%d rows imported (%.0f rows/s)",
+                stats["rows"],
+                (stats["rows"] - resume_rows) / (time.perf_counter() - start),
+            )
+    return stats
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description="Import the answers of past respondents, from an Airtable CSV export."
+    )
+    parser.add_argument("csv", type=Path, help="CSV export of the answers")
+    parser.add_argument(
+        "--questionnaire",
+        default=DEFAULT_QUESTIONNAIRE,
+        help="slug of the questionnaire",
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=500, help="number of rows per transaction"
+    )
+    parser.add_argument(
+        "--checkpoint",
+        type=Path,
+        help="checkpoint file (default: next to the export, with .checkpoint)",
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="import the whole file, even if a checkpoint exists",
+    )
+    parser.add_argument(
+        "--name-column", default=NAME_COLUMN, help="column of the names"
+    )
+    parser.add_argument(
+        "--email-column", default=EMAIL_COLUMN, help="column of the emails"
+    )
+    args = parser.parse_args()
+    start = time.perf_counter()
+    try:
+        stats = import_answers(
+            args.csv,
+            questionnaire_slug=args.questionnaire,
+            chunk_size=args.chunk_size,
+            fn_checkpoint=args.checkpoint,
+            restart=args.restart,
+            name_column=args.name_column,
+            email_column=args.email_column,
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    elapsed = time.perf_counter() - start
+    nb_rows = stats["rows"] - stats["resumed_rows"]
+    logger.info(
+        "%d rows read in %.1f s (%.0f rows/s), %d users imported, "
+        "%d rows skipped, %d rows imported before",
+        nb_rows,
+        elapsed,
+        nb_rows / elapsed if elapsed else 0,
+        stats["users"],
+        stats["skipped_rows"],
+        stats["resumed_rows"],
+    )
+
+
+if __name__ == "__main__":
+    main()
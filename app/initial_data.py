@@ -0,0 +1,27 @@
+"""Fill the database with initial data.
+
+Usage (from the root of the repository, after `alembic upgrade head`) :
+
+    python -m app.initial_data
+"""
+import logging
+
+from app.db.init_db import init_db
+from app.db.session import SessionLocal
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    logger.info("Creating initial data")
+    db = SessionLocal()
+    try:
+        init_db(db)
+    finally:
+        db.close()
+    logger.info("Initial data created")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,23 +4,54 @@ References :
 - https://stackoverflow.com/a/57548509/14201886
 - https://fastapi.tiangolo.com/tutorial/sql-databases/#main-fastapi-app
 """
-from collections import defaultdict
-import json
+import asyncio
+from functools import partial
 from pathlib import Path
-from random import shuffle
-from typing import DefaultDict, List
-
-from fastapi import FastAPI, Depends, HTTPException, Request, Form, Response
-from fastapi.staticfiles import StaticFiles
+from random import randrange, shuffle
+import secrets
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import (
+    FastAPI,
+    Depends,
+    Header,
+    HTTPException,
+    Request,
+    Query,
+    Response,
+)
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
+from jinja2 import Markup
+import numpy as np
+from prometheus_client import CONTENT_TYPE_LATEST
 from starlette_wtf import StarletteForm
 from wtforms import FieldList, RadioField, FormField, StringField
 from wtforms.validators import DataRequired, Email
 
-from . import crud, models, schemas
-from .db.session import SessionLocal, engine
-from .pqwa_csv import load_pqwa, df_to_nesteddict
+from . import (
+    assets,
+    crud_async,
+    export,
+    form_cache,
+    metrics,
+    paged_form,
+    pagination,
+    schemas,
+    submission_queue,
+    summary_cache,
+)
+from .config import (
+    CSV_PQWA,
+    DEFAULT_QUESTIONNAIRE,
+    DIR_QUESTIONNAIRES,
+    JSON_PROFILES,
+    PQWA_NAMES,
+    settings,
+)
+from .db.session import database, engine
+from .questionnaire import Questionnaire, QuestionnaireCatalog, QuestionnaireRegistry
 
 #
 # define the (sub)forms
@@ -44,64 +75,41 @@ class DatapositionForm(StarletteForm):
     questions = FieldList(FormField(QuestionForm))
 
 
-# Dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
-# read profiles, questions and weighted answers
-# FIXME move out to config file
-JSON_PROFILES = "data/profiles.json"
-CSV_PQWA = "data/qr_databat.csv"
-
-# FIXME move out to another config file
-PQWA_NAMES = ["Profil", "Question", "Pondération (1 à 4)", "Valeur de réponse"]
-
-# profiles: id, name, color, badge
-with open(Path(JSON_PROFILES)) as f_profiles:
-    profiles = json.load(f_profiles)
-
-# PQWA
-df = load_pqwa(Path(CSV_PQWA), PQWA_NAMES)
-pqwas = df_to_nesteddict(df)
-
-# maps from/to profile id
-p_name2id = {p["name"]: p["id"] for p in profiles}
-p_id2name = {p["id"]: p["name"] for p in profiles}
-p_id2badge = {p["id"]: p["badge"] for p in profiles}
-p_id2color = {p["id"]: p["color"] for p in profiles}
-
-# load the profiles, questions, weights, answers
-# FIXME refactor to put the list of questions in the DataBase,
-# with their own table and proper IDs etc
-list_questions = []
-for p, qwa in pqwas.items():
-    p_id = p_name2id[p]
-    for i, (q, wa) in enumerate(qwa.items(), start=1):
-        # assign a distinct id to each question
-        q_form_id = f"{p_id}-{i}"
-        q_label = q
-        q_choices = [(w, a) for w, a in sorted(wa.items())]
-        list_questions.append((q_form_id, q_label, q_choices))
-qid2q = {q_form_id: q_label for q_form_id, q_label, _ in list_questions}
-qid2w2a = {
-    q_form_id: {w: a for w, a in q_choices}
-    for q_form_id, _, q_choices in list_questions
-}
-# end FIXME
-
-
-def get_questions(request: Request, order: str = "keep") -> List[QuestionForm]:
+# read profiles, questions and weighted answers, reloaded when the files change ;
+# the questionnaires other than the default one are loaded on first use
+questionnaires = QuestionnaireCatalog(
+    DEFAULT_QUESTIONNAIRE,
+    Path(JSON_PROFILES),
+    Path(CSV_PQWA),
+    PQWA_NAMES,
+    Path(DIR_QUESTIONNAIRES),
+    max_size=settings.QUESTIONNAIRE_CACHE_SIZE,
+)
+
+
+def form_key(questionnaire: Questionnaire) -> str:
+    """Key of the rendered form of a questionnaire, in the cache."""
+    return f"{questionnaire.slug}:{questionnaire.version}"
+
+
+def profiles_css_url(questionnaire: Questionnaire) -> str:
+    """URL of the stylesheet of the colors of the profiles of a version."""
+    return f"/profiles/{questionnaire.slug}/{questionnaire.version}.css"
+
+
+def get_questions(
+    request: Request,
+    questionnaire: Questionnaire,
+    order: str = "keep",
+) -> List[QuestionForm]:
     """Get forms for questions (and their weighted answers)
 
     Parameters
     ----------
     request
         Starlette request.
+    questionnaire
+        Version of the questionnaire.
     order
         Order of the questions: "keep" their order of appearance in the file or "shuffle" them.
     """
@@ -109,7 +117,7 @@ def get_questions(request: Request, order: str = "keep") -> List[QuestionForm]:
         raise ValueError("Possible values : 'keep', 'shuffle'")
     # for each question, create a subform
     q_forms: List[QuestionForm] = []
-    for q_form_id, q_label, q_choices in list_questions:
+    for q_form_id, q_label, q_choices in questionnaire.list_questions:
         q_form = QuestionForm(request, prefix=q_form_id)
         q_form.question.label = q_label
         q_form.question.choices = q_choices
@@ -122,182 +130,652 @@ def get_questions(request: Request, order: str = "keep") -> List[QuestionForm]:
     return q_forms
 
 
+def render_form(questionnaire: Questionnaire) -> form_cache.RenderedForm:
+    """Render the form, with a separate HTML fragment for each question.
+
+    The form does not depend on the request, so it is rendered for a blank request.
+    """
+    request = Request({"type": "http", "method": "GET", "headers": []})
+    dataposition_form = DatapositionForm(request)
+    page = templates.get_template("form.html").render(
+        request=request,
+        dataposition_form=dataposition_form,
+        profiles_css_url=profiles_css_url(questionnaire),
+        questionnaire_version=questionnaire.version,
+        questions_html=Markup(form_cache.QUESTIONS_PLACEHOLDER),
+    )
+    head, tail = page.split(form_cache.QUESTIONS_PLACEHOLDER)
+    question_template = templates.get_template("question.html")
+    questions = tuple(
+        question_template.render(q_form=q_form)
+        for q_form in get_questions(request, questionnaire, order="keep")
+    )
+    return form_cache.RenderedForm(head, questions, tail)
+
+
+def render_page(rendered_form: form_cache.RenderedForm, seed: int) -> bytes:
+    """Encoded page of the form, with the questions in the order of a seed."""
+    return rendered_form.render(order="shuffle", seed=seed).encode()
+
+
+def render_summary(
+    questionnaire: Questionnaire, main_p_ids: List[str]
+) -> summary_cache.RenderedSummary:
+    """Render the summary for main profiles, around a placeholder for the scores.
+
+    The summary does not depend on the request, so it is rendered for a blank request.
+    """
+    request = Request({"type": "http", "method": "GET", "headers": []})
+    page = templates.get_template("summary.html").render(
+        request=request,
+        profiles_css_url=profiles_css_url(questionnaire),
+        scores_html=Markup(summary_cache.SCORES_PLACEHOLDER),
+        # main profiles
+        # FIXME pass less info, or better structured
+        main_p_ids=main_p_ids,
+        main_profiles=[questionnaire.p_id2name[p_id] for p_id in main_p_ids],
+        main_colors=[questionnaire.p_id2color[p_id] for p_id in main_p_ids],
+        main_badges=[questionnaire.p_id2badge[p_id] for p_id in main_p_ids],
+    )
+    return summary_cache.RenderedSummary.split(page)
+
+
+def summary_page(
+    questionnaire: Questionnaire,
+    profile_scores: List[Tuple[str, int]],
+    main_p_ids: List[str],
+) -> bytes:
+    """Encoded summary page, around the scores of a respondent.
+
+    Parameters
+    ----------
+    questionnaire
+        Version of the questionnaire.
+    profile_scores
+        Id and score of each profile, sorted by descending score.
+    main_p_ids
+        Ids of the main profiles.
+    """
+    summary = summaries.get(
+        form_key(questionnaire),
+        tuple(main_p_ids),
+        partial(render_summary, questionnaire, main_p_ids),
+    )
+    scores_html = templates.get_template("summary_scores.html").render(
+        p_id2name=questionnaire.p_id2name, profile_scores=profile_scores
+    )
+    return summary.render(scores_html)
+
+
+# pages of the forms, in each order of the questions
+form_pages = form_cache.PageCache(settings.FORM_PAGE_CACHE_BYTES)
+# summaries, by version and main profiles
+summaries = summary_cache.SummaryCache(settings.SUMMARY_CACHE_SIZE)
+
 # create all tables in database
 # comment this out if you're not using migrations (alembic)
 # models.Base.metadata.create_all(bind=engine)
 
 # setup app
 app = FastAPI()
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.add_middleware(metrics.MetricsMiddleware)
+# the built assets, see `app.assets`
+asset_manifest = assets.load_manifest()
+app.mount(
+    "/static",
+    assets.AssetFiles(directory="static", manifest=asset_manifest),
+    name="static",
+)
 templates = Jinja2Templates(directory="templates/")
+templates.env.globals["asset_url"] = partial(assets.asset_url, asset_manifest)
+
+
+# progress tokens of the paged form
+progress_tokens = paged_form.ProgressTokens(
+    settings.SECRET_KEY or secrets.token_urlsafe(32),
+    max_age=settings.PAGED_TOKEN_MAX_AGE,
+)
+
+# task watching the questionnaire files
+watcher: Optional[asyncio.Task] = None
+# write-behind mode : queue of the submissions, and task saving them
+submissions: Optional[submission_queue.SubmissionQueue] = None
+drainer: Optional[asyncio.Task] = None
+
+
+@questionnaires.prepare
+async def prepare_questionnaire(questionnaire: Questionnaire):
+    """Create the new profiles, questions and choices, and render the form of a version."""
+    await crud_async.seed_profiles(database, questionnaire.slug, questionnaire.profiles)
+    scoring_model = questionnaire.scoring_model
+    scoring_model.bind_db_ids(
+        *await crud_async.seed_questions(
+            database, questionnaire.slug, scoring_model.question_rows()
+        )
+    )
+    loop = asyncio.get_event_loop()
+    rendered_form = await loop.run_in_executor(
+        None,
+        form_cache.get_rendered_form,
+        form_key(questionnaire),
+        partial(render_form, questionnaire),
+    )
+    # the pages in each order, assembled off the event loop
+    pages = await loop.run_in_executor(
+        None,
+        lambda: [
+            render_page(rendered_form, seed) for seed in range(settings.FORM_ORDERS)
+        ],
+    )
+    for seed, page in enumerate(pages):
+        form_pages.put(form_key(questionnaire), seed, page)
+
+
+@questionnaires.on_swap
+def drop_previous_form(previous: Questionnaire, questionnaire: Questionnaire):
+    form_cache.discard_rendered_forms([form_key(previous)])
+    form_pages.discard([form_key(previous)])
+    summaries.discard([form_key(previous)])
+
+
+# each version of an evicted questionnaire : the previous one can have been
+# rendered again since the swap, eg. the summaries of its late submissions
+@questionnaires.on_evict
+def drop_evicted_form(questionnaire: Questionnaire):
+    form_cache.discard_rendered_forms([form_key(questionnaire)])
+    form_pages.discard([form_key(questionnaire)])
+    summaries.discard([form_key(questionnaire)])
+
+
+@app.on_event("startup")
+async def startup():
+    global watcher, submissions, drainer
+    await database.connect()
+    await prepare_questionnaire(questionnaires.default.current)
+    if settings.QUESTIONNAIRE_WATCH_INTERVAL > 0:
+        watcher = asyncio.ensure_future(
+            questionnaires.watch(settings.QUESTIONNAIRE_WATCH_INTERVAL)
+        )
+    if settings.SUBMISSION_QUEUE_PATH:
+        # the submissions left in the queue by a previous run are saved first
+        submissions = submission_queue.SubmissionQueue(
+            settings.SUBMISSION_QUEUE_PATH,
+            claim_timeout=settings.SUBMISSION_QUEUE_CLAIM_TIMEOUT,
+            max_attempts=settings.SUBMISSION_QUEUE_MAX_ATTEMPTS,
+        )
+        drainer = asyncio.ensure_future(
+            submission_queue.drain(
+                submissions,
+                partial(crud_async.save_submissions, database),
+                settings.SUBMISSION_QUEUE_BATCH_SIZE,
+                settings.SUBMISSION_QUEUE_INTERVAL,
+            )
+        )
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    try:
+        if watcher is not None:
+            watcher.cancel()
+        if drainer is not None:
+            drainer.cancel()
+            try:
+                await drainer
+            except asyncio.CancelledError:
+                pass
+            # save the rest of the queue before the database is disconnected
+            try:
+                await submission_queue.flush_all(
+                    submissions,
+                    partial(crud_async.save_submissions, database),
+                    settings.SUBMISSION_QUEUE_BATCH_SIZE,
+                )
+            finally:
+                submissions.close()
+    finally:
+        await database.disconnect()
+
+
+@app.exception_handler(sqlite3.OperationalError)
+async def database_locked(request: Request, exc: sqlite3.OperationalError):
+    """Ask the client to retry when SQLite stays locked beyond the busy timeout."""
+    if "database is locked" not in str(exc):
+        raise exc
+    return JSONResponse(
+        {"detail": "The database is busy, retry later"},
+        status_code=503,
+        headers={"Retry-After": "1"},
+    )
+
 
 # routes
 # we directly use the Starlette Request : https://www.starlette.io/requests/
 # see https://fastapi.tiangolo.com/advanced/using-request-directly/?h=+using+requ#use-the-request-object-directly
+async def get_registry_or_404(slug: str) -> QuestionnaireRegistry:
+    """Get the registry of a questionnaire, from the slug in the path."""
+    registry = await questionnaires.get(slug)
+    if registry is None:
+        raise HTTPException(status_code=404, detail="Questionnaire not found")
+    return registry
+
+
+def form_response(
+    registry: QuestionnaireRegistry, order: Optional[int] = None
+) -> HTMLResponse:
+    # the profiles and questions are created in the database when the
+    # questionnaire is loaded : this route does not access the database
+    # the form is rendered once per version, and its page once per order of
+    # the questions : we only need to draw one of the orders
+    questionnaire = registry.current
+    # one of the orders of the pool, so the pages stay in the cache
+    if order is None:
+        seed = randrange(settings.FORM_ORDERS)
+    else:
+        seed = order % settings.FORM_ORDERS
+    key = form_key(questionnaire)
+
+    def render() -> bytes:
+        rendered_form = form_cache.get_rendered_form(
+            key, partial(render_form, questionnaire)
+        )
+        return render_page(rendered_form, seed)
+
+    with metrics.span("get_form.render"):
+        page = form_pages.get(key, seed, render)
+    # the order is reproducible with ?order=<seed>
+    return HTMLResponse(page, headers={"X-Form-Order": str(seed)})
+
+
 # form: get
 @app.get("/")
-async def get_form(request: Request, db: Session = Depends(get_db)):
-    # create profiles if none in the database
-    db_profiles = crud.get_profiles(db)
-    if not db_profiles:
-        # empty table
-        for profile in profiles:
-            # DIRTY copy from crud.create_profile()
-            db_profile = models.Profile(**profile)
-            db.add(db_profile)
-            db.commit()
-            db.refresh(db_profile)
-    # end create profiles if none
-
-    # build form
-    dataposition_form = DatapositionForm(request)
-    dataposition_form.questions = get_questions(request, order="shuffle")
-    return templates.TemplateResponse(
-        "form.html",
-        context={
-            "request": request,
-            "dataposition_form": dataposition_form,
-            "p_id2color": p_id2color,
-        },
-    )
+async def get_form(order: Optional[int] = None):
+    return form_response(questionnaires.default, order)
+
+
+@app.get("/q/{slug}/")
+async def get_questionnaire_form(slug: str, order: Optional[int] = None):
+    return form_response(await get_registry_or_404(slug), order)
 
 
 # parse form
 # as starlette's request.form() is asynchronous, we need to wrap receiving the data
 # from the form, in a separate dependency
 # https://github.com/tiangolo/fastapi/issues/852
-async def parse_form(request: Request, db: Session = Depends(get_db)) -> Response:
-    form_data = await request.form()
-    # store data in DB
-    # - user info
+async def parse_form(request: Request, registry: QuestionnaireRegistry) -> Response:
+    with metrics.span("parse_form.read_form"):
+        form_data = await request.form()
     user_name = form_data["name"]
     user_email = form_data["email"]
-    # check if a user with this email already exists
-    existing_user = (
-        db.query(models.User).filter(models.User.email == user_email).first()
-    )
-    if existing_user:
-        # update the name
-        existing_user.name = user_name
-        # delete previous answers
-        existing_answers = db.query(models.Answer).filter(
-            models.Answer.author_id == existing_user.id
-        )
-        existing_answers.delete(synchronize_session=False)
-        db_user = existing_user
-    else:
-        # insert new user
-        # FIXME copy from create_user
-        db_user = models.User(email=user_email, name=user_name)
-        db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
-        # end FIXME
-
-    # - answers (DIRTY)
-    form_qid_w = [
-        (k.replace("-question", ""), int(v))
-        for k, v in form_data.items()
-        if k.endswith("question")
-    ]
-    prep_answers = [
-        {
-            "profile_id": k.split("-", 1)[0],
-            "question": qid2q[k],
-            "weight": v,
-            "description": qid2w2a[k][v],
-        }
-        for k, v in form_qid_w
-    ]
-    for prep_answer in prep_answers:
-        db_answer = models.Answer(**prep_answer, author_id=db_user.id)
-        db.add(db_answer)
-        db.commit()
-        db.refresh(db_answer)
-
-    # process form data
-    # - compute score for each profile
-    p_score: DefaultDict[str, int] = defaultdict(int)
-    questions = [(k, v) for k, v in form_data.items() if k.endswith("question")]
-    for q_id, w in questions:
-        p_id = q_id.split("-", 1)[0]
-        p_score[p_id] += int(w)  # FIXME make coerce work on form validation
-    print(p_score.items())  # DEBUG
+    # score the answers against the version of the questionnaire that was served
+    questionnaire = registry.get(form_data.get("questionnaire_version"))
+    scoring_model = questionnaire.scoring_model
+
+    with metrics.span("parse_form.score"):
+        # - answers
+        try:
+            weights = scoring_model.parse_form(form_data)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        prep_answers = scoring_model.prep_answers(weights)
+
+        # process form data
+        # - compute score for each profile
+        scores = scoring_model.score(weights).tolist()
     # TODO radarplot ?
     # sort profiles by their score
-    sorted_profiles = list(sorted(p_score.items(), key=lambda pw: pw[1], reverse=True))
+    sorted_profiles = list(
+        sorted(
+            zip(scoring_model.profile_ids, scores), key=lambda pw: pw[1], reverse=True
+        )
+    )
     # assign main profiles : currently the argmax of the scores
     max_score = sorted_profiles[0][1]
     main_p_ids = [p_id for p_id, w in sorted_profiles if w == max_score]
-    main_profiles = [p_id2name[p_id] for p_id in main_p_ids]
-    main_colors = [p_id2color[p_id] for p_id in main_p_ids]
-    main_badges = [p_id2badge[p_id] for p_id in main_p_ids]
+    main_profiles = [questionnaire.p_id2name[p_id] for p_id in main_p_ids]
 
-    # store user badge(s) ; union of badges if there is a tie
+    # store data in DB, in a single transaction: user info (new or updated),
+    # answers (replacing the previous ones if any), user badge(s) ;
+    # union of badges if there is a tie
     # TODO improve on this
-    db_user.selected_profile = "|".join(main_profiles)
-    db.commit()
-    db.refresh(db_user)
-    # end store user badge(s)
+    submission = dict(
+        email=user_email,
+        name=user_name,
+        answers_values=prep_answers,
+        selected_profile="|".join(main_profiles),
+        questionnaire=questionnaire.slug,
+        questionnaire_version=questionnaire.version,
+    )
+    if submissions is None:
+        with metrics.span("parse_form.save"):
+            await crud_async.save_submission(database, **submission)
+    else:
+        # write-behind : saved in the background, the summary does not wait
+        with metrics.span("parse_form.enqueue"):
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, submissions.put, submission)
+
+    # return profile summary : the page for the main profiles is rendered once
+    # per version of the questionnaire, only the scores are rendered here
+    with metrics.span("parse_form.render"):
+        return HTMLResponse(summary_page(questionnaire, sorted_profiles, main_p_ids))
+
+
+async def parse_default_form(request: Request) -> Response:
+    return await parse_form(request, questionnaires.default)
+
+
+async def parse_questionnaire_form(request: Request, slug: str) -> Response:
+    return await parse_form(request, await get_registry_or_404(slug))
 
-    # return profile summary
+
+# paged form : the page, then the questions as JSON, cached by the browsers
+def paged_response(request: Request, registry: QuestionnaireRegistry) -> Response:
+    questionnaire = registry.current
     return templates.TemplateResponse(
-        "summary.html",
+        "paged.html",
         context={
             "request": request,
-            "p_id2color": p_id2color,
-            "p_id2name": p_id2name,
-            # personal info
-            "name": form_data["name"],
-            "email": form_data["email"],
-            # score for each profile (sorted in descending order)
-            "profile_scores": sorted_profiles,
-            # main profiles
-            # FIXME pass less info, or better structured
-            "main_p_ids": main_p_ids,
-            "main_profiles": main_profiles,
-            "main_colors": main_colors,
-            "main_badges": main_badges,
+            "profiles_css_url": profiles_css_url(questionnaire),
+            "questionnaire_version": questionnaire.version,
+            "questions_url": f"/questions/{questionnaire.slug}/{questionnaire.version}.json",
+            "token": progress_tokens.issue(questionnaire),
         },
+        # the token is specific to the respondent
+        headers={"Cache-Control": "no-store"},
     )
 
 
+@app.get("/paged")
+async def get_paged_form(request: Request):
+    return paged_response(request, questionnaires.default)
+
+
+@app.get("/q/{slug}/paged")
+async def get_questionnaire_paged_form(request: Request, slug: str):
+    return paged_response(request, await get_registry_or_404(slug))
+
+
+async def get_version_or_404(slug: str, version: str) -> Questionnaire:
+    """Get a version of a questionnaire, from the slug and version in the path."""
+    registry = await get_registry_or_404(slug)
+    questionnaire = registry.get(version)
+    if questionnaire.version != version:
+        raise HTTPException(status_code=404, detail="Version not found")
+    return questionnaire
+
+
+def immutable_response(
+    content: bytes, media_type: str, version: str, if_none_match: Optional[str]
+) -> Response:
+    """Response for a URL that includes the version : the content never changes."""
+    etag = f'"{version}"'
+    headers = {"ETag": etag, "Cache-Control": assets.IMMUTABLE}
+    if if_none_match is not None and etag in if_none_match.split(", "):
+        return Response(status_code=304, headers=headers)
+    return Response(content, media_type=media_type, headers=headers)
+
+
+@app.get("/questions/{slug}/{version}.json")
+async def get_questions_json(
+    slug: str, version: str, if_none_match: Optional[str] = Header(None)
+):
+    questionnaire = await get_version_or_404(slug, version)
+    return immutable_response(
+        questionnaire.questions_json, "application/json", version, if_none_match
+    )
+
+
+@app.get("/profiles/{slug}/{version}.css")
+async def get_profiles_css(
+    slug: str, version: str, if_none_match: Optional[str] = Header(None)
+):
+    questionnaire = await get_version_or_404(slug, version)
+    return immutable_response(
+        questionnaire.profiles_css, "text/css", version, if_none_match
+    )
+
+
+async def parse_paged_form(
+    request: Request, registry: QuestionnaireRegistry
+) -> Response:
+    """Check the progress token, then parse the form as `parse_form`."""
+    form_data = await request.form()
+    try:
+        version = progress_tokens.check(form_data.get("token", ""), registry.slug)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if version != form_data.get("questionnaire_version"):
+        raise HTTPException(
+            status_code=400, detail="Progress token for another version"
+        )
+    return await parse_form(request, registry)
+
+
+async def parse_default_paged_form(request: Request) -> Response:
+    return await parse_paged_form(request, questionnaires.default)
+
+
+async def parse_questionnaire_paged_form(request: Request, slug: str) -> Response:
+    return await parse_paged_form(request, await get_registry_or_404(slug))
+
+
 # form: post
 @app.post("/")
-async def submit_answers(summary: Response = Depends(parse_form)):
+async def submit_answers(summary: Response = Depends(parse_default_form)):
+    return summary
+
+
+@app.post("/q/{slug}/")
+async def submit_questionnaire_answers(
+    summary: Response = Depends(parse_questionnaire_form),
+):
+    return summary
+
+
+@app.post("/paged")
+async def submit_paged_answers(summary: Response = Depends(parse_default_paged_form)):
+    return summary
+
+
+@app.post("/q/{slug}/paged")
+async def submit_questionnaire_paged_answers(
+    summary: Response = Depends(parse_questionnaire_paged_form),
+):
     return summary
 
 
+# batch of submissions, eg. queued offline by the kiosks of a workshop : the
+# submissions are scored together, and saved in a single transaction ; sending
+# the batch again replaces the answers, as the form does
+@app.post("/api/submissions:batch", response_model=List[schemas.SubmissionResult])
+async def submit_batch(
+    batch: List[schemas.SubmissionCreate],
+    questionnaire: str = DEFAULT_QUESTIONNAIRE,
+):
+    if len(batch) > settings.SUBMISSION_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"More than {settings.SUBMISSION_BATCH_MAX_SIZE} submissions",
+        )
+    registry = await get_registry_or_404(questionnaire)
+    results = [
+        schemas.SubmissionResult(index=i, email=submission.email, saved=False)
+        for i, submission in enumerate(batch)
+    ]
+    # submissions to save, and their index in the batch
+    to_save: List[Tuple[int, Dict]] = []
+    with metrics.span("submit_batch.score"):
+        # score the submissions to each version of the questionnaire at once
+        by_version: Dict[str, Tuple[Questionnaire, List[int]]] = {}
+        for i, submission in enumerate(batch):
+            q_version = registry.get(submission.questionnaire_version)
+            by_version.setdefault(q_version.version, (q_version, []))[1].append(i)
+        for q_version, indices in by_version.values():
+            scoring_model = q_version.scoring_model
+            valid, rows = [], []
+            for i in indices:
+                try:
+                    rows.append(scoring_model.parse_answers(batch[i].answers))
+                except ValueError as e:
+                    results[i].error = str(e)
+                    continue
+                valid.append(i)
+            if not valid:
+                continue
+            weights = np.stack(rows)
+            scores = scoring_model.score_batch(weights)
+            is_main = scoring_model.main_profiles(scores)
+            for i, i_weights, i_scores, i_is_main in zip(
+                valid, weights, scores.tolist(), is_main.tolist()
+            ):
+                main_profiles = [
+                    q_version.p_id2name[p_id]
+                    for p_id, main in zip(scoring_model.profile_ids, i_is_main)
+                    if main
+                ]
+                result = results[i]
+                result.questionnaire_version = q_version.version
+                result.scores = dict(zip(scoring_model.profile_ids, i_scores))
+                result.main_profiles = main_profiles
+                to_save.append(
+                    (
+                        i,
+                        dict(
+                            email=batch[i].email,
+                            name=batch[i].name,
+                            answers_values=scoring_model.prep_answers(i_weights),
+                            selected_profile="|".join(main_profiles),
+                            questionnaire=q_version.slug,
+                            questionnaire_version=q_version.version,
+                        ),
+                    )
+                )
+    if to_save:
+        # in the order of the batch : the last submission of an email wins
+        to_save.sort(key=lambda i_submission: i_submission[0])
+        with metrics.span("submit_batch.save"):
+            user_ids = await crud_async.save_submissions(
+                database, [submission for _, submission in to_save]
+            )
+        for (i, _), user_id in zip(to_save, user_ids):
+            results[i].saved = True
+            results[i].user_id = user_id
+    return results
+
+
+def decode_cursor_or_400(cursor: Optional[str]) -> Optional[int]:
+    """Decode the pagination cursor from the query, if any."""
+    if cursor is None:
+        return None
+    try:
+        return pagination.decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @app.post("/users/", response_model=schemas.User)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_email(db, email=user.email)
-    if db_user:
+async def create_user(user: schemas.UserCreate):
+    db_user = await crud_async.create_user(database, user=user)
+    if db_user is None:
         raise HTTPException(status_code=400, detail="Email already registered")
-    return crud.create_user(db=db, user=user)
+    return db_user
 
 
-@app.get("/users/", response_model=List[schemas.User])
-def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    users = crud.get_users(db, skip=skip, limit=limit)
+# the answers are omitted (unset) with `answers=false`
+@app.get(
+    "/users/", response_model=List[schemas.User], response_model_exclude_unset=True
+)
+async def read_users(
+    request: Request,
+    response: Response,
+    after: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=settings.API_MAX_PAGE_SIZE),
+    answers: bool = True,
+):
+    after_id = decode_cursor_or_400(after)
+    users = await crud_async.get_users(
+        database, after=after_id, limit=limit, with_answers=answers
+    )
+    last_id = users[-1]["id"] if users else None
+    pagination.set_next_link(request, response, last_id, limit, len(users))
     return users
 
 
 @app.get("/users/{user_id}", response_model=schemas.User)
-def read_user(user_id: int, db: Session = Depends(get_db)):
-    db_user = crud.get_user(db, user_id=user_id)
+async def read_user(user_id: int):
+    db_user = await crud_async.get_user(database, user_id=user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
 
 
 @app.post("/users/{user_id}/answers/", response_model=schemas.Answer)
-def create_answer_for_user(
-    user_id: int, answer: schemas.AnswerCreate, db: Session = Depends(get_db)
-):
-    return crud.create_user_answer(db=db, answer=answer, user_id=user_id)
+async def create_answer_for_user(user_id: int, answer: schemas.AnswerCreate):
+    return await crud_async.create_user_answer(database, answer=answer, user_id=user_id)
 
 
 @app.get("/answers/", response_model=List[schemas.Answer])
-def read_items(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    items = crud.get_answers(db, skip=skip, limit=limit)
-    return items
\ No newline at end of file
+async def read_items(
+    request: Request,
+    response: Response,
+    after: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=settings.API_MAX_PAGE_SIZE),
+):
+    after_id = decode_cursor_or_400(after)
+    items = await crud_async.get_answers(database, after=after_id, limit=limit)
+    last_id = items[-1]["id"] if items else None
+    pagination.set_next_link(request, response, last_id, limit, len(items))
+    return items
+
+
+# aggregated statistics, maintained with the submissions
+@app.get("/stats", response_model=schemas.Stats)
+async def read_stats(questionnaire: str = DEFAULT_QUESTIONNAIRE):
+    return await crud_async.get_stats(database, questionnaire)
+
+
+# admin
+def check_admin(authorization: Optional[str] = Header(None)):
+    """Check the admin token, the admin routes are disabled if there is none."""
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if authorization is None or not secrets.compare_digest(
+        authorization, f"Bearer {settings.ADMIN_TOKEN}"
+    ):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+# exports, for analysis ; they contain the names and emails of the users
+@app.get("/export/{table}.csv", dependencies=[Depends(check_admin)])
+def export_csv(
+    table: str, page_size: int = Query(10000, ge=1, le=settings.EXPORT_MAX_PAGE_SIZE)
+):
+    if table not in export.EXPORTS:
+        raise HTTPException(status_code=404, detail="Unknown table")
+    return StreamingResponse(
+        export.iter_csv(engine, table, page_size=page_size),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{table}.csv"'},
+    )
+
+
+# metrics, in the Prometheus text format
+@app.get("/metrics")
+def read_metrics():
+    # the content type already has a charset, not added by Starlette
+    return Response(metrics.latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+
+# reload the loaded questionnaires in this worker ; the other workers reload them
+# when they notice the change of the files
+@app.post("/admin/reload", dependencies=[Depends(check_admin)])
+async def reload_questionnaires(force: bool = False):
+    swapped = await questionnaires.reload(force=force)
+    return {
+        registry.slug: {
+            "version": registry.current.version,
+            "swapped": swapped.get(registry.slug, False),
+        }
+        for registry in questionnaires.registries()
+    }
@@ -0,0 +1,191 @@
+"""Metrics of the app, exposed in the Prometheus text format.
+
+- duration of the HTTP requests, by method, route and status,
+- duration of the phases of the handling of the requests (named spans),
+- number and duration of the database queries, by operation,
+- hits and misses of the caches.
+
+With several worker processes (eg. gunicorn), set the environment variable
+`prometheus_multiproc_dir` to an empty directory before the workers start :
+each process then writes its metrics to files in this directory, and they are
+aggregated when any worker serves `/metrics`. Without this variable, the
+metrics are those of the process that serves `/metrics`.
+"""
+import os
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Iterator, Union
+
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql import ClauseElement
+from starlette.routing import Match
+
+# short phases and queries : from 100 µs to 10 s
+BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    10.0,
+)
+
+REQUEST_DURATION = Histogram(
+    "dataposition_request_duration_seconds",
+    "Duration of the HTTP requests.",
+    ["method", "route", "status"],
+    buckets=BUCKETS,
+)
+PHASE_DURATION = Histogram(
+    "dataposition_phase_duration_seconds",
+    "Duration of the phases of the handling of the requests.",
+    ["phase"],
+    buckets=BUCKETS,
+)
+QUERY_DURATION = Histogram(
+    "dataposition_db_query_duration_seconds",
+    "Duration of the database queries.",
+    ["operation"],
+    buckets=BUCKETS,
+)
+CACHE_LOOKUPS = Counter(
+    "dataposition_cache_lookups",
+    "Lookups in the caches of the app.",
+    ["cache", "result"],
+)
+
+# operations of the queries, other statements are counted as "other"
+OPERATIONS = {"select", "insert", "update", "delete"}
+
+
+@contextmanager
+def span(phase: str) -> Iterator[None]:
+    """Record the duration of a phase of the handling of a request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        PHASE_DURATION.labels(phase).observe(time.perf_counter() - start)
+
+
+def query_operation(query: Union[ClauseElement, str]) -> str:
+    """Operation of a query : select, insert, update, delete or other."""
+    if isinstance(query, str):
+        operation = query.lstrip().split(None, 1)[0].lower() if query.strip() else ""
+    else:
+        operation = getattr(query, "__visit_name__", "")
+    return operation if operation in OPERATIONS else "other"
+
+
+@contextmanager
+def timed_query(query: Union[ClauseElement, str]) -> Iterator[None]:
+    """Record the duration of a database query."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        QUERY_DURATION.labels(query_operation(query)).observe(
+            time.perf_counter() - start
+        )
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Record the duration of the queries of a SQLAlchemy engine.
+
+    The start of a query is stored on its execution context, which is dropped
+    with it, also when the query fails.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_query(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def end_query(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_query_start", None)
+        if start is not None:
+            QUERY_DURATION.labels(query_operation(statement)).observe(
+                time.perf_counter() - start
+            )
+
+
+def cache_lookup(cache: str, hit: bool) -> None:
+    """Count a hit or a miss of a cache."""
+    CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+
+@lru_cache(maxsize=1024)
+def _route_name(app, method: str, path: str) -> str:
+    scope = {"type": "http", "method": method, "path": path}
+    for route in app.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+def route_name(scope) -> str:
+    """Path template of the route of a request, to limit the number of labels.
+
+    The routes are matched again, once for each method and path.
+    """
+    return _route_name(scope["app"], scope["method"], scope["path"])
+
+
+class MetricsMiddleware:
+    """ASGI middleware that records the duration of the HTTP requests."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUEST_DURATION.labels(
+                scope["method"], route_name(scope), str(status)
+            ).observe(time.perf_counter() - start)
+
+
+def latest() -> bytes:
+    """Current metrics, in the Prometheus text format.
+
+    With `prometheus_multiproc_dir`, the metrics of all the processes.
+    """
+    if "prometheus_multiproc_dir" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
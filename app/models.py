@@ -5,37 +5,143 @@ Independent from FastAPI or Pydantic.
 see https://fastapi.tiangolo.com/tutorial/sql-databases/
 """
 
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String
+from typing import Optional
+
+from sqlalchemy import (
+    Boolean,
+    Column,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    UniqueConstraint,
+)
 from sqlalchemy.orm import relationship
 
 from .db.base import Base
 
 
 class Profile(Base):
-    id = Column(String, primary_key=True, index=True)
-    name = Column(String, unique=True, index=True)
+    id = Column(String, primary_key=True)
+    # questionnaire that created the profile, the names are unique in each one
+    questionnaire = Column(String)
+    name = Column(String)
     color = Column(String)
     badge = Column(String)
 
     answers = relationship("Answer", back_populates="profile")
 
+    __table_args__ = (
+        Index("ix_profiles_questionnaire_name", "questionnaire", "name", unique=True),
+    )
+
 
 class User(Base):
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     email = Column(String, unique=True, index=True)
     name = Column(String)
+    # questionnaire of the latest submission, its version, and the resulting
+    # profile ; the result of each questionnaire is in `results`
     selected_profile = Column(String)
+    questionnaire = Column(String)
+    questionnaire_version = Column(String)
 
     answers = relationship("Answer", back_populates="author")
+    results = relationship("Result", back_populates="user")
+
+
+class Result(Base):
+    """Result of the latest submission of a user to a questionnaire."""
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    questionnaire = Column(String, primary_key=True)
+    # version the answers were scored against, and the resulting profile
+    questionnaire_version = Column(String)
+    selected_profile = Column(String)
+
+    user = relationship("User", back_populates="results")
+
+
+class Question(Base):
+    id = Column(Integer, primary_key=True)
+    questionnaire = Column(String)
+    profile_id = Column(String, ForeignKey("profiles.id"))
+    label = Column(String)
+
+    choices = relationship("Choice", back_populates="question")
+
+    __table_args__ = (UniqueConstraint("questionnaire", "profile_id", "label"),)
+
+
+class Choice(Base):
+    id = Column(Integer, primary_key=True)
+    question_id = Column(Integer, ForeignKey("questions.id"))
+    weight = Column(Integer)
+    description = Column(String)
+
+    question = relationship("Question", back_populates="choices")
+
+    __table_args__ = (UniqueConstraint("question_id", "weight", "description"),)
 
 
 class Answer(Base):
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     profile_id = Column(String, ForeignKey("profiles.id"))
-    question = Column(String, index=True)
-    description = Column(String, index=True)
+    # the texts of the question and of the answer are in `questions` and `choices`
+    question_id = Column(Integer, ForeignKey("questions.id"))
+    choice_id = Column(Integer, ForeignKey("choices.id"))
     weight = Column(Integer)
     author_id = Column(Integer, ForeignKey("users.id"))
+    questionnaire = Column(String)
 
     author = relationship("User", back_populates="answers")
     profile = relationship("Profile", back_populates="answers")
+    question_ref = relationship("Question")
+    choice_ref = relationship("Choice")
+
+    # the answers of an author to a questionnaire are read and replaced together
+    __table_args__ = (
+        Index("ix_answers_author_id_questionnaire", "author_id", "questionnaire"),
+    )
+
+    @property
+    def question(self) -> Optional[str]:
+        """Text of the question."""
+        return self.question_ref.label if self.question_ref else None
+
+    @property
+    def description(self) -> Optional[str]:
+        """Text of the answer."""
+        return self.choice_ref.description if self.choice_ref else None
+
+
+# aggregates of the submissions to each questionnaire, updated with the answers
+# (see `crud.stats_updates`) ; `nb` is a number of respondents
+class StatsProfile(Base):
+    """Respondents whose main profile (one of them, if there is a tie) is this one."""
+
+    __tablename__ = "stats_profiles"
+
+    questionnaire = Column(String, primary_key=True)
+    profile_id = Column(String, ForeignKey("profiles.id"), primary_key=True)
+    nb = Column(Integer, nullable=False, default=0)
+
+
+class StatsScore(Base):
+    """Respondents with this score for this profile."""
+
+    __tablename__ = "stats_scores"
+
+    questionnaire = Column(String, primary_key=True)
+    profile_id = Column(String, ForeignKey("profiles.id"), primary_key=True)
+    score = Column(Integer, primary_key=True)
+    nb = Column(Integer, nullable=False, default=0)
+
+
+class StatsChoice(Base):
+    """Respondents who chose this answer."""
+
+    __tablename__ = "stats_choices"
+
+    choice_id = Column(Integer, ForeignKey("choices.id"), primary_key=True)
+    nb = Column(Integer, nullable=False, default=0)
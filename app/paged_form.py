@@ -0,0 +1,61 @@
+"""Paged form : one question at a time, without a request per question.
+
+The page of the paged form (`GET /paged`) is a shell : a script fetches the
+questions of its version of the questionnaire as JSON (`Questionnaire.questions_json`),
+at a URL that includes the version, so browsers and proxies cache it for
+good. The script shows the questions one by one with a progress bar, and keeps
+the answers in the browser (`localStorage`), so the server is only hit again
+for the final submission.
+
+The page carries a progress token, signed by the server : the slug and version
+of the questionnaire, and the time the respondent started. The final
+submission must present a valid token for the questionnaire it answers.
+"""
+from typing import Dict, Optional
+
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+from .questionnaire import Questionnaire
+
+
+class ProgressTokens:
+    """Sign and check the progress tokens of the paged form.
+
+    Parameters
+    ----------
+    secret_key
+        Key of the signatures, shared by all the workers.
+    max_age
+        Seconds during which a token is valid.
+    """
+
+    def __init__(self, secret_key: str, max_age: Optional[int] = None):
+        self.serializer = URLSafeTimedSerializer(secret_key, salt="paged-form")
+        self.max_age = max_age
+
+    def issue(self, questionnaire: Questionnaire) -> str:
+        """Progress token of a respondent who starts answering a questionnaire."""
+        return self.serializer.dumps(
+            {"q": questionnaire.slug, "v": questionnaire.version}
+        )
+
+    def check(self, token: str, slug: str) -> str:
+        """Check a progress token for a questionnaire.
+
+        Returns
+        -------
+        version
+            Version of the questionnaire that the respondent answered.
+
+        Raises
+        ------
+        ValueError
+            If the token is invalid, expired, or for another questionnaire.
+        """
+        try:
+            content: Dict[str, str] = self.serializer.loads(token, max_age=self.max_age)
+        except BadSignature:
+            raise ValueError("Invalid or expired progress token")
+        if content.get("q") != slug:
+            raise ValueError("Progress token for another questionnaire")
+        return content["v"]
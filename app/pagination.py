@@ -0,0 +1,43 @@
+"""Cursor-based (keyset) pagination.
+
+Pages are ordered by primary key ; the cursor of the next page is an opaque
+token that encodes the last primary key of the current page.
+Unlike OFFSET, the cost of fetching a page does not depend on its position.
+"""
+import base64
+from typing import Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+
+def encode_cursor(last_id: int) -> str:
+    """Encode the last id of a page into an opaque cursor."""
+    return base64.urlsafe_b64encode(f"id:{last_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """Decode an opaque cursor into the last id of the previous page.
+
+    Raises
+    ------
+    ValueError
+        If the cursor is invalid.
+    """
+    try:
+        decoded = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        prefix, last_id = decoded.split(":", 1)
+        if prefix != "id":
+            raise ValueError
+        return int(last_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(f"Invalid cursor: {cursor!r}") from None
+
+
+def set_next_link(
+    request: Request, response: Response, last_id: Optional[int], limit: int, nb: int
+) -> None:
+    """Add a `Link` header to the next page, if the current page is full."""
+    if last_id is not None and nb == limit:
+        next_url = request.url.include_query_params(after=encode_cursor(last_id))
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
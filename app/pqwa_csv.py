@@ -2,17 +2,34 @@
 
 PQWA stands for Profiles, Questions, Weights and Answers.
 The current implementation handles CSV files exported from Airtable, with their quirks.
+
+The file is read with the `csv` module of the standard library, into a tuple of
+immutable question records.
 """
-from collections import defaultdict
+import csv
+from collections import Counter
 from pathlib import Path
-from typing import DefaultDict, Dict, List
+from typing import Dict, List, NamedTuple, Tuple
+
+
+class Choice(NamedTuple):
+    """Weighted answer to a question."""
+
+    weight: int
+    answer: str
 
-import pandas as pd
+
+class Question(NamedTuple):
+    """Question of a profile, with its weighted answers sorted by weight."""
+
+    profile: str
+    label: str
+    choices: Tuple[Choice, ...]
 
 
 def load_pqwa(
     fn_csv: Path, pqwa_names: List[str], pedantic: bool = False
-) -> pd.DataFrame:
+) -> Tuple[Question, ...]:
     """Load a CSV file describing a PQWA model.
 
     Parameters
@@ -23,67 +40,60 @@ def load_pqwa(
         List of column names for respectively profile, question, weight, answer.
     pedantic
         If True, print the distribution of weights for debugging or introspection.
+
+    Returns
+    -------
+    questions
+        Questions grouped by profile, with the profiles, and the questions of each
+        profile, ordered as in the CSV file.
     """
     # unpack the column names
     assert len(pqwa_names) == 4
     col_p, col_q, col_w, col_a = pqwa_names
-    # read the CSV file
-    df = pd.read_csv(
-        fn_csv,
-        dtype={
-            col_p: "string",
-            col_q: "string",
-            col_w: int,
-            col_a: "string",
-        },
-    )
-    # check that we read the expected column headers
-    assert set(df.columns.to_list()) == set(pqwa_names)
-    # rename columns
-    df.rename(
-        columns={
-            col_p: "profile",
-            col_q: "question",
-            col_w: "weight",
-            col_a: "answer",
-        },
-        inplace=True,
-    )
-    # FIXME strip leading and trailing '"' around "long text" fields in airtable
-    # the CSV export from airtable has triple double quotes around "long text" fields,
-    # single double quotes around "simple text" fields
-    df["question"] = df["question"].str.strip('"')
-    # drop incomplete lines, including orphan answers
-    #  TODO add warning for dropped answers
-    df.dropna(axis=0, how="any", inplace=True)
+    # the CSV export from airtable starts with a byte order mark
+    with open(fn_csv, newline="", encoding="utf-8-sig") as f_csv:
+        reader = csv.reader(f_csv)
+        header = next(reader)
+        # check that we read the expected column headers
+        assert set(header) == set(pqwa_names)
+        idx_p, idx_q, idx_w, idx_a = [header.index(col) for col in pqwa_names]
+        # Dict[Profile, Dict[Question, Dict[Weight, Answer]]], ordered as in the CSV
+        pqwas: Dict[str, Dict[str, Dict[int, str]]] = {}
+        nb_pqw = 0
+        for row in reader:
+            # drop incomplete lines, including orphan answers
+            #  TODO add warning for dropped answers
+            if len(row) < len(header):
+                continue
+            profile, question, weight, answer = (
+                row[idx_p],
+                row[idx_q],
+                row[idx_w],
+                row[idx_a],
+            )
+            # FIXME strip leading and trailing '"' around "long text" fields in airtable
+            # the CSV export from airtable has triple double quotes around "long text"
+            # fields, single double quotes around "simple text" fields
+            question = question.strip('"')
+            if not (profile and question and weight and answer):
+                continue
+            pqwas.setdefault(profile, {}).setdefault(question, {})[int(weight)] = answer
+            nb_pqw += 1
+    # check that (profile, question, weight) are unique combinations
+    assert nb_pqw == sum(len(wa) for qwa in pqwas.values() for wa in qwa.values())
     if pedantic:
         print("Distribution of weights:")
-        print(df["weight"].value_counts().sort_index())
-    # check that (profile, question, weight) are unique combinations:
-    # the sorted list of values is equal to the sorted set of values
-    all_pqw = list(
-        sorted(df[["profile", "question", "weight"]].itertuples(index=False))
-    )
-    assert all_pqw == list(sorted(set(all_pqw)))
-    #
-    return df
-
-
-def df_to_nesteddict(
-    df: pd.DataFrame,
-) -> DefaultDict[str, DefaultDict[str, Dict[int, str]]]:
-    """Convert a DataFrame to a nested dictionary.
-
-    The nested dictionary is :
-    Dict[Profile, Dict[Question, Dict[Weight, Answer]]]
-    """
-    # TODO use Multi-Index as intermediary structure to generate nested dictionary ?
-    res: DefaultDict[str, DefaultDict[str, Dict[int, str]]] = defaultdict(
-        lambda: defaultdict(dict)
+        weights = Counter(
+            w for qwa in pqwas.values() for wa in qwa.values() for w in wa
+        )
+        for w, count in sorted(weights.items()):
+            print(w, count)
+    return tuple(
+        Question(
+            profile=p,
+            label=q,
+            choices=tuple(Choice(w, a) for w, a in sorted(wa.items())),
+        )
+        for p, qwa in pqwas.items()
+        for q, wa in qwa.items()
     )
-    # keep the profiles, and the questions in each profile, ordered as in the CSV (sort=False)
-    for p, qwa in df.groupby(by=["profile"], sort=False):
-        for q, wa in qwa.groupby(by=["question"], sort=False):
-            for w, a in sorted(wa[["weight", "answer"]].itertuples(index=False)):
-                res[p][q][w] = a
-    return res
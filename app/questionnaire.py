@@ -0,0 +1,406 @@
+"""Questionnaire : profiles, questions and weighted answers, and their scoring model.
+
+A questionnaire is identified by a slug, it is built from its profiles file and
+its PQWA file ; its version is the hash of their contents.
+The registry holds the current version of a questionnaire. It can reload the
+data files when they change, either by watching them or on demand : the new
+version is built off the event loop, prepared (eg. its form is rendered), then
+swapped in with a single assignment, so each request sees a complete version.
+Requests should read `registry.current` once and use this version until they
+respond.
+The catalog holds the registries of the questionnaires served by the app : the
+default questionnaire, and the questionnaires in a directory, loaded on first
+use and kept in a LRU cache.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from itertools import groupby
+from operator import attrgetter
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .form_cache import file_hash
+from .metrics import cache_lookup
+from .pqwa_csv import load_pqwa
+from .scoring import QuestionTuple, ScoringModel
+
+logger = logging.getLogger(__name__)
+
+
+class Questionnaire:
+    """Version of the questionnaire.
+
+    Attributes
+    ----------
+    slug
+        Identifier of the questionnaire.
+    version
+        Hash of the content of the data files.
+    profiles
+        Profiles, as dicts with keys id, name, color, badge.
+    list_questions
+        Questions, as tuples (question form id, question label, weighted answers).
+    scoring_model
+        Scoring model for the questions.
+    questions_json
+        Questions and their weighted answers, serialized once as compact JSON
+        for the paged form.
+    profiles_css
+        Stylesheet of the colors of the profiles.
+    """
+
+    def __init__(
+        self,
+        slug: str,
+        version: str,
+        profiles: List[Dict[str, str]],
+        pqwa_questions: Sequence,
+    ):
+        self.slug = slug
+        self.version = version
+        self.profiles = profiles
+        # maps from/to profile id
+        self.p_name2id = {p["name"]: p["id"] for p in profiles}
+        self.p_id2name = {p["id"]: p["name"] for p in profiles}
+        self.p_id2badge = {p["id"]: p["badge"] for p in profiles}
+        self.p_id2color = {p["id"]: p["color"] for p in profiles}
+        self.list_questions: List[QuestionTuple] = []
+        for p, p_questions in groupby(pqwa_questions, key=attrgetter("profile")):
+            p_id = self.p_name2id[p]
+            for i, question in enumerate(p_questions, start=1):
+                # assign a distinct id to each question
+                q_form_id = f"{p_id}-{i}"
+                q_choices = [(w, a) for w, a in question.choices]
+                self.list_questions.append((q_form_id, question.label, q_choices))
+        self.qid2q = {
+            q_form_id: q_label for q_form_id, q_label, _ in self.list_questions
+        }
+        self.qid2w2a = {
+            q_form_id: {w: a for w, a in q_choices}
+            for q_form_id, _, q_choices in self.list_questions
+        }
+        self.scoring_model = ScoringModel(self.list_questions)
+        self.questions_json = json.dumps(
+            {
+                "slug": slug,
+                "version": version,
+                "questions": [
+                    {"id": q_form_id, "label": q_label, "choices": q_choices}
+                    for q_form_id, q_label, q_choices in self.list_questions
+                ],
+            },
+            ensure_ascii=False,
+            separators=(",", ":"),
+        ).encode()
+        self.profiles_css = "".join(
+            f".profile-{p_id}{{background-color:{p_color};color:white}}\n"
+            for p_id, p_color in self.p_id2color.items()
+        ).encode()
+
+
+def load_questionnaire(
+    slug: str, fn_profiles: Path, fn_pqwa: Path, pqwa_names: List[str]
+) -> Questionnaire:
+    """Load a questionnaire from its profiles file and its PQWA file."""
+    version = hashlib.sha256(
+        (file_hash(fn_profiles) + file_hash(fn_pqwa)).encode()
+    ).hexdigest()[:16]
+    # profiles: id, name, color, badge
+    with open(fn_profiles) as f_profiles:
+        profiles = json.load(f_profiles)
+    pqwa_questions = load_pqwa(fn_pqwa, pqwa_names)
+    return Questionnaire(slug, version, profiles, pqwa_questions)
+
+
+# called with the new version before it is swapped in
+Preparer = Callable[[Questionnaire], Awaitable[None]]
+# called with the previous and the new version after the new one is swapped in
+Listener = Callable[[Questionnaire, Questionnaire], None]
+
+
+class QuestionnaireRegistry:
+    """Current version of a questionnaire, reloaded when its data files change.
+
+    The previous version is kept, to score the forms that were served before a
+    reload.
+
+    Parameters
+    ----------
+    slug
+        Identifier of the questionnaire.
+    fn_profiles
+        Path to the profiles file.
+    fn_pqwa
+        Path to the PQWA file.
+    pqwa_names
+        Column names in the PQWA file.
+    """
+
+    def __init__(
+        self, slug: str, fn_profiles: Path, fn_pqwa: Path, pqwa_names: List[str]
+    ):
+        self.slug = slug
+        self._args = (slug, fn_profiles, fn_pqwa, pqwa_names)
+        self._paths = (fn_profiles, fn_pqwa)
+        self._stats = self._stat()
+        self.current = load_questionnaire(*self._args)
+        self.previous: Optional[Questionnaire] = None
+        self._preparers: List[Preparer] = []
+        self._listeners: List[Listener] = []
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _stat(self) -> Tuple[Tuple[int, int], ...]:
+        """Modification time and size of the data files."""
+        stats = [os.stat(path) for path in self._paths]
+        return tuple((st.st_mtime_ns, st.st_size) for st in stats)
+
+    def get(self, version: Optional[str] = None) -> Questionnaire:
+        """Get a version of the questionnaire : the current one, or the previous one."""
+        previous = self.previous
+        if previous is not None and version == previous.version:
+            return previous
+        return self.current
+
+    def prepare(self, preparer: Preparer) -> Preparer:
+        """Register a coroutine function to prepare each new version, before the swap."""
+        self._preparers.append(preparer)
+        return preparer
+
+    def on_swap(self, listener: Listener) -> Listener:
+        """Register a function called with the previous and new versions, after the swap."""
+        self._listeners.append(listener)
+        return listener
+
+    def changed(self) -> bool:
+        """Check if the data files have been modified since the last (re)load."""
+        return self._stat() != self._stats
+
+    async def reload(self, force: bool = False) -> bool:
+        """Reload the questionnaire if its data files have changed.
+
+        Parameters
+        ----------
+        force
+            If True, reload even if the files seem unchanged.
+
+        Returns
+        -------
+        swapped
+            True if a new version has been swapped in.
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not (force or self.changed()):
+                return False
+            # files that fail to load are only retried once they change again
+            self._stats = self._stat()
+            start = time.perf_counter()
+            # parse the files and build the model in a thread
+            loop = asyncio.get_event_loop()
+            new = await loop.run_in_executor(None, load_questionnaire, *self._args)
+            if new.version == self.current.version:
+                return False
+            for preparer in self._preparers:
+                await preparer(new)
+            built = time.perf_counter()
+            # atomic swap : requests read `current` once
+            previous, self.current = self.current, new
+            self.previous = previous
+            swapped = time.perf_counter()
+            for listener in self._listeners:
+                listener(previous, new)
+            logger.info(
+                "Questionnaire %s %s swapped in : built in %.1f ms, swapped in %.1f µs",
+                self.slug,
+                new.version,
+                (built - start) * 1e3,
+                (swapped - built) * 1e6,
+            )
+            return True
+
+
+# identifiers of questionnaires, also used as directory names
+SLUG_PATTERN = re.compile(r"[a-z0-9][a-z0-9_-]*")
+
+
+def questionnaire_paths(
+    directory: Path, slug: str, pqwa_names: List[str]
+) -> Optional[Tuple[Path, Path, List[str]]]:
+    """Paths of the data files and column names of a questionnaire in a directory.
+
+    Returns None if there is no questionnaire for this slug.
+    """
+    if not SLUG_PATTERN.fullmatch(slug):
+        return None
+    q_dir = directory / slug
+    fn_profiles, fn_pqwa = q_dir / "profiles.json", q_dir / "pqwa.csv"
+    if not (fn_profiles.is_file() and fn_pqwa.is_file()):
+        return None
+    fn_names = q_dir / "pqwa_names.json"
+    if fn_names.is_file():
+        with open(fn_names) as f_names:
+            pqwa_names = json.load(f_names)
+    return fn_profiles, fn_pqwa, pqwa_names
+
+
+class QuestionnaireCatalog:
+    """Registries of the questionnaires, by slug.
+
+    The default questionnaire is loaded at once and always kept. The other
+    questionnaires are read from a directory, with a subdirectory for each slug
+    containing `profiles.json`, `pqwa.csv` and, if the column names of the PQWA
+    file are not the default ones, `pqwa_names.json` (list of the column names
+    for respectively profile, question, weight, answer).
+    They are loaded on first use, and the least recently used are dropped when
+    there are more than `max_size`.
+
+    Parameters
+    ----------
+    default_slug
+        Slug of the default questionnaire.
+    fn_profiles
+        Path to the profiles file of the default questionnaire.
+    fn_pqwa
+        Path to the PQWA file of the default questionnaire.
+    pqwa_names
+        Default column names in the PQWA files.
+    directory
+        Directory of the other questionnaires.
+    max_size
+        Maximal number of questionnaires loaded, besides the default one.
+    """
+
+    def __init__(
+        self,
+        default_slug: str,
+        fn_profiles: Path,
+        fn_pqwa: Path,
+        pqwa_names: List[str],
+        directory: Path,
+        max_size: int = 32,
+    ):
+        self.default = QuestionnaireRegistry(
+            default_slug, fn_profiles, fn_pqwa, pqwa_names
+        )
+        self.pqwa_names = pqwa_names
+        self.directory = directory
+        self.max_size = max_size
+        # registries of the other questionnaires, from least to most recently used
+        self._registries: "OrderedDict[str, QuestionnaireRegistry]" = OrderedDict()
+        self._preparers: List[Preparer] = []
+        self._listeners: List[Listener] = []
+        self._evict_listeners: List[Callable[[Questionnaire], None]] = []
+        self._lock: Optional[asyncio.Lock] = None
+
+    def registries(self) -> List[QuestionnaireRegistry]:
+        """Registries of the loaded questionnaires."""
+        return [self.default, *self._registries.values()]
+
+    def prepare(self, preparer: Preparer) -> Preparer:
+        """Register a coroutine function to prepare each new version, before the swap.
+
+        It is also called with the first version of each questionnaire loaded
+        after the default one.
+        """
+        self._preparers.append(preparer)
+        self.default.prepare(preparer)
+        return preparer
+
+    def on_swap(self, listener: Listener) -> Listener:
+        """Register a function called with the previous and new versions, after the swap."""
+        self._listeners.append(listener)
+        self.default.on_swap(listener)
+        return listener
+
+    def on_evict(
+        self, listener: Callable[[Questionnaire], None]
+    ) -> Callable[[Questionnaire], None]:
+        """Register a function called with each version of evicted questionnaires.
+
+        It is called with the current version, then with the previous one if
+        it was kept.
+        """
+        self._evict_listeners.append(listener)
+        return listener
+
+    def paths(self, slug: str) -> Optional[Tuple[Path, Path, List[str]]]:
+        """Paths of the data files and column names of a questionnaire, if it exists."""
+        return questionnaire_paths(self.directory, slug, self.pqwa_names)
+
+    async def get(self, slug: str) -> Optional[QuestionnaireRegistry]:
+        """Get the registry of a questionnaire, load it if needed.
+
+        Returns None if there is no questionnaire for this slug.
+        """
+        if slug == self.default.slug:
+            return self.default
+        registry = self._registries.get(slug)
+        cache_lookup("questionnaire", hit=registry is not None)
+        if registry is not None:
+            self._registries.move_to_end(slug)
+            return registry
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            # loaded by a concurrent request
+            registry = self._registries.get(slug)
+            if registry is not None:
+                return registry
+            loop = asyncio.get_event_loop()
+            paths = await loop.run_in_executor(None, self.paths, slug)
+            if paths is None:
+                return None
+            registry = await loop.run_in_executor(
+                None, QuestionnaireRegistry, slug, *paths
+            )
+            for preparer in self._preparers:
+                await preparer(registry.current)
+                registry.prepare(preparer)
+            for listener in self._listeners:
+                registry.on_swap(listener)
+            self._registries[slug] = registry
+            while len(self._registries) > self.max_size:
+                _, evicted = self._registries.popitem(last=False)
+                versions = [evicted.current]
+                if evicted.previous is not None:
+                    versions.append(evicted.previous)
+                for evict_listener in self._evict_listeners:
+                    for version in versions:
+                        evict_listener(version)
+            logger.info("Questionnaire %s loaded", slug)
+            return registry
+
+    async def reload(self, force: bool = False) -> Dict[str, bool]:
+        """Reload the loaded questionnaires whose data files have changed.
+
+        Returns
+        -------
+        swapped
+            For each loaded questionnaire, True if a new version has been swapped in.
+        """
+        return {
+            registry.slug: await registry.reload(force=force)
+            for registry in self.registries()
+        }
+
+    async def watch(self, interval: float) -> None:
+        """Check the data files every `interval` seconds, and reload them if they change.
+
+        Errors in the new files are logged, the current versions are kept.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            for registry in self.registries():
+                try:
+                    await registry.reload()
+                except Exception:
+                    logger.exception(
+                        "Failed to reload the questionnaire %s", registry.slug
+                    )
@@ -0,0 +1,348 @@
+"""Re-score the stored answers against the current PQWA model.
+
+When the weights in the PQWA file change, the results (`selected_profile`) of
+existing users, the weights of their answers and the statistics are stale.
+This command reads the answers grouped by user, in chunks, scores each chunk
+in a vectorized way and bulk updates the selected profiles, the weights (and
+choices) of the answers, and the aggregates of the statistics.
+Each chunk is read and updated in its own short write transaction, so the
+submissions of the app only wait for one chunk, and a user cannot submit again
+between the read and the update of their answers.
+Memory use is bounded by the size of a chunk.
+The users who answered the questionnaire are re-scored against its current
+version, which is stored in their result as its `questionnaire_version` ; the
+users whose latest submission is to the questionnaire also get the new result
+in their own columns.
+
+The weight of each stored answer is looked up in the current model from its
+question and description, it falls back to the stored weight if the description
+is not in the model anymore ; answers to questions that are not in the model
+anymore are ignored.
+
+Usage (from the root of the repository) :
+
+    python -m app.rescore --chunk-size 10000
+    python -m app.rescore --questionnaire my-questionnaire
+"""
+import argparse
+import logging
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+from sqlalchemy import bindparam, select, text
+from sqlalchemy.engine import Connection
+
+from . import crud, models
+from .config import (
+    CSV_PQWA,
+    DEFAULT_QUESTIONNAIRE,
+    DIR_QUESTIONNAIRES,
+    JSON_PROFILES,
+    PQWA_NAMES,
+)
+from .db.session import SessionLocal, engine, write_transaction
+from .questionnaire import Questionnaire, load_questionnaire, questionnaire_paths
+
+logger = logging.getLogger(__name__)
+
+# one stored answer: author_id, id, profile_id, question, description, weight,
+# choice_id
+AnswerRow = Tuple[int, int, str, str, str, int, int]
+
+
+def read_answer_chunk(
+    conn: Connection, questionnaire: str, after: int, chunk_size: int
+) -> List[Tuple[int, List[AnswerRow]]]:
+    """Read a chunk of about `chunk_size` answers, grouped by author.
+
+    The answers to the questionnaire are read from the authors whose id is
+    greater than `after` : the last author of the previous chunk.
+    The answers of an author are never split across chunks. The chunk is empty
+    after the last author.
+    """
+    answers = models.Answer.__table__
+    questions = models.Question.__table__
+    choices = models.Choice.__table__
+    query = (
+        select(
+            [
+                answers.c.author_id,
+                answers.c.id,
+                answers.c.profile_id,
+                questions.c.label,
+                choices.c.description,
+                answers.c.weight,
+                answers.c.choice_id,
+            ]
+        )
+        .select_from(
+            answers.join(questions, answers.c.question_id == questions.c.id).join(
+                choices, answers.c.choice_id == choices.c.id
+            )
+        )
+        .where(
+            (answers.c.questionnaire == questionnaire)
+            & (answers.c.author_id > bindparam("after"))
+        )
+        .order_by(answers.c.author_id)
+    )
+    rows = conn.execute(query.limit(chunk_size), after=after).fetchall()
+    if len(rows) == chunk_size:
+        last = rows[-1][0]
+        if rows[0][0] == last:
+            # a single author, with more answers than a chunk
+            rows = conn.execute(
+                query.where(answers.c.author_id <= last), after=after
+            ).fetchall()
+        else:
+            # the answers of the last author can go on in the next chunk
+            rows = [row for row in rows if row[0] != last]
+    groups: List[Tuple[int, List[AnswerRow]]] = []
+    for row in rows:
+        if not groups or groups[-1][0] != row[0]:
+            groups.append((row[0], []))
+        groups[-1][1].append(tuple(row))
+    return groups
+
+
+def get_questionnaire(slug: str) -> Questionnaire:
+    """Load the current version of a questionnaire."""
+    if slug == DEFAULT_QUESTIONNAIRE:
+        paths = (Path(JSON_PROFILES), Path(CSV_PQWA), PQWA_NAMES)
+    else:
+        paths = questionnaire_paths(Path(DIR_QUESTIONNAIRES), slug, PQWA_NAMES)
+        if paths is None:
+            raise ValueError(f"Unknown questionnaire: {slug}")
+    return load_questionnaire(slug, *paths)
+
+
+def rescore(
+    questionnaire_slug: str = DEFAULT_QUESTIONNAIRE,
+    chunk_size: int = 10000,
+    dry_run: bool = False,
+) -> Dict[str, int]:
+    """Re-score the users who answered a questionnaire, chunk by chunk.
+
+    The weights of their answers, and the choices they reference, are updated
+    to the current version, and the aggregates of the statistics with them.
+    Each chunk is committed in its own write transaction, see
+    `db.session.write_transaction` ; an interrupted run leaves the chunks
+    that were committed re-scored, and can be run again.
+
+    Parameters
+    ----------
+    questionnaire_slug
+        Slug of the questionnaire.
+    chunk_size
+        Number of answers processed at once.
+    dry_run
+        If True, compute the new profiles but do not update the database : the
+        chunks are only read.
+
+    Returns
+    -------
+    stats
+        Number of answers, users, updated users, updated answers and ignored
+        answers.
+    """
+    questionnaire = get_questionnaire(questionnaire_slug)
+    scoring_model = questionnaire.scoring_model
+    if not dry_run:
+        # the choices of the current version, in the database
+        db = SessionLocal()
+        try:
+            crud.seed_profiles(db, questionnaire.slug, questionnaire.profiles)
+            scoring_model.bind_db_ids(
+                *crud.seed_questions(
+                    db, questionnaire.slug, scoring_model.question_rows()
+                )
+            )
+        finally:
+            db.close()
+    list_questions = questionnaire.list_questions
+    # map stored answers to question indices and weights in the current model
+    q2idx = {
+        (scoring_model.profile_ids[p_idx], q_label): q_idx
+        for q_idx, (p_idx, q_label) in enumerate(
+            zip(scoring_model.question_profiles, scoring_model.labels)
+        )
+    }
+    a2w = [{a: w for w, a in q_choices} for _, _, q_choices in list_questions]
+    p_names = np.array(
+        [questionnaire.p_id2name[p_id] for p_id in scoring_model.profile_ids]
+    )
+    nb_questions = len(list_questions)
+
+    users = models.User.__table__
+    answers = models.Answer.__table__
+    results = models.Result.__table__
+    update_answer = (
+        answers.update()
+        .where(answers.c.id == bindparam("answer_id"))
+        .values(weight=bindparam("weight"), choice_id=bindparam("choice_id"))
+    )
+    # the latest submission of the user is to the questionnaire
+    update = (
+        users.update()
+        .where(
+            (users.c.id == bindparam("user_id"))
+            & (users.c.questionnaire == questionnaire.slug)
+        )
+        .values(
+            selected_profile=bindparam("selected_profile"),
+            questionnaire_version=questionnaire.version,
+        )
+    )
+    stats = {
+        "answers": 0,
+        "users": 0,
+        "updated_users": 0,
+        "updated_answers": 0,
+        "ignored_answers": 0,
+    }
+    after = 0
+    while True:
+        # read-only connection for a dry run
+        with (engine.connect() if dry_run else write_transaction()) as conn:
+            groups = read_answer_chunk(conn, questionnaire.slug, after, chunk_size)
+            if not groups:
+                break
+            user_ids = [author_id for author_id, _ in groups]
+            weights = np.zeros((len(groups), nb_questions), dtype=np.int64)
+            answer_params = []
+            # new and previous answers of the users whose answers change
+            submissions = []
+            for u_idx, (_, rows) in enumerate(groups):
+                new_answers, previous_answers = [], []
+                for _, a_id, profile_id, question, description, weight, c_id in rows:
+                    previous = {
+                        "profile_id": profile_id,
+                        "weight": weight,
+                        "choice_id": c_id,
+                    }
+                    new = previous
+                    q_idx = q2idx.get((profile_id, question))
+                    if q_idx is None:
+                        stats["ignored_answers"] += 1
+                    else:
+                        new_weight = a2w[q_idx].get(description, weight)
+                        weights[u_idx, q_idx] = new_weight
+                        if new_weight != weight:
+                            # the choices are only seeded for an actual run
+                            c_id = (
+                                None
+                                if dry_run
+                                else scoring_model.db_choice_ids[q_idx][new_weight]
+                            )
+                            new = dict(previous, weight=new_weight, choice_id=c_id)
+                            answer_params.append(
+                                {
+                                    "answer_id": a_id,
+                                    "weight": new_weight,
+                                    "choice_id": c_id,
+                                }
+                            )
+                    new_answers.append(new)
+                    previous_answers.append(previous)
+                if new_answers != previous_answers:
+                    submissions.append((new_answers, previous_answers))
+                stats["answers"] += len(rows)
+            scores = scoring_model.score_batch(weights)
+            main_mask = scoring_model.main_profiles(scores)
+            selected_profiles = ["|".join(p_names[mask]) for mask in main_mask]
+            # current results, to only update the users whose profile or
+            # version changes
+            old_profiles = {
+                user_id: (selected_profile, version)
+                for user_id, selected_profile, version in conn.execute(
+                    select(
+                        [
+                            results.c.user_id,
+                            results.c.selected_profile,
+                            results.c.questionnaire_version,
+                        ]
+                    ).where(
+                        (results.c.questionnaire == questionnaire.slug)
+                        & results.c.user_id.between(user_ids[0], user_ids[-1])
+                    )
+                )
+            }
+            params = [
+                {"user_id": user_id, "selected_profile": selected_profile}
+                for user_id, selected_profile in zip(user_ids, selected_profiles)
+                if old_profiles.get(user_id)
+                != (selected_profile, questionnaire.version)
+            ]
+            if not dry_run:
+                if params:
+                    conn.execute(
+                        text(crud.UPSERT_RESULT_SQL),
+                        [
+                            dict(
+                                param,
+                                questionnaire=questionnaire.slug,
+                                questionnaire_version=questionnaire.version,
+                            )
+                            for param in params
+                        ],
+                    )
+                    conn.execute(update, params)
+                if answer_params:
+                    conn.execute(update_answer, answer_params)
+                for statement, stats_params in crud.batch_stats_updates(
+                    questionnaire.slug, submissions, conn.dialect.name
+                ):
+                    conn.execute(statement, stats_params)
+            stats["users"] += len(user_ids)
+            stats["updated_users"] += len(params)
+            stats["updated_answers"] += len(answer_params)
+        after = groups[-1][0]
+        logger.info("%d answers processed", stats["answers"])
+    return stats
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description="Re-score the stored answers against the current PQWA model."
+    )
+    parser.add_argument(
+        "--questionnaire",
+        default=DEFAULT_QUESTIONNAIRE,
+        help="slug of the questionnaire",
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=10000, help="number of answers per chunk"
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="do not update the database"
+    )
+    args = parser.parse_args()
+    start = time.perf_counter()
+    try:
+        stats = rescore(
+            questionnaire_slug=args.questionnaire,
+            chunk_size=args.chunk_size,
+            dry_run=args.dry_run,
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    elapsed = time.perf_counter() - start
+    logger.info(
+        "%d answers of %d users re-scored in %.1f s (%.0f answers/s), "
+        "%d users and %d answers %s, %d answers ignored",
+        stats["answers"],
+        stats["users"],
+        elapsed,
+        stats["answers"] / elapsed if elapsed else 0,
+        stats["updated_users"],
+        stats["updated_answers"],
+        "would be updated" if args.dry_run else "updated",
+        stats["ignored_answers"],
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,7 @@
 see https://fastapi.tiangolo.com/tutorial/sql-databases/
 """
 
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from pydantic import BaseModel
 
@@ -12,6 +12,7 @@ class ProfileBase(BaseModel):
     name: str
     color: str
     badge: str
+    questionnaire: Optional[str] = None
 
 
 class ProfileCreate(ProfileBase):
@@ -26,10 +27,11 @@ class Profile(ProfileBase):
 
 
 class AnswerBase(BaseModel):
-    profile: str
+    profile_id: str
     question: str
     description: str
     weight: int
+    questionnaire: Optional[str] = None
 
 
 class AnswerCreate(AnswerBase):
@@ -39,6 +41,8 @@ class AnswerCreate(AnswerBase):
 class Answer(AnswerBase):
     id: int
     author_id: int
+    question_id: Optional[int] = None
+    choice_id: Optional[int] = None
 
     class Config:
         orm_mode = True
@@ -54,9 +58,62 @@ class UserCreate(UserBase):
     pass
 
 
-class User(UserBase):
+class UserSummary(UserBase):
     id: int
-    answers: List[Answer] = []
+    questionnaire: Optional[str] = None
+    questionnaire_version: Optional[str] = None
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+
+class User(UserSummary):
+    answers: List[Answer] = []
+
+
+class ProfileStats(BaseModel):
+    profile_id: str
+    # number of respondents with this main profile (ties count for each profile)
+    main: int
+    # number of respondents by score
+    scores: Dict[int, int]
+
+
+class QuestionStats(BaseModel):
+    question_id: int
+    profile_id: str
+    question: str
+    # number of respondents by weight of their answer
+    weights: Dict[int, int]
+
+
+class Stats(BaseModel):
+    questionnaire: str
+    respondents: int
+    profiles: List[ProfileStats]
+    questions: List[QuestionStats]
+
+
+# batch of submissions, eg. synced by the kiosks of a workshop
+class SubmissionCreate(BaseModel):
+    email: str
+    name: str
+    # weight of the answer to each question, by question form id
+    answers: Dict[str, int]
+    # version of the questionnaire that was answered ; the current one if it is
+    # not set or no longer available
+    questionnaire_version: Optional[str] = None
+
+
+class SubmissionResult(BaseModel):
+    # position of the submission in the batch
+    index: int
+    email: str
+    saved: bool
+    # why the submission was rejected, if it was
+    error: Optional[str] = None
+    user_id: Optional[int] = None
+    questionnaire_version: Optional[str] = None
+    # score of each profile, by profile id, and the main profiles (names)
+    scores: Dict[str, int] = {}
+    main_profiles: List[str] = []
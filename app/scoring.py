@@ -0,0 +1,179 @@
+"""Scoring of the answers to a questionnaire.
+
+The scoring model is built once from the list of questions.
+Questions and profiles get integer indices, and the profile of each question is
+encoded in a weight matrix of profiles by questions.
+Scoring a submission is then a gather of the weights of its answers, followed by
+a matrix-vector product ; scoring many submissions at once is a matrix product.
+"""
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+# question form id, question label, weighted answers
+QuestionTuple = Tuple[str, str, List[Tuple[int, str]]]
+
+
+class ScoringModel:
+    """Scoring model for a list of questions.
+
+    Attributes
+    ----------
+    profile_ids
+        Profile ids, by profile index, in order of appearance in the questions.
+    question_ids
+        Question form ids, by question index.
+    question_profiles
+        Profile index of each question.
+    weight_matrix
+        Matrix (profiles x questions) of the contribution of the weight of the
+        answer to each question, to the score of each profile.
+    db_question_ids, db_choice_ids
+        Ids of the questions, and of their choices by weight, in the database ;
+        set by `bind_db_ids`.
+    """
+
+    def __init__(self, list_questions: Sequence[QuestionTuple]):
+        self.profile_ids: List[str] = []
+        p_id2idx: Dict[str, int] = {}
+        question_profiles = []
+        for q_form_id, _, _ in list_questions:
+            p_id = q_form_id.split("-", 1)[0]
+            if p_id not in p_id2idx:
+                p_id2idx[p_id] = len(self.profile_ids)
+                self.profile_ids.append(p_id)
+            question_profiles.append(p_id2idx[p_id])
+        self.question_ids = [q_form_id for q_form_id, _, _ in list_questions]
+        self.question_profiles = np.array(question_profiles, dtype=np.intp)
+        # name of the field of each question in the HTML form
+        self.field_names = [f"{q_form_id}-question" for q_form_id in self.question_ids]
+        # label and answer for each weight, to store the answers
+        self.labels = [q_label for _, q_label, _ in list_questions]
+        self.answers: List[Dict[int, str]] = [
+            dict(q_choices) for _, _, q_choices in list_questions
+        ]
+        # valid weights as strings, to check form data without parsing it first
+        self._str2weight: List[Dict[str, int]] = [
+            {str(w): w for w in w2a} for w2a in self.answers
+        ]
+        # each question counts for its profile
+        nb_questions = len(self.question_ids)
+        self.weight_matrix = np.zeros(
+            (len(self.profile_ids), nb_questions), dtype=np.int64
+        )
+        self.weight_matrix[self.question_profiles, np.arange(nb_questions)] = 1
+        self.db_question_ids: Optional[List[int]] = None
+        self.db_choice_ids: Optional[List[Dict[int, int]]] = None
+
+    def question_rows(self) -> List[Tuple[str, str, List[Tuple[int, str]]]]:
+        """Describe the questions as (profile id, label, weighted answers)."""
+        return [
+            (self.profile_ids[p_idx], label, sorted(w2a.items()))
+            for p_idx, label, w2a in zip(
+                self.question_profiles.tolist(), self.labels, self.answers
+            )
+        ]
+
+    def bind_db_ids(
+        self, db_question_ids: List[int], db_choice_ids: List[Dict[int, int]]
+    ) -> None:
+        """Set the ids of the questions, and of their choices by weight, in the database.
+
+        See `crud.seed_questions`.
+        """
+        self.db_question_ids = db_question_ids
+        self.db_choice_ids = db_choice_ids
+
+    def parse_form(self, form_data: Mapping[str, str]) -> np.ndarray:
+        """Get the vector of weights of the answers to all questions, from form data.
+
+        Raises
+        ------
+        ValueError
+            If a question has no answer or an answer with an unknown weight.
+        """
+        weights = np.empty(len(self.field_names), dtype=np.int64)
+        for q_idx, (field_name, str2weight) in enumerate(
+            zip(self.field_names, self._str2weight)
+        ):
+            value = form_data.get(field_name)
+            try:
+                weights[q_idx] = str2weight[value]
+            except KeyError:
+                raise ValueError(f"Invalid answer for {field_name}: {value!r}")
+        return weights
+
+    def parse_answers(self, answers: Mapping[str, int]) -> np.ndarray:
+        """Get the vector of weights of the answers to all questions, from a map.
+
+        Parameters
+        ----------
+        answers
+            Weight of the answer to each question, by question form id.
+
+        Raises
+        ------
+        ValueError
+            If a question has no answer or an answer with an unknown weight, or
+            if an answer is to an unknown question.
+        """
+        unknown = set(answers).difference(self.question_ids)
+        if unknown:
+            raise ValueError(f"Unknown questions: {', '.join(sorted(unknown))}")
+        weights = np.empty(len(self.question_ids), dtype=np.int64)
+        for q_idx, (q_form_id, w2a) in enumerate(zip(self.question_ids, self.answers)):
+            weight = answers.get(q_form_id)
+            if weight not in w2a:
+                raise ValueError(f"Invalid answer for {q_form_id}: {weight!r}")
+            weights[q_idx] = weight
+        return weights
+
+    def prep_answers(self, weights: np.ndarray) -> List[Dict]:
+        """Describe the answers as dicts of column values for `models.Answer`.
+
+        Requires the ids of the questions and choices in the database, see
+        `bind_db_ids`.
+        """
+        if self.db_question_ids is None or self.db_choice_ids is None:
+            raise RuntimeError("The questions are not bound to the database")
+        return [
+            {
+                "profile_id": self.profile_ids[p_idx],
+                "question_id": question_id,
+                "choice_id": w2id[w],
+                "weight": w,
+            }
+            for p_idx, question_id, w2id, w in zip(
+                self.question_profiles.tolist(),
+                self.db_question_ids,
+                self.db_choice_ids,
+                weights.tolist(),
+            )
+        ]
+
+    def score(self, weights: np.ndarray) -> np.ndarray:
+        """Compute the score of each profile for one vector of weights."""
+        return self.weight_matrix @ weights
+
+    def score_batch(self, weights: np.ndarray) -> np.ndarray:
+        """Compute the scores of many submissions at once.
+
+        Parameters
+        ----------
+        weights
+            Matrix (submissions x questions) of the weights of the answers.
+
+        Returns
+        -------
+        scores
+            Matrix (submissions x profiles) of scores.
+        """
+        return weights @ self.weight_matrix.T
+
+    def main_profiles(self, scores: np.ndarray) -> np.ndarray:
+        """Get the mask of the main profiles : currently the argmax of the scores.
+
+        Works for one vector of scores, or a matrix (submissions x profiles).
+        There can be several main profiles in case of a tie.
+        """
+        return scores == scores.max(axis=-1, keepdims=True)
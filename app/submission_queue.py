@@ -0,0 +1,311 @@
+"""Write-behind queue of the submissions, in a local SQLite file.
+
+In write-behind mode, `POST /` scores the answers and renders the summary
+inline, but only appends the submission to this queue ; a background task of
+each worker drains the queue in batches, and saves each batch in the database
+in a single transaction (`crud_async.save_submissions`). The response then
+does not wait for the database.
+
+The queue is shared by the workers of a host. A worker claims a batch before
+saving it, and deletes it once it is saved. A batch whose worker died before
+deleting it is claimed again after `claim_timeout` seconds, so submissions
+are saved at least once : saving a submission again replaces its answers
+with the same answers, and leaves the statistics unchanged.
+
+When a batch fails, its submissions are saved one by one, so that a
+submission that cannot be saved does not hold back the others. Each failure
+of a submission is counted ; after `max_attempts` failures, the submission is
+moved to the `failed_submissions` table of the queue, and logged. It can be
+queued again with :
+
+    INSERT INTO submissions (data) SELECT data FROM failed_submissions
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# maximal seconds between the attempts of `drain` while the batches fail
+MAX_BACKOFF = 30.0
+
+# a submission : the arguments of `crud_async.save_submission`, but the database
+Submission = Dict[str, Any]
+
+
+class SubmissionQueue:
+    """Durable queue of submissions, in a SQLite file.
+
+    Parameters
+    ----------
+    path
+        Path of the SQLite file, created if needed.
+    claim_timeout
+        Seconds after which a batch claimed by a worker, and not saved yet, can
+        be claimed by another worker.
+    max_attempts
+        Number of failures after which a submission is moved to the failed
+        submissions.
+    """
+
+    def __init__(self, path: str, claim_timeout: float = 60.0, max_attempts: int = 10):
+        self.path = path
+        self.claim_timeout = claim_timeout
+        self.max_attempts = max_attempts
+        # owner of the claims of this process
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        # the methods run in the threads of the default executor, one at a time
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, timeout=30.0, isolation_level=None, check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS submissions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                data TEXT NOT NULL,
+                claimed_by TEXT,
+                claimed_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0
+            )"""
+        )
+        columns = [
+            row[1] for row in self._connection.execute("PRAGMA table_info(submissions)")
+        ]
+        if "attempts" not in columns:
+            # queue created by a previous version of the app
+            self._connection.execute(
+                "ALTER TABLE submissions "
+                "ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0"
+            )
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS failed_submissions (
+                id INTEGER PRIMARY KEY,
+                data TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                error TEXT,
+                failed_at REAL NOT NULL
+            )"""
+        )
+
+    def put(self, submission: Submission) -> None:
+        """Append a submission to the queue."""
+        data = json.dumps(submission, separators=(",", ":"))
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO submissions (data) VALUES (?)", (data,)
+            )
+
+    def claim(self, limit: int) -> List[Tuple[int, Submission]]:
+        """Claim the oldest submissions that are not claimed, or whose claim expired.
+
+        The submissions claimed earlier by this process and not deleted yet,
+        because they could not be saved, are claimed again.
+
+        Returns
+        -------
+        submissions
+            Ids and submissions, in the order of the queue.
+        """
+        now = time.time()
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.execute(
+                    """UPDATE submissions SET claimed_by = ?, claimed_at = ?
+                    WHERE id IN (
+                        SELECT id FROM submissions
+                        WHERE claimed_by IS NULL OR claimed_by = ? OR claimed_at < ?
+                        ORDER BY id LIMIT ?
+                    )""",
+                    (self.owner, now, self.owner, now - self.claim_timeout, limit),
+                )
+                rows = self._connection.execute(
+                    "SELECT id, data FROM submissions WHERE claimed_by = ? "
+                    "ORDER BY id LIMIT ?",
+                    (self.owner, limit),
+                ).fetchall()
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        return [(row_id, json.loads(data)) for row_id, data in rows]
+
+    def delete(self, ids: List[int]) -> None:
+        """Delete saved submissions from the queue."""
+        with self._lock:
+            self._connection.executemany(
+                "DELETE FROM submissions WHERE id = ?", [(row_id,) for row_id in ids]
+            )
+
+    def fail(self, row_id: int, error: str) -> bool:
+        """Count a failure to save a submission.
+
+        The submission stays claimed by this process, and is claimed again ;
+        after `max_attempts` failures, it is moved to the failed submissions.
+
+        Returns
+        -------
+        moved
+            Whether the submission was moved to the failed submissions.
+        """
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.execute(
+                    "UPDATE submissions SET attempts = attempts + 1 WHERE id = ?",
+                    (row_id,),
+                )
+                moved = self._connection.execute(
+                    """INSERT INTO failed_submissions (id, data, attempts, error, failed_at)
+                    SELECT id, data, attempts, ?, ? FROM submissions
+                    WHERE id = ? AND attempts >= ?""",
+                    (error, time.time(), row_id, self.max_attempts),
+                ).rowcount
+                if moved:
+                    self._connection.execute(
+                        "DELETE FROM submissions WHERE id = ?", (row_id,)
+                    )
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        return moved > 0
+
+    def count_failed(self) -> int:
+        """Number of failed submissions."""
+        with self._lock:
+            return self._connection.execute(
+                "SELECT count(*) FROM failed_submissions"
+            ).fetchone()[0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute(
+                "SELECT count(*) FROM submissions"
+            ).fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+async def flush(
+    queue: SubmissionQueue,
+    save: Callable[[List[Submission]], Awaitable[Any]],
+    batch_size: int,
+) -> int:
+    """Save a batch of submissions from the queue, then delete them.
+
+    If the batch fails, its submissions are saved one by one, and the failures
+    are counted (`SubmissionQueue.fail`) ; the last error is then raised, once
+    the other submissions are saved.
+
+    Parameters
+    ----------
+    queue
+        Queue of the submissions.
+    save
+        Coroutine function that saves a list of submissions in a single transaction.
+    batch_size
+        Maximal number of submissions of the batch.
+
+    Returns
+    -------
+    nb_saved
+        Number of saved submissions.
+    """
+    loop = asyncio.get_event_loop()
+    batch = await loop.run_in_executor(None, queue.claim, batch_size)
+    if not batch:
+        return 0
+    try:
+        await save([submission for _, submission in batch])
+    except Exception as batch_error:
+        if len(batch) == 1:
+            await _fail(queue, batch[0][0], batch_error)
+            raise
+        saved, error = [], None
+        for row_id, submission in batch:
+            try:
+                await save([submission])
+            except Exception as e:
+                error = e
+                await _fail(queue, row_id, e)
+            else:
+                saved.append(row_id)
+        await loop.run_in_executor(None, queue.delete, saved)
+        if error is not None:
+            raise error
+        return len(saved)
+    await loop.run_in_executor(None, queue.delete, [row_id for row_id, _ in batch])
+    return len(batch)
+
+
+async def _fail(queue: SubmissionQueue, row_id: int, error: Exception) -> None:
+    """Count a failure of a submission, log it if it is moved to the failed submissions."""
+    loop = asyncio.get_event_loop()
+    message = f"{type(error).__name__}: {error}"
+    if await loop.run_in_executor(None, queue.fail, row_id, message):
+        logger.error(
+            "Submission %d failed %d times, moved to the failed submissions: %s",
+            row_id,
+            queue.max_attempts,
+            message,
+        )
+
+
+async def drain(
+    queue: SubmissionQueue,
+    save: Callable[[List[Submission]], Awaitable[Any]],
+    batch_size: int,
+    interval: float,
+) -> None:
+    """Save the submissions of the queue in batches, until cancelled.
+
+    The queue is checked every `interval` seconds when it is empty. Errors are
+    logged, the submissions that failed stay in the queue and are saved again,
+    after a delay that doubles with each failed batch, up to `MAX_BACKOFF`.
+    """
+    nb_failures = 0
+    while True:
+        try:
+            nb_saved = await flush(queue, save, batch_size)
+            nb_failures = 0
+        except Exception:
+            logger.exception("Failed to save a batch of submissions")
+            nb_saved = 0
+            nb_failures += 1
+        if nb_saved < batch_size:
+            await asyncio.sleep(min(interval * 2 ** nb_failures, MAX_BACKOFF))
+
+
+async def flush_all(
+    queue: SubmissionQueue,
+    save: Callable[[List[Submission]], Awaitable[Any]],
+    batch_size: int,
+) -> int:
+    """Save the submissions of the queue until it is empty, eg. at shutdown.
+
+    The errors are raised : the submissions that failed stay in the queue, and
+    are saved at the next start.
+
+    Returns
+    -------
+    nb_saved
+        Number of saved submissions.
+    """
+    nb_saved = 0
+    while True:
+        nb = await flush(queue, save, batch_size)
+        if nb == 0:
+            return nb_saved
+        nb_saved += nb
@@ -0,0 +1,86 @@
+"""Cache of the rendered summary page, shown after a submission.
+
+Besides the scores, the summary only depends on the version of the
+questionnaire and on the main profiles of the respondent (their badges and
+descriptions), and there are few combinations of main profiles. So the page is
+rendered once per version and main profiles, as a head and a tail around the
+scores, and kept in a LRU cache bounded in entries.
+Rendering a summary then boils down to rendering the rows of the scores and
+concatenating them with the cached head and tail.
+"""
+from collections import OrderedDict
+from typing import Callable, Collection, NamedTuple, Tuple
+
+from .metrics import cache_lookup
+
+# placeholder for the scores in the rendered page, used to split it
+SCORES_PLACEHOLDER = "<!-- scores -->"
+
+
+class RenderedSummary(NamedTuple):
+    """Encoded HTML page of the summary, around the scores."""
+
+    head: bytes
+    tail: bytes
+
+    @classmethod
+    def split(cls, page: str) -> "RenderedSummary":
+        """Split a page rendered with `SCORES_PLACEHOLDER` for the scores."""
+        head, tail = page.split(SCORES_PLACEHOLDER)
+        return cls(head.encode(), tail.encode())
+
+    def render(self, scores_html: str) -> bytes:
+        """Assemble the encoded page, with the HTML of the scores."""
+        return b"".join([self.head, scores_html.encode(), self.tail])
+
+
+class SummaryCache:
+    """LRU cache of rendered summaries, by key and main profiles.
+
+    Parameters
+    ----------
+    max_size
+        Maximal number of cached summaries ; the least recently used ones are
+        evicted beyond it.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._summaries: "OrderedDict[Tuple[str, Tuple[str, ...]], RenderedSummary]" = (
+            OrderedDict()
+        )
+
+    def __len__(self) -> int:
+        return len(self._summaries)
+
+    def get(
+        self,
+        key: str,
+        main_p_ids: Tuple[str, ...],
+        render: Callable[[], RenderedSummary],
+    ) -> RenderedSummary:
+        """Get the summary for a key and main profiles, render it if it is not in the cache.
+
+        Parameters
+        ----------
+        key
+            Slug and version of the questionnaire.
+        main_p_ids
+            Ids of the main profiles, in the order of the scores.
+        render
+            Function that renders the summary, called on cache misses.
+        """
+        summary = self._summaries.get((key, main_p_ids))
+        cache_lookup("summary", hit=summary is not None)
+        if summary is None:
+            summary = self._summaries[(key, main_p_ids)] = render()
+            while len(self._summaries) > self.max_size:
+                self._summaries.popitem(last=False)
+        else:
+            self._summaries.move_to_end((key, main_p_ids))
+        return summary
+
+    def discard(self, keys: Collection[str]) -> None:
+        """Remove the summaries for these keys from the cache."""
+        for cache_key in [k for k in self._summaries if k[0] in keys]:
+            del self._summaries[cache_key]
@@ -0,0 +1,101 @@
+"""Minimal in-process ASGI client, to load test the app without any network."""
+import asyncio
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+async def request(
+    app,
+    method: str,
+    path: str,
+    body: bytes = b"",
+    headers: Optional[Iterable[Tuple[str, str]]] = None,
+) -> Tuple[int, bytes, Dict[str, str]]:
+    """Send a request to an ASGI app, return the status, body and headers."""
+    path, _, query_string = path.partition("?")
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query_string.encode(),
+        "root_path": "",
+        "headers": [
+            (k.lower().encode("latin-1"), v.encode("latin-1"))
+            for k, v in (headers or [])
+        ]
+        + [(b"host", b"testserver"), (b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 12345),
+        "server": ("testserver", 80),
+    }
+    received = False
+    response: Dict = {"body": b""}
+
+    async def receive():
+        nonlocal received
+        if received:
+            # wait forever, as a client that does not disconnect
+            await asyncio.Event().wait()
+        received = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = {
+                k.decode("latin-1"): v.decode("latin-1") for k, v in message["headers"]
+            }
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+
+    await app(scope, receive, send)
+    return response["status"], response["body"], response["headers"]
+
+
+async def load(
+    app, make_request, n: int, concurrency: int = 1
+) -> Tuple[float, List[float]]:
+    """Send `n` requests with `concurrency` concurrent clients.
+
+    Parameters
+    ----------
+    app
+        ASGI app.
+    make_request
+        Function of the request number, that returns the arguments of `request`.
+    n
+        Total number of requests.
+    concurrency
+        Number of concurrent clients.
+
+    Returns
+    -------
+    requests_per_second, latencies
+        Throughput, and latency of each request in seconds.
+    """
+    latencies: List[float] = []
+    counter = iter(range(n))
+
+    async def client():
+        for i in counter:
+            start = time.perf_counter()
+            status, _, _ = await request(app, *make_request(i))
+            latencies.append(time.perf_counter() - start)
+            if status >= 400:
+                raise RuntimeError(f"Request {i} failed with status {status}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return n / elapsed, latencies
+
+
+def percentiles(latencies: List[float]) -> Dict[str, float]:
+    """Latency percentiles, in milliseconds."""
+    values = sorted(latencies)
+    return {
+        f"p{q}": 1000 * values[min(len(values) - 1, int(len(values) * q / 100))]
+        for q in (50, 90, 99)
+    }
@@ -0,0 +1,134 @@
+"""Benchmark the storage of the answers : text columns vs normalized tables.
+
+Store the same submissions in two temporary SQLite databases :
+- the legacy schema : the texts of the question and of the answer in indexed
+  columns of `answers`,
+- the current schema : the texts in `questions` and `choices`, referenced by id
+  from `answers`.
+
+Each submission is inserted in one transaction. Report the insert throughput
+and the size of the database file.
+
+Run from the root of the repository :
+
+    python benchmarks/bench_answers_storage.py --n 2000
+"""
+import argparse
+import os
+from pathlib import Path
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from sqlalchemy import Column, ForeignKey, Integer, MetaData, String, Table
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import crud, models  # noqa: E402
+from app.config import DEFAULT_QUESTIONNAIRE  # noqa: E402
+from app.main import questionnaires  # noqa: E402
+
+scoring_model = questionnaires.default.current.scoring_model
+profiles = questionnaires.default.current.profiles
+question_rows = scoring_model.question_rows()
+
+# `answers` before the normalization
+legacy_metadata = MetaData()
+legacy_answers = Table(
+    "answers",
+    legacy_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("profile_id", String, ForeignKey("profiles.id")),
+    Column("question", String, index=True),
+    Column("description", String, index=True),
+    Column("weight", Integer),
+    Column("author_id", Integer, ForeignKey("users.id")),
+    Column("questionnaire", String),
+)
+for table in (models.Profile.__table__, models.User.__table__):
+    table.tometadata(legacy_metadata)
+
+
+def draw_weights(n: int) -> List[List[int]]:
+    """Draw the weights of the answers of `n` submissions."""
+    return [
+        [random.choice(list(w2a)) for w2a in scoring_model.answers] for _ in range(n)
+    ]
+
+
+def legacy_rows(weights: List[int], author_id: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            "profile_id": p_id,
+            "question": label,
+            "description": w2a[w],
+            "weight": w,
+            "author_id": author_id,
+            "questionnaire": DEFAULT_QUESTIONNAIRE,
+        }
+        for (p_id, label, _), w2a, w in zip(
+            question_rows, scoring_model.answers, weights
+        )
+    ]
+
+
+def normalized_rows(weights: List[int], author_id: int) -> List[Dict[str, Any]]:
+    return [
+        dict(answer, author_id=author_id, questionnaire=DEFAULT_QUESTIONNAIRE)
+        for answer in scoring_model.prep_answers(np.array(weights))
+    ]
+
+
+def run(schema: str, all_weights: List[List[int]]) -> Tuple[float, float]:
+    """Store the submissions, return the submissions per second and the size in MB."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fn_db = f"{tmp_dir}/bench.db"
+        engine = create_engine(f"sqlite:///{fn_db}")
+        if schema == "legacy":
+            legacy_metadata.create_all(bind=engine)
+            table, make_rows = legacy_answers, legacy_rows
+        else:
+            models.Base.metadata.create_all(bind=engine)
+            db = sessionmaker(bind=engine)()
+            scoring_model.bind_db_ids(
+                *crud.seed_questions(db, DEFAULT_QUESTIONNAIRE, question_rows)
+            )
+            db.close()
+            table, make_rows = models.Answer.__table__, normalized_rows
+        with engine.begin() as conn:
+            conn.execute(models.Profile.__table__.insert(), profiles)
+        # the rows are built beforehand, only the inserts are timed
+        payloads = [
+            make_rows(weights, author_id)
+            for author_id, weights in enumerate(all_weights, start=1)
+        ]
+        start = time.perf_counter()
+        for rows in payloads:
+            with engine.begin() as conn:
+                conn.execute(table.insert(), rows)
+        elapsed = time.perf_counter() - start
+        engine.dispose()
+        size = os.path.getsize(fn_db) / 2 ** 20
+    return len(all_weights) / elapsed, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--n", type=int, default=2000, help="number of submissions")
+    args = parser.parse_args()
+
+    random.seed(0)
+    all_weights = draw_weights(args.n)
+    print(f"{len(scoring_model.answers)} answers per submission, {args.n} submissions")
+    for schema in ("legacy", "normalized"):
+        throughput, size = run(schema, all_weights)
+        print(f"{schema:>10}: {throughput:8.1f} submissions/s, {size:7.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
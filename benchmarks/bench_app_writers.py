@@ -0,0 +1,145 @@
+"""Load test the write path of the app, with several worker processes on SQLite.
+
+Several processes run the app, as the workers of a server would, on the same
+new SQLite database : they all start at the same time (seeding the profiles
+and questions concurrently), then submit the form (`POST /`, some from
+returning users) while reading the statistics (`GET /stats`), with concurrent
+clients in each process.
+Report the throughput and the status of the responses ; fail on any server
+error (5xx), eg. "database is locked".
+
+Run from the root of the repository :
+
+    python benchmarks/bench_app_writers.py --workers 4 --n 500
+"""
+import argparse
+import asyncio
+from collections import Counter
+import multiprocessing
+import os
+from pathlib import Path
+import random
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, Tuple
+from urllib.parse import urlencode
+
+REPO_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_DIR))
+
+
+def setup(env: Dict[str, str]):
+    """Settings of the run, in a new process, before the app is imported."""
+    os.environ.update(env)
+    os.chdir(REPO_DIR)
+
+
+def create_db(env: Dict[str, str]):
+    """Create the tables, empty : the workers seed them at startup."""
+    setup(env)
+    from app import models
+    from app.db.session import engine
+
+    models.Base.metadata.create_all(bind=engine)
+
+
+async def run_worker(worker: int, n: int, concurrency: int) -> Tuple[Counter, float]:
+    from app.main import app, questionnaires
+    from benchmarks.asgi import request
+
+    # the startup runs in its own task, as the lifespan of a server : the
+    # requests do not share its database connection
+    await asyncio.ensure_future(app.router.startup())
+    questionnaire = questionnaires.default.current
+    statuses: Counter = Counter()
+    counter = iter(range(n))
+
+    def make_request(i: int):
+        if i % 5 == 4:
+            return "GET /stats", ("GET", "/stats")
+        # some returning users
+        user = random.randrange(i + 1) if random.random() < 0.1 else i
+        data = {
+            "name": f"User {worker}-{user}",
+            "email": f"user{worker}-{user}@example.org",
+            "questionnaire_version": questionnaire.version,
+        }
+        for q_form_id, _, q_choices in questionnaire.list_questions:
+            data[f"{q_form_id}-question"] = str(random.choice(q_choices)[0])
+        headers = [("content-type", "application/x-www-form-urlencoded")]
+        return "POST /", ("POST", "/", urlencode(data).encode(), headers)
+
+    async def client():
+        for i in counter:
+            route, args = make_request(i)
+            try:
+                status, _, _ = await request(app, *args)
+                statuses[(route, str(status))] += 1
+            except Exception as e:
+                # the app raises the errors that it answered with a 500
+                statuses[(route, f"500 {type(e).__name__}: {e}")] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    await app.router.shutdown()
+    return statuses, elapsed
+
+
+def worker(
+    env: Dict[str, str], worker: int, n: int, concurrency: int, start_at: float
+) -> Tuple[Counter, float]:
+    """Send `n` requests, from `start_at` ; return the statuses and the time."""
+    setup(env)
+    # import the app first, so all the processes start together
+    import app.main  # noqa: F401
+
+    random.seed(worker)
+    time.sleep(max(0.0, start_at - time.time()))
+    return asyncio.run(run_worker(worker, n, concurrency))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--workers", type=int, default=4, help="app processes")
+    parser.add_argument("--n", type=int, default=500, help="requests per process")
+    parser.add_argument(
+        "--concurrency", type=int, default=10, help="concurrent clients per process"
+    )
+    args = parser.parse_args()
+    tmp_dir = tempfile.mkdtemp()
+    env = {
+        "QUESTIONNAIRE_WATCH_INTERVAL": "0",
+        "SQLITE_PATH": str(Path(tmp_dir) / "bench.db"),
+    }
+    ctx = multiprocessing.get_context("spawn")
+    try:
+        with ctx.Pool(1) as pool:
+            pool.apply(create_db, (env,))
+        start_at = time.time() + 5
+        with ctx.Pool(args.workers) as pool:
+            results = [
+                pool.apply_async(worker, (env, i, args.n, args.concurrency, start_at))
+                for i in range(args.workers)
+            ]
+            runs = [res.get() for res in results]
+    finally:
+        shutil.rmtree(tmp_dir)
+    statuses = sum((run_statuses for run_statuses, _ in runs), Counter())
+    # throughput over the time of the slowest process
+    elapsed = max(run_elapsed for _, run_elapsed in runs)
+    nb_submissions = sum(nb for (route, _), nb in statuses.items() if route == "POST /")
+    print(
+        f"{args.workers} processes, {args.n} requests each, "
+        f"{args.concurrency} concurrent clients : "
+        f"{nb_submissions / elapsed:.1f} submissions/s"
+    )
+    for (route, status), nb in sorted(statuses.items()):
+        print(f"  {route:10} {status}: {nb}")
+    sys.exit(1 if any(status.startswith("5") for _, status in statuses) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Benchmark syncing queued submissions : one request each, or batches.
+
+In-process, against a temporary SQLite database. Compare the time to store
+`n` submissions :
+- form : one `POST /` each, with `--concurrency` concurrent clients,
+- batch : `POST /api/submissions:batch`, with `--batch-size` submissions
+  per request.
+
+Run from the root of the repository :
+
+    python benchmarks/bench_batch_submissions.py --n 500 --batch-size 100
+"""
+import argparse
+import asyncio
+import json
+import os
+from pathlib import Path
+import random
+import shutil
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+
+REPO_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_DIR))
+
+# temporary database, created before the app is imported
+TMP_DIR = tempfile.mkdtemp()
+os.chdir(TMP_DIR)
+for dirname in ("data", "static", "templates"):
+    os.symlink(REPO_DIR / dirname, Path(TMP_DIR) / dirname)
+os.environ["QUESTIONNAIRE_WATCH_INTERVAL"] = "0"
+
+from app import models  # noqa: E402
+from app.db.session import engine  # noqa: E402
+from app.main import app, questionnaires  # noqa: E402
+from benchmarks.asgi import load, request  # noqa: E402
+
+
+def make_answers():
+    """Random answers to the questions of the default questionnaire."""
+    return {
+        q_form_id: random.choice(q_choices)[0]
+        for q_form_id, _, q_choices in questionnaires.default.current.list_questions
+    }
+
+
+def make_form_submission(i: int):
+    data = {f"{q_form_id}-question": w for q_form_id, w in make_answers().items()}
+    data.update(name=f"User {i}", email=f"form{i}@example.org")
+    headers = [("content-type", "application/x-www-form-urlencoded")]
+    return ("POST", "/", urlencode(data).encode(), headers)
+
+
+def make_batch(start: int, size: int) -> bytes:
+    return json.dumps(
+        [
+            {
+                "email": f"batch{i}@example.org",
+                "name": f"User {i}",
+                "answers": make_answers(),
+            }
+            for i in range(start, start + size)
+        ]
+    ).encode()
+
+
+async def bench(n: int, concurrency: int, batch_size: int):
+    models.Base.metadata.create_all(bind=engine)
+    await app.router.startup()
+    rps, _ = await load(app, make_form_submission, n, concurrency)
+    print(f"{'form':>6}: {n / rps:6.2f} s, {rps:7.1f} submissions/s, {n} requests")
+    batches = [make_batch(start, batch_size) for start in range(0, n, batch_size)]
+    headers = [("content-type", "application/json")]
+    start = time.perf_counter()
+    for body in batches:
+        status, _, _ = await request(
+            app, "POST", "/api/submissions:batch", body, headers
+        )
+        if status != 200:
+            raise RuntimeError(f"Batch failed with status {status}")
+    elapsed = time.perf_counter() - start
+    print(
+        f"{'batch':>6}: {elapsed:6.2f} s, {n / elapsed:7.1f} submissions/s, "
+        f"{len(batches)} requests"
+    )
+    await app.router.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--n", type=int, default=500, help="number of submissions")
+    parser.add_argument(
+        "--concurrency", type=int, default=10, help="concurrent clients of the form"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=100, help="submissions per batch"
+    )
+    args = parser.parse_args()
+    random.seed(0)
+    try:
+        asyncio.run(bench(args.n, args.concurrency, args.batch_size))
+    finally:
+        shutil.rmtree(TMP_DIR)
+
+
+if __name__ == "__main__":
+    main()
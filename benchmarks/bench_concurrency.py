@@ -0,0 +1,78 @@
+"""Load test of submissions concurrent with page views, in-process.
+
+Submissions (`POST /`) are sent while other clients read the form (`GET /`)
+and the list of users (`GET /users/`), against a temporary SQLite database.
+The routes use the asynchronous database layer (`crud_async`), so the event
+loop serves the reads while the submissions wait for the database.
+
+Run from the root of the repository :
+
+    python benchmarks/bench_concurrency.py --n 200
+"""
+import argparse
+import asyncio
+import os
+from pathlib import Path
+import random
+import shutil
+import sys
+import tempfile
+from urllib.parse import urlencode
+
+REPO_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_DIR))
+
+# temporary database, created before the app is imported
+TMP_DIR = tempfile.mkdtemp()
+os.chdir(TMP_DIR)
+for dirname in ("data", "static", "templates"):
+    os.symlink(REPO_DIR / dirname, Path(TMP_DIR) / dirname)
+
+from app import models  # noqa: E402
+from app.db.session import engine  # noqa: E402
+from app.main import app, questionnaires  # noqa: E402
+from benchmarks.asgi import load, percentiles  # noqa: E402
+
+
+def make_submission(i: int):
+    data = {"name": f"User {i}", "email": f"user{i}@example.org"}
+    for q_form_id, _, q_choices in questionnaires.default.current.list_questions:
+        data[f"{q_form_id}-question"] = str(random.choice(q_choices)[0])
+    headers = [("content-type", "application/x-www-form-urlencoded")]
+    return ("POST", "/", urlencode(data).encode(), headers)
+
+
+async def bench(n: int, concurrency: int):
+    models.Base.metadata.create_all(bind=engine)
+    await app.router.startup()
+    # submissions only, then submissions with concurrent reads
+    rps, latencies = await load(app, make_submission, n, concurrency)
+    print(f"{'POST / alone':14} {rps:8.1f} requests/s", percentiles(latencies))
+    tasks = {
+        "POST /": load(app, make_submission, n, concurrency),
+        "GET /": load(app, lambda i: ("GET", "/"), 10 * n, concurrency),
+        "GET /users/": load(
+            app, lambda i: ("GET", "/users/?limit=10&answers=false"), n, concurrency
+        ),
+    }
+    results = await asyncio.gather(*tasks.values())
+    for name, (rps, latencies) in zip(tasks, results):
+        print(f"{name:14} {rps:8.1f} requests/s", percentiles(latencies))
+    await app.router.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--n", type=int, default=200, help="number of submissions")
+    parser.add_argument(
+        "--concurrency", type=int, default=10, help="concurrent clients per route"
+    )
+    args = parser.parse_args()
+    try:
+        asyncio.run(bench(args.n, args.concurrency))
+    finally:
+        shutil.rmtree(TMP_DIR)
+
+
+if __name__ == "__main__":
+    main()
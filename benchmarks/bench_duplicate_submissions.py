@@ -0,0 +1,211 @@
+"""Stress test concurrent duplicate submissions, in separate processes.
+
+Several processes run the app, as several workers would, and all start at the
+same time to submit the form (`POST /`) and create users (`POST /users/`) for
+the same few emails, with concurrent clients in each process. Then check :
+- no request failed with a server error : each `POST /` succeeds, each
+  `POST /users/` either creates the user or is rejected (400),
+- each email has a single user, with the answers of a single submission,
+- the aggregated statistics count each respondent once.
+Any server error (5xx), eg. "database is locked", fails the test.
+
+Against a temporary SQLite database ; set `DATABASE_URL` to run against an
+empty PostgreSQL database instead.
+
+Run from the root of the repository :
+
+    python benchmarks/bench_duplicate_submissions.py --workers 4 --n 200
+"""
+import argparse
+import asyncio
+from collections import Counter
+import json
+import multiprocessing
+import os
+from pathlib import Path
+import random
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict
+from urllib.parse import urlencode
+
+REPO_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_DIR))
+
+
+def setup(env: Dict[str, str]):
+    """Settings of the run, in a new process, before the app is imported."""
+    os.environ.update(env)
+    os.chdir(REPO_DIR)
+
+
+def create_db(env: Dict[str, str]):
+    """Create the tables, and seed the profiles and questions."""
+    setup(env)
+    from app import models
+    from app.db.session import engine
+    from app.main import app
+
+    models.Base.metadata.create_all(bind=engine)
+
+    async def seed():
+        await app.router.startup()
+        await app.router.shutdown()
+
+    asyncio.run(seed())
+
+
+async def submit(worker: int, n: int, nb_emails: int, concurrency: int) -> Counter:
+    from app.main import app, questionnaires
+    from benchmarks.asgi import request
+
+    await app.router.startup()
+    questionnaire = questionnaires.default.current
+    statuses: Counter = Counter()
+    counter = iter(range(n))
+
+    def make_request(i: int):
+        email = random.randrange(nb_emails)
+        if i % 2:
+            body = json.dumps(
+                {"email": f"api{email}@example.org", "name": f"User {worker}-{i}"}
+            )
+            headers = [("content-type", "application/json")]
+            return "POST /users/", ("POST", "/users/", body.encode(), headers)
+        data = {
+            "name": f"User {worker}-{i}",
+            "email": f"user{email}@example.org",
+            "questionnaire_version": questionnaire.version,
+        }
+        for q_form_id, _, q_choices in questionnaire.list_questions:
+            data[f"{q_form_id}-question"] = str(random.choice(q_choices)[0])
+        headers = [("content-type", "application/x-www-form-urlencoded")]
+        return "POST /", ("POST", "/", urlencode(data).encode(), headers)
+
+    async def client():
+        for i in counter:
+            route, args = make_request(i)
+            try:
+                status, _, _ = await request(app, *args)
+                statuses[(route, str(status))] += 1
+            except Exception as e:
+                # the app raises the errors that it answered with a 500
+                statuses[(route, f"500 {type(e).__name__}: {e}")] += 1
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    await app.router.shutdown()
+    return statuses
+
+
+def worker(
+    env: Dict[str, str],
+    worker: int,
+    n: int,
+    nb_emails: int,
+    concurrency: int,
+    start_at: float,
+) -> Counter:
+    """Send `n` requests, from `start_at` ; return the number of each status."""
+    setup(env)
+    # import the app first, so all the processes start together
+    import app.main  # noqa: F401
+
+    random.seed(worker)
+    time.sleep(max(0.0, start_at - time.time()))
+    return asyncio.run(submit(worker, n, nb_emails, concurrency))
+
+
+def check(env: Dict[str, str]) -> Dict[str, bool]:
+    """Check the consistency of the database after the run."""
+    setup(env)
+    from sqlalchemy import func
+
+    from app import crud_async, models
+    from app.db.session import SessionLocal, database
+    from app.main import questionnaires
+
+    async def read_stats(questionnaire: str) -> Dict:
+        await database.connect()
+        try:
+            return await crud_async.get_stats(database, questionnaire)
+        finally:
+            await database.disconnect()
+
+    questionnaire = questionnaires.default.current
+    db = SessionLocal()
+    try:
+        emails = Counter(email for (email,) in db.query(models.User.email))
+        nb_answers = Counter(
+            dict(
+                db.query(models.Answer.author_id, func.count())
+                .group_by(models.Answer.author_id)
+                .all()
+            )
+        )
+        respondents = db.query(models.User).filter(
+            models.User.questionnaire == questionnaire.slug
+        )
+        stats = asyncio.run(read_stats(questionnaire.slug))
+        return {
+            "one user per email": max(emails.values()) == 1,
+            "answers of one submission": all(
+                nb_answers[user.id] == len(questionnaire.list_questions)
+                for user in respondents
+            ),
+            "respondents counted once": stats["respondents"] == respondents.count(),
+        }
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--workers", type=int, default=4, help="app processes")
+    parser.add_argument("--n", type=int, default=200, help="requests per process")
+    parser.add_argument(
+        "--emails", type=int, default=5, help="distinct emails, shared by all"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=10, help="concurrent clients per process"
+    )
+    args = parser.parse_args()
+    tmp_dir = tempfile.mkdtemp()
+    env = {"QUESTIONNAIRE_WATCH_INTERVAL": "0"}
+    if "DATABASE_URL" not in os.environ:
+        env["SQLITE_PATH"] = str(Path(tmp_dir) / "bench.db")
+    ctx = multiprocessing.get_context("spawn")
+    try:
+        with ctx.Pool(1) as pool:
+            pool.apply(create_db, (env,))
+        start_at = time.time() + 5
+        with ctx.Pool(args.workers) as pool:
+            results = [
+                pool.apply_async(
+                    worker,
+                    (env, i, args.n, args.emails, args.concurrency, start_at),
+                )
+                for i in range(args.workers)
+            ]
+            statuses = sum((res.get() for res in results), Counter())
+        with ctx.Pool(1) as pool:
+            checks = pool.apply(check, (env,))
+    finally:
+        shutil.rmtree(tmp_dir)
+    print(
+        f"{args.workers} processes, {args.n} requests each, "
+        f"{args.concurrency} concurrent clients, {args.emails} emails"
+    )
+    for (route, status), nb in sorted(statuses.items()):
+        print(f"  {route:12} {status}: {nb}")
+    for name, ok in checks.items():
+        print(f"  {name}: {'ok' if ok else 'FAILED'}")
+    failed = not all(checks.values()) or any(
+        status.startswith("5") for _, status in statuses
+    )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
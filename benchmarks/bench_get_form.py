@@ -0,0 +1,71 @@
+"""Load test of the form page, `GET /`.
+
+Compare the throughput of the form served from the cache of pre-rendered
+fragments, with the form rendered from scratch on each request (as before the
+cache), in-process and without network, against a temporary SQLite database.
+
+Run from the root of the repository :
+
+    python benchmarks/bench_get_form.py --n 500
+"""
+import argparse
+import asyncio
+import os
+from pathlib import Path
+import shutil
+import sys
+import tempfile
+
+REPO_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_DIR))
+
+# temporary database, created before the app is imported
+TMP_DIR = tempfile.mkdtemp()
+os.chdir(TMP_DIR)
+for dirname in ("data", "static", "templates"):
+    os.symlink(REPO_DIR / dirname, Path(TMP_DIR) / dirname)
+
+from fastapi.responses import HTMLResponse  # noqa: E402
+
+from app import models  # noqa: E402
+from app.db.session import engine  # noqa: E402
+from app.main import app, questionnaires, render_form  # noqa: E402
+from benchmarks.asgi import load, percentiles  # noqa: E402
+
+
+# form rendered from scratch on each request
+@app.get("/uncached")
+async def get_form_uncached():
+    return HTMLResponse(
+        render_form(questionnaires.default.current).render(order="shuffle")
+    )
+
+
+async def bench(n: int, concurrency: int):
+    # the startup seeds the profiles and the questions
+    models.Base.metadata.create_all(bind=engine)
+    await app.router.startup()
+    results = {}
+    for path in ("/uncached", "/"):
+        rps, latencies = await load(app, lambda i: ("GET", path), n, concurrency)
+        results[path] = rps
+        print(f"GET {path:10} {rps:8.1f} requests/s", percentiles(latencies))
+    print(f"speedup: {results['/'] / results['/uncached']:.1f}x")
+    await app.router.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--n", type=int, default=500, help="number of requests")
+    parser.add_argument(
+        "--concurrency", type=int, default=10, help="concurrent clients"
+    )
+    args = parser.parse_args()
+    try:
+        asyncio.run(bench(args.n, args.concurrency))
+    finally:
+        shutil.rmtree(TMP_DIR)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Benchmark the import of past answers from an Airtable CSV export.
+
+Generate an export of `n` respondents with random answers to the default
+questionnaire, in the format of Airtable (byte order mark, quoted labels), with
+some invalid rows and some emails answered twice. Import it into a temporary
+SQLite database, interrupted after half of the chunks, then resumed from the
+checkpoint, and report the rows per second.
+
+Run from the root of the repository :
+
+    python benchmarks/bench_import_answers.py --n 100000 --chunk-size 1000
+"""
+import argparse
+import asyncio
+import csv
+import os
+from pathlib import Path
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+REPO_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_DIR))
+
+# temporary database, created before the app is imported
+TMP_DIR = tempfile.mkdtemp()
+os.chdir(TMP_DIR)
+for dirname in ("data", "static", "templates"):
+    os.symlink(REPO_DIR / dirname, Path(TMP_DIR) / dirname)
+
+from app import crud_async, import_answers, models  # noqa: E402
+from app.config import DEFAULT_QUESTIONNAIRE  # noqa: E402
+from app.db.session import SessionLocal, database, engine  # noqa: E402
+from app.rescore import get_questionnaire  # noqa: E402
+
+
+async def count_respondents() -> int:
+    """Number of respondents in the statistics of the default questionnaire."""
+    await database.connect()
+    try:
+        stats = await crud_async.get_stats(database, DEFAULT_QUESTIONNAIRE)
+    finally:
+        await database.disconnect()
+    return stats["respondents"]
+
+
+def make_export(fn_csv: Path, n: int):
+    """Export of `n` rows, 1% of them invalid, 5% of them with a previous email."""
+    questionnaire = get_questionnaire(DEFAULT_QUESTIONNAIRE)
+    questions = [
+        (label, list(questionnaire.qid2w2a[q_form_id].values()))
+        for q_form_id, label in questionnaire.qid2q.items()
+    ]
+    with open(fn_csv, "w", newline="", encoding="utf-8-sig") as f_csv:
+        writer = csv.writer(f_csv)
+        writer.writerow(
+            ["Nom", "Email", *(f'"{label}"' for label, _ in questions), "Created"]
+        )
+        for i in range(n):
+            email = f"user{random.randrange(i) if i and random.random() < 0.05 else i}"
+            answers = [random.choice(choices) for _, choices in questions]
+            if random.random() < 0.01:
+                answers[0] = "Not an answer"
+            writer.writerow(
+                [f"User {i}", f"{email}@example.org", *answers, "2020-11-01"]
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--n", type=int, default=100000, help="rows of the export")
+    parser.add_argument(
+        "--chunk-size", type=int, default=1000, help="number of rows per transaction"
+    )
+    args = parser.parse_args()
+    random.seed(0)
+    import_answers.logger.setLevel("WARNING")
+    try:
+        models.Base.metadata.create_all(bind=engine)
+        fn_csv = Path(TMP_DIR) / "answers.csv"
+        make_export(fn_csv, args.n)
+        print(f"export: {args.n} rows, {fn_csv.stat().st_size / 1e6:.1f} MB")
+        # interrupt the import after half of the chunks
+        nb_chunks = -(-args.n // args.chunk_size)
+        save_chunk = import_answers.save_chunk
+        saved = 0
+
+        def interrupted(*args, **kwargs):
+            nonlocal saved
+            if saved == nb_chunks // 2:
+                raise KeyboardInterrupt
+            saved += 1
+            return save_chunk(*args, **kwargs)
+
+        import_answers.save_chunk = interrupted
+        start = time.perf_counter()
+        try:
+            import_answers.import_answers(fn_csv, chunk_size=args.chunk_size)
+        except KeyboardInterrupt:
+            pass
+        elapsed = time.perf_counter() - start
+        import_answers.save_chunk = save_chunk
+        start = time.perf_counter()
+        stats = import_answers.import_answers(fn_csv, chunk_size=args.chunk_size)
+        elapsed += time.perf_counter() - start
+        db = SessionLocal()
+        try:
+            nb_users = db.query(models.User).count()
+        finally:
+            db.close()
+        respondents = asyncio.run(count_respondents())
+    finally:
+        shutil.rmtree(TMP_DIR)
+    print(
+        f"import: {elapsed:.2f} s, {args.n / elapsed:.0f} rows/s, "
+        f"{stats['resumed_rows']} rows imported before the interruption"
+    )
+    print(
+        f"{stats['skipped_rows']} rows skipped, {nb_users} users, "
+        f"{respondents} respondents in the statistics"
+    )
+    sys.exit(0 if nb_users == respondents else 1)
+
+
+if __name__ == "__main__":
+    main()
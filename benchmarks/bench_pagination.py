@@ -0,0 +1,149 @@
+"""Benchmark the pagination of `GET /users/` and `GET /answers/` queries.
+
+Compare, on a temporary SQLite database with many users :
+- the legacy queries : OFFSET pagination, and answers lazy loaded for each
+  user when they are serialised (N+1 queries),
+- keyset pagination, with the answers loaded in one query (`crud_async`),
+- keyset pagination, with only the columns of the users.
+
+Run from the root of the repository :
+
+    python benchmarks/bench_pagination.py --users 100000
+"""
+import argparse
+import asyncio
+from pathlib import Path
+import sys
+import tempfile
+import time
+from typing import List
+
+from databases import Database
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import crud_async, models, schemas  # noqa: E402
+
+
+def get_users_legacy(db: Session, skip: int, limit: int) -> List[dict]:
+    """Previous `GET /users/` : OFFSET, then lazy loading of the answers."""
+    users = db.query(models.User).offset(skip).limit(limit).all()
+    return [schemas.User.from_orm(user).dict() for user in users]
+
+
+async def get_users_keyset(database: Database, after: int, limit: int) -> List[dict]:
+    users = await crud_async.get_users(database, after=after, limit=limit)
+    return [schemas.User.parse_obj(user).dict() for user in users]
+
+
+async def get_users_lean(database: Database, after: int, limit: int) -> List[dict]:
+    users = await crud_async.get_users(
+        database, after=after, limit=limit, with_answers=False
+    )
+    return [schemas.UserSummary.parse_obj(user).dict() for user in users]
+
+
+async def get_answers_keyset(database: Database, after: int, limit: int) -> List[dict]:
+    answers = await crud_async.get_answers(database, after=after, limit=limit)
+    return [schemas.Answer.parse_obj(answer).dict() for answer in answers]
+
+
+def fill_db(engine, nb_users: int, nb_answers: int):
+    """Create users, each with `nb_answers` answers."""
+    models.Base.metadata.create_all(bind=engine)
+    users = models.User.__table__
+    answers = models.Answer.__table__
+    questions = models.Question.__table__
+    choices = models.Choice.__table__
+    with engine.begin() as conn:
+        conn.execute(
+            questions.insert(),
+            [
+                {"id": j, "profile_id": "pilote", "label": f"Question {j}"}
+                for j in range(1, nb_answers + 1)
+            ],
+        )
+        conn.execute(
+            choices.insert(),
+            [
+                {
+                    "id": j,
+                    "question_id": j,
+                    "weight": j % 5,
+                    "description": f"Answer {j}",
+                }
+                for j in range(1, nb_answers + 1)
+            ],
+        )
+        conn.execute(
+            users.insert(),
+            [
+                {"id": i, "email": f"user{i}@example.org", "name": f"User {i}"}
+                for i in range(1, nb_users + 1)
+            ],
+        )
+        conn.execute(
+            answers.insert(),
+            [
+                {
+                    "profile_id": "pilote",
+                    "question_id": j,
+                    "choice_id": j,
+                    "weight": j % 5,
+                    "author_id": i,
+                }
+                for i in range(1, nb_users + 1)
+                for j in range(1, nb_answers + 1)
+            ],
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--users", type=int, default=100000, help="number of users")
+    parser.add_argument("--answers", type=int, default=5, help="answers per user")
+    parser.add_argument("--limit", type=int, default=100, help="page size")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine(f"sqlite:///{tmp_dir}/bench.db")
+        fill_db(engine, args.users, args.answers)
+        SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        database = Database(f"sqlite:///{tmp_dir}/bench.db")
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(database.connect())
+        # pages at the start, middle and end of the table
+        depths = [0, args.users // 2, args.users - args.limit]
+        print(f"{args.users} users, {args.answers} answers each, pages of {args.limit}")
+        for label, get_page in [
+            ("offset + lazy answers", get_users_legacy),
+            ("keyset + answers query", get_users_keyset),
+            ("keyset, no answers", get_users_lean),
+            ("answers, keyset", get_answers_keyset),
+        ]:
+            timings = []
+            for depth in depths:
+                db = SessionLocal()
+                start = time.perf_counter()
+                if asyncio.iscoroutinefunction(get_page):
+                    page = loop.run_until_complete(
+                        get_page(database, depth, args.limit)
+                    )
+                else:
+                    page = get_page(db, depth, args.limit)
+                timings.append(1000 * (time.perf_counter() - start))
+                db.close()
+                assert len(page) == args.limit
+            print(
+                f"{label:24}"
+                + "".join(f"  @{d:>7}: {t:7.2f} ms" for d, t in zip(depths, timings))
+            )
+        loop.run_until_complete(database.disconnect())
+        loop.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
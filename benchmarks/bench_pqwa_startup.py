@@ -0,0 +1,104 @@
+"""Benchmark the startup time and memory of the PQWA loader.
+
+Each loader is run in a fresh Python process, as in a new worker of the app :
+- the legacy loader : pandas `read_csv`, then nested `groupby` into a nested dict
+  (requires pandas, which is not a dependency of the app anymore),
+- the current loader : `app.pqwa_csv.load_pqwa`, with the `csv` module.
+
+The time covers the start of the interpreter, the imports and the loading of
+the file, the memory is the maximum resident set size of the process.
+
+Run from the root of the repository :
+
+    python benchmarks/bench_pqwa_startup.py --repeat 5
+"""
+import argparse
+from pathlib import Path
+import statistics
+import subprocess
+import sys
+import time
+from typing import Tuple
+
+REPO_DIR = Path(__file__).resolve().parents[1]
+
+# code run in each process
+LEGACY = """
+from collections import defaultdict
+import pandas as pd
+from app.config import CSV_PQWA, PQWA_NAMES
+
+col_p, col_q, col_w, col_a = PQWA_NAMES
+df = pd.read_csv(
+    CSV_PQWA,
+    dtype={col_p: "string", col_q: "string", col_w: int, col_a: "string"},
+)
+df.rename(
+    columns={col_p: "profile", col_q: "question", col_w: "weight", col_a: "answer"},
+    inplace=True,
+)
+df["question"] = df["question"].str.strip('"')
+df.dropna(axis=0, how="any", inplace=True)
+all_pqw = list(sorted(df[["profile", "question", "weight"]].itertuples(index=False)))
+assert all_pqw == list(sorted(set(all_pqw)))
+res = defaultdict(lambda: defaultdict(dict))
+for p, qwa in df.groupby(by=["profile"], sort=False):
+    for q, wa in qwa.groupby(by=["question"], sort=False):
+        for w, a in sorted(wa[["weight", "answer"]].itertuples(index=False)):
+            res[p][q][w] = a
+"""
+CURRENT = """
+from pathlib import Path
+from app.config import CSV_PQWA, PQWA_NAMES
+from app.pqwa_csv import load_pqwa
+
+questions = load_pqwa(Path(CSV_PQWA), PQWA_NAMES)
+"""
+BASELINE = "pass"
+
+
+# appended to the code : print the maximum RSS of the process (kB on Linux)
+PRINT_RSS = """
+import resource
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def run_process(code: str) -> Tuple[float, float]:
+    """Run code in a new process, return its duration (ms) and maximum RSS (MB)."""
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-c", code + PRINT_RSS],
+        cwd=REPO_DIR,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    return elapsed * 1000, int(proc.stdout.split()[-1]) / 1024
+
+
+def bench(name: str, code: str, repeat: int):
+    times, rss = zip(*(run_process(code) for _ in range(repeat)))
+    print(
+        f"{name:>10}: {statistics.median(times):7.1f} ms (median), "
+        f"{max(rss):6.1f} MB max RSS"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=5, help="number of processes")
+    args = parser.parse_args()
+    bench("python", BASELINE, args.repeat)
+    try:
+        bench("pandas", LEGACY, args.repeat)
+    except RuntimeError as e:
+        print(f"    pandas: skipped ({e})")
+    bench("csv", CURRENT, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
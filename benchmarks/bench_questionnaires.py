@@ -0,0 +1,106 @@
+"""Benchmark the memory and latency of serving many questionnaires from one process.
+
+Copies of the default questionnaire are served under distinct slugs, from a
+temporary directory, in-process ; the questionnaires beyond the size of the
+cache (`QUESTIONNAIRE_CACHE_SIZE`) are evicted and loaded again. Report :
+- the resident memory of the process with the default questionnaire only, then
+  with all the questionnaires loaded, compared to one process per questionnaire,
+- the latency of the first request to each questionnaire (lazy loading), and of
+  the following ones (served from the cache).
+
+Run from the root of the repository :
+
+    python benchmarks/bench_questionnaires.py --nb-questionnaires 30
+"""
+import argparse
+import asyncio
+import os
+from pathlib import Path
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_DIR))
+
+# temporary directory, before the app is imported
+TMP_DIR = tempfile.mkdtemp()
+os.chdir(TMP_DIR)
+for dirname in ("static", "templates"):
+    os.symlink(REPO_DIR / dirname, Path(TMP_DIR) / dirname)
+for path in (REPO_DIR / "data").iterdir():
+    if path.is_file():
+        (Path(TMP_DIR) / "data").mkdir(exist_ok=True)
+        os.symlink(path, Path(TMP_DIR) / "data" / path.name)
+os.environ["QUESTIONNAIRE_WATCH_INTERVAL"] = "0"
+
+from app import config, models  # noqa: E402
+from app.db.session import engine  # noqa: E402
+from app.main import app  # noqa: E402
+from benchmarks.asgi import request  # noqa: E402
+
+
+def rss_mb() -> float:
+    """Current resident set size of the process, in MB (Linux)."""
+    with open("/proc/self/statm") as f_statm:
+        return int(f_statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def make_questionnaires(nb: int):
+    """Copy the default questionnaire under `nb` slugs."""
+    for i in range(nb):
+        q_dir = Path(config.DIR_QUESTIONNAIRES) / f"q{i}"
+        q_dir.mkdir(parents=True)
+        shutil.copy(REPO_DIR / config.JSON_PROFILES, q_dir / "profiles.json")
+        shutil.copy(REPO_DIR / config.CSV_PQWA, q_dir / "pqwa.csv")
+
+
+async def get_ms(path: str) -> float:
+    start = time.perf_counter()
+    status, _, _ = await request(app, "GET", path)
+    assert status == 200, (path, status)
+    return (time.perf_counter() - start) * 1000
+
+
+async def bench(nb: int, repeat: int):
+    make_questionnaires(nb)
+    models.Base.metadata.create_all(bind=engine)
+    await app.router.startup()
+    await get_ms("/")
+    rss_default = rss_mb()
+    first = [await get_ms(f"/q/q{i}/") for i in range(nb)]
+    cached = [await get_ms(f"/q/q{i}/") for _ in range(repeat) for i in range(nb)]
+    rss_all = rss_mb()
+    await app.router.shutdown()
+    print(f"{nb + 1} questionnaires")
+    print(f"RSS, default questionnaire only: {rss_default:7.1f} MB")
+    print(
+        f"RSS, all questionnaires loaded:  {rss_all:7.1f} MB "
+        f"(+{(rss_all - rss_default) / nb:.2f} MB per questionnaire), "
+        f"vs {rss_default * (nb + 1):.1f} MB for one process per questionnaire"
+    )
+    print(
+        f"GET /q/<slug>/ first request: {statistics.median(first):6.2f} ms (median), "
+        f"cached: {statistics.median(cached):6.2f} ms (median)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--nb-questionnaires", type=int, default=30, help="number of questionnaires"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=20, help="cached requests per questionnaire"
+    )
+    args = parser.parse_args()
+    try:
+        asyncio.run(bench(args.nb_questionnaires, args.repeat))
+    finally:
+        shutil.rmtree(TMP_DIR)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Benchmark the reloading of the questionnaire under load, in-process.
+
+Clients read the form (`GET /`) and submit it (`POST /`), first without any
+reload, then while the PQWA file is modified and reloaded over and over, in a
+temporary directory with a temporary SQLite database.
+Report the latencies of the requests in both cases, and the time to build and
+to swap in each new version.
+
+Run from the root of the repository :
+
+    python benchmarks/bench_reload.py --n 2000 --reloads 20
+"""
+import argparse
+import asyncio
+import logging
+import os
+from pathlib import Path
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+from urllib.parse import urlencode
+
+REPO_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_DIR))
+
+# temporary directory, with copies of the data files, before the app is imported
+TMP_DIR = tempfile.mkdtemp()
+os.chdir(TMP_DIR)
+shutil.copytree(REPO_DIR / "data", Path(TMP_DIR) / "data")
+for dirname in ("static", "templates"):
+    os.symlink(REPO_DIR / dirname, Path(TMP_DIR) / dirname)
+# reloads are triggered by the benchmark
+os.environ["QUESTIONNAIRE_WATCH_INTERVAL"] = "0"
+
+from app import models  # noqa: E402
+from app.config import CSV_PQWA  # noqa: E402
+from app.db.session import engine  # noqa: E402
+from app.main import app, questionnaires  # noqa: E402
+from benchmarks.asgi import load, percentiles  # noqa: E402
+
+
+class SwapTimes(logging.Handler):
+    """Collect the build and swap times logged by the registry."""
+
+    def __init__(self):
+        super().__init__()
+        self.built_ms = []
+        self.swapped_us = []
+
+    def emit(self, record):
+        if record.msg.startswith("Questionnaire %s %s swapped in"):
+            self.built_ms.append(record.args[2])
+            self.swapped_us.append(record.args[3])
+
+
+def make_submission(i: int):
+    questionnaire = questionnaires.default.current
+    data = {
+        "name": f"User {i}",
+        "email": f"user{i}@example.org",
+        "questionnaire_version": questionnaire.version,
+    }
+    for q_form_id, _, q_choices in questionnaire.list_questions:
+        data[f"{q_form_id}-question"] = str(random.choice(q_choices)[0])
+    headers = [("content-type", "application/x-www-form-urlencoded")]
+    return ("POST", "/", urlencode(data).encode(), headers)
+
+
+async def reload_loop(nb_reloads: int, interval: float):
+    """Modify the PQWA file and reload it, `nb_reloads` times."""
+    path = Path(CSV_PQWA)
+    original = path.read_text(encoding="utf-8-sig")
+    for i in range(nb_reloads):
+        await asyncio.sleep(interval)
+        # a distinct version each time : add blank lines, which are ignored
+        path.write_text(original + "\n" * (i + 1), encoding="utf-8-sig")
+        await questionnaires.reload()
+
+
+async def run_load(n: int, concurrency: int):
+    return await asyncio.gather(
+        load(app, lambda i: ("GET", "/"), n, concurrency),
+        load(app, make_submission, n // 10, concurrency),
+    )
+
+
+async def bench(n: int, concurrency: int, nb_reloads: int):
+    models.Base.metadata.create_all(bind=engine)
+    swap_times = SwapTimes()
+    logger = logging.getLogger("app.questionnaire")
+    logger.addHandler(swap_times)
+    logger.setLevel(logging.INFO)
+    await app.router.startup()
+    results = await run_load(n, concurrency)
+    print("without reloads:")
+    for name, (rps, latencies) in zip(("GET /", "POST /"), results):
+        print(f"  {name:8} {rps:8.1f} requests/s", percentiles(latencies))
+    # spread the reloads over about the duration of the load
+    interval = n / results[0][0] / nb_reloads
+    results, _ = await asyncio.gather(
+        run_load(n, concurrency), reload_loop(nb_reloads, interval)
+    )
+    print(f"with {nb_reloads} reloads:")
+    for name, (rps, latencies) in zip(("GET /", "POST /"), results):
+        print(f"  {name:8} {rps:8.1f} requests/s", percentiles(latencies))
+    print(
+        f"build: {statistics.median(swap_times.built_ms):.1f} ms (median), "
+        f"swap: {statistics.median(swap_times.swapped_us):.1f} µs (median), "
+        f"{max(swap_times.swapped_us):.1f} µs (max), "
+        f"{len(swap_times.swapped_us)} versions swapped in"
+    )
+    await app.router.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--n", type=int, default=2000, help="number of form views")
+    parser.add_argument(
+        "--concurrency", type=int, default=10, help="concurrent clients per route"
+    )
+    parser.add_argument("--reloads", type=int, default=20, help="number of reloads")
+    args = parser.parse_args()
+    try:
+        asyncio.run(bench(args.n, args.concurrency, args.reloads))
+    finally:
+        shutil.rmtree(TMP_DIR)
+
+
+if __name__ == "__main__":
+    main()
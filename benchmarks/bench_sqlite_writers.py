@@ -0,0 +1,169 @@
+"""Benchmark concurrent writers and readers on SQLite, in separate processes.
+
+Several processes store submissions (`crud_async.save_submission`) while others read
+pages of users, in a temporary SQLite database, as several workers of the app
+would. Compare :
+- the SQLite defaults : rollback journal, synchronous=FULL,
+- the settings of the app : WAL journal, synchronous=NORMAL, busy timeout
+  and memory-mapped I/O.
+
+Each configuration is passed to the processes through the environment
+variables read by `app.config.Settings`. Failed writes ("database is locked")
+are counted, not retried.
+
+Run from the root of the repository :
+
+    python benchmarks/bench_sqlite_writers.py --writers 4 --readers 4 --n 200
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+from pathlib import Path
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, Tuple
+
+REPO_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_DIR))
+
+# environment variables of each configuration
+CONFIGS: Dict[str, Dict[str, str]] = {
+    "defaults": {
+        "SQLITE_JOURNAL_MODE": "DELETE",
+        "SQLITE_SYNCHRONOUS": "FULL",
+        # timeout of the sqlite3 module
+        "SQLITE_BUSY_TIMEOUT": "5000",
+        "SQLITE_MMAP_SIZE": "0",
+    },
+    "tuned": {},
+}
+
+
+def writer(env: Dict[str, str], worker: int, n: int) -> Tuple[int, int, float]:
+    """Store `n` submissions, return the number of successes, errors and the time."""
+    os.environ.update(env)
+    from sqlite3 import OperationalError
+
+    from app import crud_async
+    from app.config import DEFAULT_QUESTIONNAIRE
+    from app.db.session import SessionLocal, database
+    from benchmarks.bench_submissions import make_answers, seed_questions
+
+    db = SessionLocal()
+    seed_questions(db)
+    db.close()
+
+    async def write() -> Tuple[int, int, float]:
+        await database.connect()
+        nb_ok, nb_locked = 0, 0
+        start = time.perf_counter()
+        for i in range(n):
+            try:
+                await crud_async.save_submission(
+                    database,
+                    # some returning users
+                    email=f"user{worker}-{random.randrange(n)}@example.org",
+                    name=f"User {worker}-{i}",
+                    answers_values=make_answers(),
+                    selected_profile="Profile",
+                    questionnaire=DEFAULT_QUESTIONNAIRE,
+                )
+                nb_ok += 1
+            except OperationalError as e:
+                if "locked" not in str(e):
+                    raise
+                nb_locked += 1
+        elapsed = time.perf_counter() - start
+        await database.disconnect()
+        return nb_ok, nb_locked, elapsed
+
+    return asyncio.run(write())
+
+
+def reader(env: Dict[str, str], n: int) -> Tuple[int, int, float]:
+    """Read `n` pages of users, return the number of successes, errors and the time."""
+    os.environ.update(env)
+    from sqlite3 import OperationalError
+
+    from app import crud_async
+    from app.db.session import database
+
+    async def read() -> Tuple[int, int, float]:
+        await database.connect()
+        nb_ok, nb_locked = 0, 0
+        start = time.perf_counter()
+        for _ in range(n):
+            try:
+                await crud_async.get_users(database, limit=50)
+                nb_ok += 1
+            except OperationalError as e:
+                if "locked" not in str(e):
+                    raise
+                nb_locked += 1
+        elapsed = time.perf_counter() - start
+        await database.disconnect()
+        return nb_ok, nb_locked, elapsed
+
+    return asyncio.run(read())
+
+
+def run(config: str, nb_writers: int, nb_readers: int, n: int):
+    tmp_dir = tempfile.mkdtemp()
+    env = dict(CONFIGS[config], SQLITE_PATH=str(Path(tmp_dir) / "bench.db"))
+    # create the database in a separate process, with the settings of this run
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(1) as pool:
+        pool.apply(create_db, (env,))
+    with ctx.Pool(nb_writers + nb_readers) as pool:
+        w_results = [
+            pool.apply_async(writer, (env, worker, n)) for worker in range(nb_writers)
+        ]
+        r_results = [pool.apply_async(reader, (env, n)) for _ in range(nb_readers)]
+        w_stats = [res.get() for res in w_results]
+        r_stats = [res.get() for res in r_results]
+    # throughput over the time of the slowest process, imports excluded
+    w_time = max(t for _, _, t in w_stats)
+    r_time = max(t for _, _, t in r_stats)
+    print(
+        f"{config:>10}: "
+        f"{sum(ok for ok, _, _ in w_stats) / w_time:8.1f} submissions/s, "
+        f"{sum(ok for ok, _, _ in r_stats) / r_time:8.1f} reads/s, "
+        f"{sum(locked for _, locked, _ in w_stats)} locked writes, "
+        f"{sum(locked for _, locked, _ in r_stats)} locked reads"
+    )
+
+
+def create_db(env: Dict[str, str]):
+    os.environ.update(env)
+    from app import crud, models
+    from app.db.session import SessionLocal, engine
+    from benchmarks.bench_submissions import seed_questions
+    from app.main import questionnaires
+
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    questionnaire = questionnaires.default.current
+    crud.seed_profiles(db, questionnaire.slug, questionnaire.profiles)
+    seed_questions(db)
+    db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--writers", type=int, default=4, help="writer processes")
+    parser.add_argument("--readers", type=int, default=4, help="reader processes")
+    parser.add_argument("--n", type=int, default=200, help="operations per process")
+    args = parser.parse_args()
+    print(
+        f"{args.writers} writers and {args.readers} readers, "
+        f"{args.n} operations each"
+    )
+    for config in CONFIGS:
+        run(config, args.writers, args.readers, args.n)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""Benchmark the aggregated statistics, in-process.
+
+For growing numbers of respondents, in a temporary SQLite database, compare :
+- reading all the answers (`GET /answers/`, by pages of 1000) and aggregating
+  them on the client, as analysts did,
+- reading the aggregates (`GET /stats`).
+
+Also report the cost of updating the aggregates in the transaction of each
+submission (`crud_async.save_submission`, with and without a questionnaire).
+
+Run from the root of the repository :
+
+    python benchmarks/bench_stats.py --sizes 1000 10000
+"""
+import argparse
+import asyncio
+from collections import Counter
+import json
+import os
+from pathlib import Path
+import random
+import shutil
+import sys
+import tempfile
+import time
+from typing import List
+
+REPO_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_DIR))
+
+# temporary database, created before the app is imported
+TMP_DIR = tempfile.mkdtemp()
+os.chdir(TMP_DIR)
+for dirname in ("data", "static", "templates"):
+    os.symlink(REPO_DIR / dirname, Path(TMP_DIR) / dirname)
+os.environ["QUESTIONNAIRE_WATCH_INTERVAL"] = "0"
+
+from app import crud, crud_async, models  # noqa: E402
+from app.config import DEFAULT_QUESTIONNAIRE  # noqa: E402
+from app.db.session import SessionLocal, database, engine  # noqa: E402
+from app.main import app, questionnaires  # noqa: E402
+from benchmarks.asgi import request  # noqa: E402
+from benchmarks.bench_submissions import make_answers  # noqa: E402
+
+
+def add_respondents(start: int, nb: int):
+    """Store `nb` respondents and their answers with bulk inserts, update the aggregates."""
+    db = SessionLocal()
+    users, all_answers = [], []
+    deltas = None
+    for i in range(start, start + nb):
+        answers = make_answers()
+        users.append({"id": i + 1, "email": f"user{i}@example.org", "name": "Bench"})
+        all_answers.extend(
+            dict(answer, author_id=i + 1, questionnaire=DEFAULT_QUESTIONNAIRE)
+            for answer in answers
+        )
+        user_deltas = crud.stats_deltas(DEFAULT_QUESTIONNAIRE, answers)
+        if deltas is None:
+            deltas = user_deltas
+        else:
+            for (_, _, total), (_, _, user_delta) in zip(deltas, user_deltas):
+                total.update(user_delta)
+    db.bulk_insert_mappings(models.User, users)
+    db.bulk_insert_mappings(models.Answer, all_answers)
+    for table, key_names, table_deltas in deltas:
+        insert, update = crud.counter_statements(table, "sqlite")
+        insert_params, update_params = crud.counter_params(key_names, table_deltas)
+        db.execute(insert, insert_params)
+        db.execute(update, update_params)
+    db.commit()
+    db.close()
+
+
+async def get_json(path: str):
+    status, body, headers = await request(app, "GET", path)
+    assert status == 200, (path, status)
+    return json.loads(body), headers
+
+
+async def stats_from_answers() -> float:
+    """Aggregate all the answers on the client, return the time in ms."""
+    start = time.perf_counter()
+    weights: Counter = Counter()
+    path = "/answers/?limit=1000"
+    while path:
+        answers, headers = await get_json(path)
+        weights.update((answer["question_id"], answer["weight"]) for answer in answers)
+        link = headers.get("link")
+        path = link[link.index("/answers/") : link.index(">")] if link else None
+    return (time.perf_counter() - start) * 1000
+
+
+async def stats_from_aggregates() -> float:
+    start = time.perf_counter()
+    await get_json("/stats")
+    return (time.perf_counter() - start) * 1000
+
+
+async def submissions_per_second(questionnaire, n: int) -> float:
+    start = time.perf_counter()
+    for i in range(n):
+        await crud_async.save_submission(
+            database,
+            # some returning users
+            email=f"{questionnaire}-{random.randrange(n)}@example.org",
+            name="Bench",
+            answers_values=make_answers(),
+            selected_profile="Profile",
+            questionnaire=questionnaire,
+        )
+    elapsed = time.perf_counter() - start
+    return n / elapsed
+
+
+async def bench(sizes: List[int], n: int):
+    models.Base.metadata.create_all(bind=engine)
+    await app.router.startup()
+    scoring_model = questionnaires.default.current.scoring_model
+    print(f"{len(scoring_model.question_ids)} questions per submission")
+    nb_respondents = 0
+    for size in sizes:
+        add_respondents(nb_respondents, size - nb_respondents)
+        nb_respondents = size
+        stats, _ = await get_json("/stats")
+        assert stats["respondents"] == size, stats["respondents"]
+        from_answers = min([await stats_from_answers() for _ in range(3)])
+        from_aggregates = min([await stats_from_aggregates() for _ in range(10)])
+        print(
+            f"{size:8} respondents: GET /answers/ (all pages) {from_answers:9.1f} ms, "
+            f"GET /stats {from_aggregates:6.2f} ms"
+        )
+    without = await submissions_per_second(None, n)
+    with_stats = await submissions_per_second(DEFAULT_QUESTIONNAIRE, n)
+    await app.router.shutdown()
+    print(
+        f"save_submission: {without:6.1f} submissions/s without the aggregates, "
+        f"{with_stats:6.1f} submissions/s with the aggregates"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1000, 10000],
+        help="numbers of respondents, increasing",
+    )
+    parser.add_argument("--n", type=int, default=200, help="number of submissions")
+    args = parser.parse_args()
+    random.seed(0)
+    try:
+        asyncio.run(bench(args.sizes, args.n))
+    finally:
+        shutil.rmtree(TMP_DIR)
+
+
+if __name__ == "__main__":
+    main()
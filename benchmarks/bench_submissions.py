@@ -0,0 +1,160 @@
+"""Benchmark the persistence of form submissions.
+
+Compare the number of submissions per second stored in a temporary SQLite
+database by :
+- the legacy path : one commit per answer, plus separate commits for the user,
+- the single transaction path : `crud_async.save_submission`, which also
+  updates the aggregated statistics.
+
+Run from the root of the repository :
+
+    python benchmarks/bench_submissions.py --n 200
+"""
+import argparse
+import asyncio
+from pathlib import Path
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from databases import Database
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import crud, crud_async, models  # noqa: E402
+from app.config import DEFAULT_QUESTIONNAIRE  # noqa: E402
+from app.main import questionnaires  # noqa: E402
+
+list_questions = questionnaires.default.current.list_questions
+profiles = questionnaires.default.current.profiles
+scoring_model = questionnaires.default.current.scoring_model
+
+
+def make_answers() -> List[Dict[str, Any]]:
+    """Draw a random answer for each question.
+
+    The questions must be in the database, see `seed_questions`.
+    """
+    weights = np.array([random.choice(list(w2a)) for w2a in scoring_model.answers])
+    return scoring_model.prep_answers(weights)
+
+
+def seed_questions(db: Session):
+    """Create the questions and choices, and bind their ids to the scoring model."""
+    scoring_model.bind_db_ids(
+        *crud.seed_questions(db, DEFAULT_QUESTIONNAIRE, scoring_model.question_rows())
+    )
+
+
+def save_legacy(
+    db: Session, email: str, name: str, answers: List[Dict[str, Any]], profile: str
+):
+    """Persistence path of `parse_form` before the single transaction."""
+    existing_user = db.query(models.User).filter(models.User.email == email).first()
+    if existing_user:
+        existing_user.name = name
+        db.query(models.Answer).filter(
+            models.Answer.author_id == existing_user.id
+        ).delete(synchronize_session=False)
+        db_user = existing_user
+    else:
+        db_user = models.User(email=email, name=name)
+        db.add(db_user)
+        db.commit()
+        db.refresh(db_user)
+    for answer in answers:
+        db_answer = models.Answer(**answer, author_id=db_user.id)
+        db.add(db_answer)
+        db.commit()
+        db.refresh(db_answer)
+    db_user.selected_profile = profile
+    db.commit()
+    db.refresh(db_user)
+
+
+async def save_batched(
+    database: Database,
+    email: str,
+    name: str,
+    answers: List[Dict[str, Any]],
+    profile: str,
+):
+    """Persistence path of the app, in a single transaction."""
+    await crud_async.save_submission(
+        database, email, name, answers, profile, questionnaire=DEFAULT_QUESTIONNAIRE
+    )
+
+
+def run(save, n: int, resubmit: float) -> float:
+    """Store `n` submissions with `save`, return the number of submissions per second.
+
+    `save` gets a session, or a `databases.Database` if it is a coroutine function.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine(
+            f"sqlite:///{tmp_dir}/bench.db", connect_args={"check_same_thread": False}
+        )
+        models.Base.metadata.create_all(bind=engine)
+        SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        db = SessionLocal()
+        db.add_all([models.Profile(**profile) for profile in profiles])
+        db.commit()
+        seed_questions(db)
+        # a fraction of submissions come from returning users
+        emails = [
+            f"user{random.randrange(i)}@example.org"
+            if i and random.random() < resubmit
+            else f"user{i}@example.org"
+            for i in range(n)
+        ]
+        payloads = [make_answers() for _ in range(n)]
+        if asyncio.iscoroutinefunction(save):
+            database = Database(f"sqlite:///{tmp_dir}/bench.db")
+
+            async def save_all() -> float:
+                await database.connect()
+                start = time.perf_counter()
+                for email, answers in zip(emails, payloads):
+                    await save(database, email, "Bench", answers, "Pilote")
+                elapsed = time.perf_counter() - start
+                await database.disconnect()
+                return elapsed
+
+            loop = asyncio.new_event_loop()
+            elapsed = loop.run_until_complete(save_all())
+            loop.close()
+        else:
+            start = time.perf_counter()
+            for email, answers in zip(emails, payloads):
+                save(db, email, "Bench", answers, "Pilote")
+            elapsed = time.perf_counter() - start
+        db.close()
+        engine.dispose()
+    return n / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--n", type=int, default=200, help="number of submissions")
+    parser.add_argument(
+        "--resubmit", type=float, default=0.1, help="fraction of returning users"
+    )
+    args = parser.parse_args()
+
+    random.seed(0)
+    legacy = run(save_legacy, args.n, args.resubmit)
+    random.seed(0)
+    batched = run(save_batched, args.n, args.resubmit)
+    print(f"{len(list_questions)} questions per submission, {args.n} submissions")
+    print(f"legacy (one commit per answer): {legacy:8.1f} submissions/s")
+    print(f"single transaction            : {batched:8.1f} submissions/s")
+    print(f"speedup                       : {batched / legacy:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
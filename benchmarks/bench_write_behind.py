@@ -0,0 +1,132 @@
+"""Benchmark the latency of `POST /` with and without the write-behind queue.
+
+In-process, against a temporary SQLite database, while another connection
+holds write transactions on the database, as other workers or scripts would
+during a spike. Compare :
+- inline : each submission is saved before the summary is returned,
+- write-behind : each submission is appended to the queue, and saved in
+  batches by the background task.
+
+Also report the time to save the rest of the queue at shutdown.
+
+Run from the root of the repository :
+
+    python benchmarks/bench_write_behind.py --n 500 --concurrency 10
+"""
+import argparse
+import asyncio
+import os
+from pathlib import Path
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+REPO_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_DIR))
+
+# temporary database, created before the app is imported
+TMP_DIR = tempfile.mkdtemp()
+os.chdir(TMP_DIR)
+for dirname in ("data", "static", "templates"):
+    os.symlink(REPO_DIR / dirname, Path(TMP_DIR) / dirname)
+os.environ["QUESTIONNAIRE_WATCH_INTERVAL"] = "0"
+
+from app import models  # noqa: E402
+from app.config import settings  # noqa: E402
+from app.db.session import engine  # noqa: E402
+from app.main import app, questionnaires  # noqa: E402
+from benchmarks.asgi import load, percentiles  # noqa: E402
+
+
+def make_submission(i: int):
+    """Submission of the form with random answers ; some users submit again."""
+    questionnaire = questionnaires.default.current
+    user = random.randrange(i + 1)
+    data = {
+        "name": f"User {user}",
+        "email": f"user{user}@example.org",
+        "questionnaire_version": questionnaire.version,
+    }
+    for q_form_id, _, q_choices in questionnaire.list_questions:
+        data[f"{q_form_id}-question"] = str(random.choice(q_choices)[0])
+    headers = [("content-type", "application/x-www-form-urlencoded")]
+    return ("POST", "/", urlencode(data).encode(), headers)
+
+
+def contend(stop: threading.Event, hold: float, pause: float):
+    """Hold write transactions on the database, `hold` seconds every `pause` seconds."""
+    connection = sqlite3.connect("dataposition.db", timeout=30, isolation_level=None)
+    while not stop.is_set():
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError:
+            # busy without waiting, eg. while the app checkpoints the WAL
+            time.sleep(pause)
+            continue
+        time.sleep(hold)
+        connection.execute("COMMIT")
+        time.sleep(pause)
+    connection.close()
+
+
+async def bench_mode(queue_path, n: int, concurrency: int, hold: float, pause: float):
+    settings.SUBMISSION_QUEUE_PATH = queue_path
+    await app.router.startup()
+    stop = threading.Event()
+    contender = threading.Thread(target=contend, args=(stop, hold, pause))
+    contender.start()
+    try:
+        rps, latencies = await load(app, make_submission, n, concurrency)
+    finally:
+        stop.set()
+        contender.join()
+    start = time.perf_counter()
+    await app.router.shutdown()
+    shutdown = time.perf_counter() - start
+    lat = percentiles(latencies)
+    print(
+        f"{'write-behind' if queue_path else 'inline':>12}: {rps:7.1f} requests/s, "
+        f"p50 {lat['p50']:6.1f} ms, p90 {lat['p90']:6.1f} ms, "
+        f"p99 {lat['p99']:6.1f} ms, shutdown {shutdown:5.2f} s"
+    )
+
+
+async def bench(n: int, concurrency: int, hold: float, pause: float):
+    models.Base.metadata.create_all(bind=engine)
+    await bench_mode(None, n, concurrency, hold, pause)
+    await bench_mode(str(Path(TMP_DIR) / "queue.db"), n, concurrency, hold, pause)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--n", type=int, default=500, help="number of submissions")
+    parser.add_argument(
+        "--concurrency", type=int, default=10, help="concurrent clients"
+    )
+    parser.add_argument(
+        "--hold",
+        type=float,
+        default=0.05,
+        help="seconds of each write transaction of the other connection",
+    )
+    parser.add_argument(
+        "--pause",
+        type=float,
+        default=0.05,
+        help="seconds between the write transactions of the other connection",
+    )
+    args = parser.parse_args()
+    random.seed(0)
+    try:
+        asyncio.run(bench(args.n, args.concurrency, args.hold, args.pause))
+    finally:
+        shutil.rmtree(TMP_DIR)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""Benchmark suite of the form endpoints, offline, with results as JSON.
+
+Micro-benchmarks, with the default questionnaire :
+- `load_pqwa` : parse the PQWA file,
+- `load_questionnaire` : parse the data files and build the scoring model,
+- `get_questions` : build the subforms of the questions,
+- `render_form` : render the form from scratch,
+- `render_cached_form` : assemble the form from the cached fragments,
+- `get_cached_page` : get the page of one of the orders of the questions, as `GET /`,
+- `parse_and_score` : parse the form data of a submission and score it,
+- `render_summary` : render the summary page from scratch, but the scores,
+- `get_cached_summary` : get the summary page, as `POST /`, from the cached
+  page for the main profiles.
+
+Load test, in-process through ASGI, against a temporary SQLite file :
+- `GET /` : the form,
+- `POST /` : submissions with random answers, some from returning users,
+- both at once.
+
+Each result reports latency percentiles (ms) and calls or requests per second.
+Save the results of two commits and compare them :
+
+    python benchmarks/suite.py --output before.json
+    git checkout <other commit>
+    python benchmarks/suite.py --output after.json --compare before.json
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+from pathlib import Path
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlencode
+
+REPO_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_DIR))
+
+# the paths of the arguments are relative to the working directory
+CWD = Path.cwd()
+# temporary database, created before the app is imported
+TMP_DIR = tempfile.mkdtemp()
+os.chdir(TMP_DIR)
+for dirname in ("data", "static", "templates"):
+    os.symlink(REPO_DIR / dirname, Path(TMP_DIR) / dirname)
+os.environ["QUESTIONNAIRE_WATCH_INTERVAL"] = "0"
+
+from starlette.requests import Request  # noqa: E402
+
+from app import form_cache, models  # noqa: E402
+from app.config import (  # noqa: E402
+    CSV_PQWA,
+    DEFAULT_QUESTIONNAIRE,
+    JSON_PROFILES,
+    PQWA_NAMES,
+    settings,
+)
+from app.db.session import engine  # noqa: E402
+from app.main import (  # noqa: E402
+    app,
+    form_key,
+    form_pages,
+    get_questions,
+    questionnaires,
+    render_form,
+    render_page,
+    render_summary,
+    summary_page,
+)
+from app.pqwa_csv import load_pqwa  # noqa: E402
+from app.questionnaire import load_questionnaire  # noqa: E402
+from benchmarks.asgi import load, percentiles  # noqa: E402
+
+
+def summarize(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    """Latency percentiles and mean (ms), and number of calls per second."""
+    return {
+        **percentiles(latencies),
+        "mean": 1000 * statistics.mean(latencies),
+        "per_second": len(latencies) / elapsed,
+    }
+
+
+def micro(func: Callable[[], Any], duration: float, max_calls: int) -> Dict[str, float]:
+    """Call `func` for about `duration` seconds, time each call."""
+    func()  # warm up
+    latencies: List[float] = []
+    start = time.perf_counter()
+    while len(latencies) < max_calls and (
+        len(latencies) < 5 or time.perf_counter() - start < duration
+    ):
+        call_start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - call_start)
+    return summarize(latencies, sum(latencies))
+
+
+def micro_benchmarks(duration: float, max_calls: int) -> Dict[str, Dict[str, float]]:
+    questionnaire = questionnaires.default.current
+    scoring_model = questionnaire.scoring_model
+    blank_request = Request({"type": "http", "method": "GET", "headers": []})
+    form_data = {
+        field_name: str(random.choice(list(w2a)))
+        for field_name, w2a in zip(scoring_model.field_names, scoring_model.answers)
+    }
+    key = form_key(questionnaire)
+
+    def parse_and_score():
+        scoring_model.score(scoring_model.parse_form(form_data))
+
+    scores = scoring_model.score(scoring_model.parse_form(form_data)).tolist()
+    profile_scores = sorted(
+        zip(scoring_model.profile_ids, scores), key=lambda ps: ps[1], reverse=True
+    )
+    main_p_ids = [p_id for p_id, s in profile_scores if s == profile_scores[0][1]]
+
+    benchmarks = {
+        "load_pqwa": lambda: load_pqwa(Path(CSV_PQWA), PQWA_NAMES),
+        "load_questionnaire": lambda: load_questionnaire(
+            DEFAULT_QUESTIONNAIRE, Path(JSON_PROFILES), Path(CSV_PQWA), PQWA_NAMES
+        ),
+        "get_questions": lambda: get_questions(blank_request, questionnaire),
+        "render_form": lambda: render_form(questionnaire),
+        "render_cached_form": lambda: form_cache.get_rendered_form(
+            key, lambda: render_form(questionnaire)
+        ).render(order="shuffle"),
+        "get_cached_page": lambda: form_pages.get(
+            key,
+            random.randrange(settings.FORM_ORDERS),
+            lambda: render_page(render_form(questionnaire), 0),
+        ),
+        "parse_and_score": parse_and_score,
+        "render_summary": lambda: render_summary(questionnaire, main_p_ids),
+        "get_cached_summary": lambda: summary_page(
+            questionnaire, profile_scores, main_p_ids
+        ),
+    }
+    return {name: micro(func, duration, max_calls) for name, func in benchmarks.items()}
+
+
+def make_submission(i: int, nb_users: int):
+    """Submission of the form with random answers ; some users submit again."""
+    questionnaire = questionnaires.default.current
+    user = random.randrange(nb_users) if random.random() < 0.1 else i
+    data = {
+        "name": f"User {user}",
+        "email": f"user{user}@example.org",
+        "questionnaire_version": questionnaire.version,
+    }
+    for q_form_id, _, q_choices in questionnaire.list_questions:
+        data[f"{q_form_id}-question"] = str(random.choice(q_choices)[0])
+    headers = [("content-type", "application/x-www-form-urlencoded")]
+    return ("POST", "/", urlencode(data).encode(), headers)
+
+
+async def timed_load(make_request, n: int, concurrency: int) -> Dict[str, float]:
+    start = time.perf_counter()
+    _, latencies = await load(app, make_request, n, concurrency)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+async def load_tests(n: int, concurrency: int) -> Dict[str, Dict[str, float]]:
+    models.Base.metadata.create_all(bind=engine)
+    await app.router.startup()
+
+    def get_form(i):
+        return ("GET", "/")
+
+    def post_form(i):
+        return make_submission(i, n)
+
+    results = {
+        "GET /": await timed_load(get_form, n, concurrency),
+        "POST /": await timed_load(post_form, n, concurrency),
+    }
+    mixed = await asyncio.gather(
+        timed_load(get_form, n, concurrency), timed_load(post_form, n, concurrency)
+    )
+    results["GET / with POST /"], results["POST / with GET /"] = mixed
+    await app.router.shutdown()
+    return results
+
+
+def git_commit() -> Optional[str]:
+    """Current commit of the repository, if it is available."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_DIR,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline: Dict, results: Dict) -> None:
+    """Print the change of the median latency and throughput of each benchmark."""
+    print(f"{'benchmark':32} {'p50 (ms)':>22} {'per second':>24}")
+    for group in ("micro", "load"):
+        for name, new in results[group].items():
+            old = baseline.get(group, {}).get(name)
+            if old is None:
+                continue
+            print(
+                f"{name:32} {old['p50']:8.3f} -> {new['p50']:8.3f} "
+                f"({100 * (new['p50'] / old['p50'] - 1):+5.1f}%) "
+                f"{old['per_second']:9.1f} -> {new['per_second']:9.1f} "
+                f"({100 * (new['per_second'] / old['per_second'] - 1):+5.1f}%)"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=1.0,
+        help="duration of each micro-benchmark, in seconds",
+    )
+    parser.add_argument(
+        "--max-calls", type=int, default=10000, help="calls per micro-benchmark"
+    )
+    parser.add_argument(
+        "--n", type=int, default=500, help="number of requests of each load test"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=10, help="concurrent clients"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="seed of the random answers"
+    )
+    parser.add_argument("--output", help="JSON file of the results, default stdout")
+    parser.add_argument("--compare", help="JSON file of previous results")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    try:
+        results = {
+            "meta": {
+                "commit": git_commit(),
+                "date": datetime.datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "args": {
+                    name: value
+                    for name, value in vars(args).items()
+                    if name not in ("output", "compare")
+                },
+            },
+            "micro": micro_benchmarks(args.duration, args.max_calls),
+            "load": asyncio.run(load_tests(args.n, args.concurrency)),
+        }
+    finally:
+        shutil.rmtree(TMP_DIR)
+    if args.output:
+        with open(CWD / args.output, "w") as f_out:
+            json.dump(results, f_out, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(CWD / args.compare) as f_baseline:
+            compare(json.load(f_baseline), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -18,9 +18,13 @@ fileConfig(config.config_file_name)
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
 from app.db import Base  # noqa
+from app.config import settings  # noqa
 
 target_metadata = Base.metadata  #noqa
 
+# the database is configured by the settings of the app (environment variables)
+config.set_main_option("sqlalchemy.url", settings.database_url)
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -1,7 +1,14 @@
 #! /usr/bin/env bash
 
+# Remove the metrics of the previous run, shared by the workers
+if [ -n "$prometheus_multiproc_dir" ]; then
+    rm -rf "$prometheus_multiproc_dir"
+    mkdir -p "$prometheus_multiproc_dir"
+fi
 # Let the DB start
 sleep 10;
 # Run migrations
 export PYTHONPATH=$PYTHONPATH:.  # dirty
-alembic upgrade head
\ No newline at end of file
+alembic upgrade head
+# Create initial data in DB
+python -m app.initial_data
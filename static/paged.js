@@ -0,0 +1,117 @@
+// Paged form : shows the questions one by one, keeps the answers in the
+// browser, and posts them all at once with the progress token of the page.
+(function () {
+  "use strict";
+  var root = document.getElementById("paged-form");
+  var progress = document.getElementById("paged-progress");
+  var container = document.getElementById("paged-question");
+  var previous = document.getElementById("paged-previous");
+  var next = document.getElementById("paged-next");
+  var form = document.getElementById("paged-submit");
+  var storageKey = "dataposition-paged:" + root.dataset.token;
+  var questions = [];
+  // order of the questions, answers (weight by question id) and position
+  var state = { order: null, answers: {}, position: 0 };
+
+  function load() {
+    try {
+      var saved = JSON.parse(window.localStorage.getItem(storageKey));
+      if (saved) {
+        state = saved;
+      }
+    } catch (e) {}
+  }
+
+  function save() {
+    try {
+      window.localStorage.setItem(storageKey, JSON.stringify(state));
+    } catch (e) {}
+  }
+
+  function shuffledIndices(n) {
+    var indices = [];
+    for (var i = 0; i < n; i++) {
+      indices.push(i);
+    }
+    for (var j = n - 1; j > 0; j--) {
+      var k = Math.floor(Math.random() * (j + 1));
+      var tmp = indices[j];
+      indices[j] = indices[k];
+      indices[k] = tmp;
+    }
+    return indices;
+  }
+
+  function render() {
+    var done = state.position >= questions.length;
+    progress.value = state.position;
+    container.hidden = done;
+    next.hidden = done;
+    form.hidden = !done;
+    previous.disabled = state.position === 0;
+    if (done) {
+      return;
+    }
+    var question = questions[state.order[state.position]];
+    var fieldset = document.createElement("fieldset");
+    var legend = document.createElement("legend");
+    legend.className = "profile-" + question.id.split("-")[0];
+    legend.textContent = question.label;
+    fieldset.appendChild(legend);
+    question.choices.forEach(function (choice) {
+      var label = document.createElement("label");
+      var input = document.createElement("input");
+      input.type = "radio";
+      input.name = "paged-answer";
+      input.value = choice[0];
+      input.checked = state.answers[question.id] === choice[0];
+      input.addEventListener("change", function () {
+        state.answers[question.id] = choice[0];
+        next.disabled = false;
+        save();
+      });
+      label.appendChild(input);
+      label.appendChild(document.createTextNode(" " + choice[1]));
+      fieldset.appendChild(label);
+      fieldset.appendChild(document.createElement("br"));
+    });
+    container.innerHTML = "";
+    container.appendChild(fieldset);
+    next.disabled = !(question.id in state.answers);
+  }
+
+  previous.addEventListener("click", function () {
+    state.position = Math.max(0, state.position - 1);
+    save();
+    render();
+  });
+  next.addEventListener("click", function () {
+    state.position += 1;
+    save();
+    render();
+  });
+  form.addEventListener("submit", function () {
+    questions.forEach(function (question) {
+      var input = document.createElement("input");
+      input.type = "hidden";
+      input.name = question.id + "-question";
+      input.value = state.answers[question.id];
+      form.appendChild(input);
+    });
+    window.localStorage.removeItem(storageKey);
+  });
+
+  load();
+  fetch(root.dataset.questionsUrl)
+    .then(function (response) {
+      return response.json();
+    })
+    .then(function (payload) {
+      questions = payload.questions;
+      if (!state.order || state.order.length !== questions.length) {
+        state = { order: shuffledIndices(questions.length), answers: {}, position: 0 };
+      }
+      progress.max = questions.length;
+      render();
+    });
+})();
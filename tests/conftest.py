@@ -0,0 +1,75 @@
+"""Fixtures of the tests : the app runs against a temporary SQLite database.
+
+The working directory (for the data files and the templates) and the path of
+the database are set before the app is imported.
+"""
+import os
+from pathlib import Path
+import shutil
+import sys
+import tempfile
+from typing import Iterator, List
+
+import pytest
+
+REPO_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_DIR))
+
+TMP_DIR = tempfile.mkdtemp()
+os.chdir(REPO_DIR)
+os.environ["SQLITE_PATH"] = str(Path(TMP_DIR) / "test.db")
+os.environ["QUESTIONNAIRE_WATCH_INTERVAL"] = "0"
+
+from alembic import command  # noqa: E402
+from alembic.config import Config  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from starlette.testclient import TestClient  # noqa: E402
+
+from app.db import session  # noqa: E402
+from app.main import app  # noqa: E402
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(TMP_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def migrated_db() -> str:
+    """Path of the temporary database, migrated with Alembic."""
+    config = Config(str(REPO_DIR / "alembic.ini"))
+    config.set_main_option("script_location", str(REPO_DIR / "migrations"))
+    command.upgrade(config, "head")
+    return os.environ["SQLITE_PATH"]
+
+
+@pytest.fixture(scope="session")
+def client(migrated_db: str) -> Iterator[TestClient]:
+    """Client of the app, started on the migrated database."""
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def statements(monkeypatch) -> Iterator[List[str]]:
+    """SQL statements run by SQLite during the test, with their parameters.
+
+    Traced on the connections opened during the test, by the engine and by
+    `databases` (that opens a new connection for each use).
+    """
+    recorded: List[str] = []
+
+    def trace_sync(dbapi_connection, connection_record):
+        dbapi_connection.set_trace_callback(recorded.append)
+
+    init_connection = session.SQLiteConnection.__init__
+
+    def trace_async(self, *args, **kwargs):
+        init_connection(self, *args, **kwargs)
+        self.set_trace_callback(recorded.append)
+
+    event.listen(session.engine, "connect", trace_sync)
+    monkeypatch.setattr(session.SQLiteConnection, "__init__", trace_async)
+    try:
+        yield recorded
+    finally:
+        event.remove(session.engine, "connect", trace_sync)
@@ -0,0 +1,37 @@
+"""`GET /export/{table}.csv` requires the admin token, and reads bounded pages."""
+import pytest
+
+from app.config import settings
+
+TOKEN = "export-token"
+
+
+@pytest.fixture
+def admin(monkeypatch):
+    """Headers of the admin requests."""
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", TOKEN)
+    return {"Authorization": f"Bearer {TOKEN}"}
+
+
+def test_disabled_without_token(client):
+    response = client.get("/export/users.csv")
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize("headers", [{}, {"Authorization": "Bearer wrong"}])
+def test_invalid_token(client, admin, headers):
+    response = client.get("/export/users.csv", headers=headers)
+    assert response.status_code == 403
+    assert "@" not in response.text
+
+
+@pytest.mark.parametrize("page_size", [-1, 0, settings.EXPORT_MAX_PAGE_SIZE + 1])
+def test_page_size_out_of_bounds(client, admin, page_size):
+    response = client.get(f"/export/users.csv?page_size={page_size}", headers=admin)
+    assert response.status_code == 422
+
+
+def test_page_size(client, admin):
+    response = client.get("/export/users.csv?page_size=1", headers=admin)
+    assert response.status_code == 200
+    assert response.text.startswith("user_id,")
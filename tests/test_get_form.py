@@ -0,0 +1,16 @@
+"""The form page, `GET /`, is served without any database query."""
+from app.config import settings
+
+
+def test_get_form_runs_no_queries(client, statements):
+    # a random order, then each order of the pool
+    pages = [client.get("/")]
+    pages += [client.get(f"/?order={seed}") for seed in range(settings.FORM_ORDERS)]
+    assert all(page.status_code == 200 for page in pages)
+    assert statements == []
+
+
+def test_statements_are_traced(client, statements):
+    # the tracing of the test above sees the queries of the app
+    assert client.get("/stats").status_code == 200
+    assert statements
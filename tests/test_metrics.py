@@ -0,0 +1,29 @@
+"""The queries of an instrumented engine are timed, also after a failed query."""
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+
+from app import metrics
+
+
+def nb_queries(operation: str) -> float:
+    return (
+        REGISTRY.get_sample_value(
+            "dataposition_db_query_duration_seconds_count", {"operation": operation}
+        )
+        or 0
+    )
+
+
+def test_failed_query():
+    engine = create_engine("sqlite://")
+    metrics.instrument_engine(engine)
+    before = nb_queries("select")
+    with engine.connect() as conn:
+        with pytest.raises(OperationalError):
+            conn.execute("SELECT * FROM missing_table")
+        assert conn.execute("SELECT 1").scalar() == 1
+        assert "query_start" not in conn.info
+    assert nb_queries("select") == before + 1
+    engine.dispose()
@@ -0,0 +1,17 @@
+"""The pages of `GET /users/` and `GET /answers/` have a bounded size."""
+import pytest
+
+from app.config import settings
+
+
+@pytest.mark.parametrize("path", ["/users/", "/answers/"])
+@pytest.mark.parametrize("limit", [-1, 0, settings.API_MAX_PAGE_SIZE + 1])
+def test_limit_out_of_bounds(client, path, limit):
+    assert client.get(f"{path}?limit={limit}").status_code == 422
+
+
+@pytest.mark.parametrize("path", ["/users/", "/answers/"])
+def test_limit(client, path):
+    response = client.get(f"{path}?limit={settings.API_MAX_PAGE_SIZE}")
+    assert response.status_code == 200
+    assert len(response.json()) <= settings.API_MAX_PAGE_SIZE
@@ -0,0 +1,141 @@
+"""No query of the app reads a whole table.
+
+Each SQL statement run by the routes (`app.crud_async`) is checked with
+`EXPLAIN QUERY PLAN`, against the database migrated with Alembic. A full scan
+fails the test, except :
+- the tables of `SMALL_TABLES`, read whole on purpose,
+- pages (`LIMIT`) read in the order of an index, that stop after the page.
+"""
+import asyncio
+import random
+import re
+import sqlite3
+from typing import Dict, List
+
+import pytest
+
+from app import pagination
+from app.main import prepare_questionnaire, questionnaires
+
+# tables with a handful of rows
+SMALL_TABLES = {"profiles"}
+# statements that have a plan
+EXPLAINED = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+
+def submission(user: int) -> Dict[str, str]:
+    """Data of the form with random answers."""
+    questionnaire = questionnaires.default.current
+    data = {
+        "name": f"User {user}",
+        "email": f"user{user}@example.org",
+        "questionnaire_version": questionnaire.version,
+    }
+    for q_form_id, _, q_choices in questionnaire.list_questions:
+        data[f"{q_form_id}-question"] = str(random.choice(q_choices)[0])
+    return data
+
+
+def full_scans(connection: sqlite3.Connection, statement: str) -> List[str]:
+    """Steps of the plan of a statement that read a whole table."""
+    plan = [
+        detail
+        for _, _, _, detail in connection.execute(f"EXPLAIN QUERY PLAN {statement}")
+    ]
+    # a page read in the order of an index stops after the page
+    is_page = re.search(r"\bLIMIT\b", statement, re.I) and not any(
+        "TEMP B-TREE" in detail for detail in plan
+    )
+    scans = []
+    for detail in plan:
+        # rows of a VALUES clause are not read from a table
+        match = re.match(r"SCAN (?:TABLE )?(\w+)", detail)
+        if match is None or "CONSTANT ROW" in detail:
+            continue
+        if match.group(1) in SMALL_TABLES or is_page:
+            continue
+        scans.append(detail)
+    return scans
+
+
+def shape(statement: str) -> str:
+    """Statement without its literal values."""
+    return re.sub(r"'(?:[^']|'')*'|\b\d+\b", "?", statement)
+
+
+@pytest.fixture
+def check_plans(migrated_db, statements):
+    """Check the plans of the statements recorded during the test."""
+    yield
+    explained = {
+        shape(statement): statement
+        for statement in statements
+        if statement.lstrip().upper().startswith(EXPLAINED)
+    }
+    assert explained, "no statement was recorded"
+    connection = sqlite3.connect(migrated_db)
+    try:
+        failures = {
+            statement[:300]: scans
+            for statement in explained.values()
+            for scans in [full_scans(connection, statement)]
+            if scans
+        }
+    finally:
+        connection.close()
+    assert failures == {}
+
+
+def test_post_form(client, check_plans):
+    # new users, then resubmissions
+    random.seed(0)
+    for user in list(range(20)) * 2:
+        response = client.post("/", data=submission(user))
+        response.raise_for_status()
+
+
+def test_routes(client, check_plans):
+    # the queries of `crud_async` run by each route, and by the startup
+    questionnaire = questionnaires.default.current
+    user = client.post("/users/", json={"email": "crud@example.org", "name": "Crud"})
+    user.raise_for_status()
+    user_id = user.json()["id"]
+    # already registered
+    assert client.post("/users/", json=user.json()).status_code == 400
+    p_id, label, choices = questionnaire.scoring_model.question_rows()[0]
+    weight, description = choices[0]
+    client.post(
+        f"/users/{user_id}/answers/",
+        json={
+            "profile_id": p_id,
+            "question": label,
+            "description": description,
+            "weight": weight,
+            "questionnaire": questionnaire.slug,
+        },
+    ).raise_for_status()
+    cursor = pagination.encode_cursor(user_id - 1)
+    for path in (
+        f"/users/{user_id}",
+        "/users/",
+        f"/users/?after={cursor}&limit=10",
+        "/users/?answers=false",
+        "/answers/",
+        f"/answers/?after={cursor}&limit=10",
+    ):
+        client.get(path).raise_for_status()
+    batch = [
+        {
+            "email": email,
+            "name": "Crud",
+            "answers": {
+                q_form_id: random.choice(q_choices)[0]
+                for q_form_id, _, q_choices in questionnaire.list_questions
+            },
+        }
+        for email in ("crud@example.org", "crud2@example.org")
+    ]
+    client.post("/api/submissions:batch", json=batch).raise_for_status()
+    client.get("/stats").raise_for_status()
+    # the same loop as the client
+    asyncio.get_event_loop().run_until_complete(prepare_questionnaire(questionnaire))
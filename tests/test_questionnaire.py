@@ -0,0 +1,37 @@
+"""The catalog of questionnaires reports every version of an evicted questionnaire."""
+import asyncio
+import shutil
+
+from app.config import CSV_PQWA, JSON_PROFILES, PQWA_NAMES
+from app.questionnaire import QuestionnaireCatalog
+
+
+def test_evict_previous_version(tmp_path):
+    for slug in ("first", "second"):
+        (tmp_path / slug).mkdir()
+        shutil.copy(JSON_PROFILES, tmp_path / slug / "profiles.json")
+        shutil.copy(CSV_PQWA, tmp_path / slug / "pqwa.csv")
+    catalog = QuestionnaireCatalog(
+        "default", JSON_PROFILES, CSV_PQWA, PQWA_NAMES, tmp_path, max_size=1
+    )
+    evicted = []
+    catalog.on_evict(lambda questionnaire: evicted.append(questionnaire.version))
+
+    async def run():
+        registry = await catalog.get("first")
+        # a new version, with another text for an answer, swapped in
+        fn_pqwa = tmp_path / "first" / "pqwa.csv"
+        header, first, rest = fn_pqwa.read_text().split("\n", 2)
+        fn_pqwa.write_text("\n".join([header, f"Autre {first}", rest]))
+        assert await registry.reload()
+        versions = [registry.current.version, registry.previous.version]
+        await catalog.get("second")
+        return versions
+
+    # not `asyncio.run`, that unsets the event loop of the app
+    loop = asyncio.new_event_loop()
+    try:
+        versions = loop.run_until_complete(run())
+    finally:
+        loop.close()
+    assert evicted == versions
@@ -0,0 +1,196 @@
+"""Re-scoring updates the answers, and the statistics with them."""
+import asyncio
+import random
+import sqlite3
+from collections import Counter
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pytest
+from sqlalchemy import bindparam, select
+
+from app import crud, crud_async, models, rescore as rescore_module
+from app.db.session import database, engine
+from app.main import questionnaires
+from app.rescore import rescore
+
+
+def aggregates(conn, questionnaire: str) -> Dict[str, Dict[Tuple, int]]:
+    """Aggregates of the statistics, in the tables."""
+    result = {}
+    for table in (models.StatsProfile, models.StatsScore, models.StatsChoice):
+        table = table.__table__
+        key_columns = list(table.primary_key.columns)
+        query = select(key_columns + [table.c.nb]).where(table.c.nb != 0)
+        if "questionnaire" in table.c:
+            query = query.where(table.c.questionnaire == questionnaire)
+        result[table.name] = {tuple(row[:-1]): row[-1] for row in conn.execute(query)}
+    return result
+
+
+def recount(conn, questionnaire: str) -> Dict[str, Dict[Tuple, int]]:
+    """Aggregates of the statistics, counted from the stored answers."""
+    answers = models.Answer.__table__
+    by_author: Dict[int, list] = {}
+    for row in conn.execute(
+        select(
+            [
+                answers.c.author_id,
+                answers.c.profile_id,
+                answers.c.weight,
+                answers.c.choice_id,
+            ]
+        ).where(answers.c.questionnaire == questionnaire)
+    ):
+        by_author.setdefault(row["author_id"], []).append(dict(row))
+    totals: Dict[str, Counter] = {}
+    for author_answers in by_author.values():
+        for table, _, deltas in crud.stats_deltas(questionnaire, author_answers):
+            totals.setdefault(table.name, Counter()).update(deltas)
+    return {
+        name: {key: nb for key, nb in total.items() if nb}
+        for name, total in totals.items()
+    }
+
+
+def make_stale(client, seed: int) -> List[Dict]:
+    """Submissions, then weights and statistics of a previous version of the PQWA file.
+
+    Returns
+    -------
+    stale
+        Answers with a stale weight : another weight of the question, with the
+        same answer text.
+    """
+    questionnaire = questionnaires.default.current
+    scoring_model = questionnaire.scoring_model
+    random.seed(seed)
+    for user in range(30):
+        data = {
+            "name": f"Rescored {user}",
+            "email": f"rescored{user}@example.org",
+            "questionnaire_version": questionnaire.version,
+        }
+        for q_form_id, _, q_choices in questionnaire.list_questions:
+            data[f"{q_form_id}-question"] = str(random.choice(q_choices)[0])
+        client.post("/", data=data).raise_for_status()
+    answers = models.Answer.__table__
+    q_id2idx = {q_id: q_idx for q_idx, q_id in enumerate(scoring_model.db_question_ids)}
+    with engine.begin() as conn:
+        # weights of a previous version of the PQWA file : another weight of
+        # the question, with the same answer text, and the statistics counted
+        # with them
+        rows = conn.execute(
+            select([answers.c.id, answers.c.question_id, answers.c.weight])
+        ).fetchall()
+        stale = [
+            {"a_id": a_id, "weight": weight + 10}
+            for a_id, q_id, weight in rows
+            if q_id in q_id2idx and random.random() < 0.3
+        ]
+        conn.execute(
+            answers.update()
+            .where(answers.c.id == bindparam("a_id"))
+            .values(weight=bindparam("weight")),
+            stale,
+        )
+        for table in (models.StatsProfile, models.StatsScore, models.StatsChoice):
+            conn.execute(table.__table__.delete())
+        for name, counts in recount(conn, questionnaire.slug).items():
+            table = models.Base.metadata.tables[name]
+            key_names = [column.name for column in table.primary_key.columns]
+            conn.execute(
+                table.insert(),
+                [dict(zip(key_names, key), nb=nb) for key, nb in counts.items()],
+            )
+    return stale
+
+
+@pytest.mark.parametrize("chunk_size", [5, 100])
+def test_rescore_updates_statistics(client, chunk_size):
+    questionnaire = questionnaires.default.current
+    answers = models.Answer.__table__
+    stale = make_stale(client, chunk_size)
+
+    stats = rescore(questionnaire.slug, chunk_size=chunk_size)
+
+    assert stats["updated_answers"] == len(stale)
+    with engine.connect() as conn:
+        assert aggregates(conn, questionnaire.slug) == recount(conn, questionnaire.slug)
+        assert not any(
+            weight >= 10 for weight, in conn.execute(select([answers.c.weight]))
+        )
+    assert client.get("/stats").status_code == 200
+
+
+def test_rescore_commits_each_chunk(client, monkeypatch):
+    questionnaire = questionnaires.default.current
+    make_stale(client, 1)
+    read_answer_chunk = rescore_module.read_answer_chunk
+    other = sqlite3.connect(engine.url.database, timeout=0)
+    nb_chunks = 0
+
+    def checked_read(conn, questionnaire, after, chunk_size):
+        nonlocal nb_chunks
+        nb_chunks += 1
+        # the chunk is read in a write transaction
+        with pytest.raises(sqlite3.OperationalError, match="locked"):
+            other.execute("BEGIN IMMEDIATE")
+        # the previous chunks are committed
+        (max_weight,) = other.execute(
+            "SELECT max(weight) FROM answers WHERE author_id <= ?", (after,)
+        ).fetchone()
+        assert after == 0 or max_weight < 10
+        return read_answer_chunk(conn, questionnaire, after, chunk_size)
+
+    monkeypatch.setattr(rescore_module, "read_answer_chunk", checked_read)
+    try:
+        rescore(questionnaire.slug, chunk_size=20)
+    finally:
+        other.close()
+    assert nb_chunks > 2
+
+
+def test_rescore_after_another_questionnaire(client):
+    questionnaire = questionnaires.default.current
+    scoring_model = questionnaire.scoring_model
+    random.seed(2)
+    weights = np.array([random.choice(list(w2a)) for w2a in scoring_model.answers])
+    answers_values = scoring_model.prep_answers(weights)
+    loop = asyncio.get_event_loop()
+    # a result of a previous version, then a submission to another questionnaire
+    for slug, version in [(questionnaire.slug, "previous"), ("other", "1")]:
+        loop.run_until_complete(
+            crud_async.save_submission(
+                database,
+                "two-questionnaires@example.org",
+                "Two questionnaires",
+                answers_values,
+                "Stale",
+                questionnaire=slug,
+                questionnaire_version=version,
+            )
+        )
+
+    rescore(questionnaire.slug)
+
+    users = models.User.__table__
+    results = models.Result.__table__
+    with engine.connect() as conn:
+        user = conn.execute(
+            users.select().where(users.c.email == "two-questionnaires@example.org")
+        ).fetchone()
+        user_results = {
+            row["questionnaire"]: (
+                row["questionnaire_version"],
+                row["selected_profile"],
+            )
+            for row in conn.execute(
+                results.select().where(results.c.user_id == user["id"])
+            )
+        }
+    # the latest submission is untouched
+    assert (user["questionnaire"], user["selected_profile"]) == ("other", "Stale")
+    assert user_results["other"] == ("1", "Stale")
+    assert user_results[questionnaire.slug][0] == questionnaire.version
+    assert user_results[questionnaire.slug][1] != "Stale"
@@ -0,0 +1,67 @@
+"""A submission that cannot be saved does not block the queue."""
+import asyncio
+import sqlite3
+
+from app import submission_queue
+from app.submission_queue import SubmissionQueue
+
+
+def test_failing_submission_is_moved_to_failed(tmp_path):
+    queue = SubmissionQueue(str(tmp_path / "queue.db"), max_attempts=3)
+    for i in range(5):
+        queue.put({"email": f"user{i}@example.org"})
+    saved = []
+
+    async def save(batch):
+        if any(submission["email"] == "user2@example.org" for submission in batch):
+            raise ValueError("invalid submission")
+        saved.extend(submission["email"] for submission in batch)
+
+    async def run():
+        errors = 0
+        while len(queue):
+            try:
+                await submission_queue.flush(queue, save, batch_size=10)
+            except ValueError:
+                errors += 1
+        return errors
+
+    # not `asyncio.run`, that unsets the event loop of the app
+    loop = asyncio.new_event_loop()
+    try:
+        # the other submissions are saved at the first attempt
+        assert loop.run_until_complete(run()) == 3
+        assert sorted(saved) == [f"user{i}@example.org" for i in (0, 1, 3, 4)]
+        assert queue.count_failed() == 1
+        (data, attempts, error), *_ = queue._connection.execute(
+            "SELECT data, attempts, error FROM failed_submissions"
+        )
+        assert "user2@example.org" in data
+        assert attempts == 3
+        assert error == "ValueError: invalid submission"
+    finally:
+        loop.close()
+        queue.close()
+
+
+def test_queue_of_a_previous_version(tmp_path):
+    path = str(tmp_path / "queue.db")
+    connection = sqlite3.connect(path)
+    connection.execute(
+        """CREATE TABLE submissions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            data TEXT NOT NULL,
+            claimed_by TEXT,
+            claimed_at REAL
+        )"""
+    )
+    connection.execute("""INSERT INTO submissions (data) VALUES ('{"a": 1}')""")
+    connection.commit()
+    connection.close()
+    queue = SubmissionQueue(path)
+    try:
+        ((row_id, submission),) = queue.claim(10)
+        assert submission == {"a": 1}
+        assert not queue.fail(row_id, "error")
+    finally:
+        queue.close()